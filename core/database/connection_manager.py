@@ -36,6 +36,10 @@ class DatabaseConnectionManager:
         conn.execute("PRAGMA foreign_keys = ON;")
         conn.execute("PRAGMA journal_mode = WAL;")  # 使用WAL模式提高并发性能
         conn.execute("PRAGMA synchronous = NORMAL;")  # 平衡性能和安全
+        # 每个仓储、每个线程各持有一条连接：页缓存取适中的 32MB，热页读取交给共享的 mmap
+        conn.execute("PRAGMA cache_size = -32768;")
+        conn.execute("PRAGMA mmap_size = 268435456;")
+        conn.execute("PRAGMA temp_store = MEMORY;")
         return conn
     
     @contextmanager
@@ -0,0 +1,49 @@
+"""
+迁移041：添加科考数据表
+科考数据从 JSON 文件迁入数据库，每个科考一行，修改时只写对应的行
+"""
+
+from astrbot.api import logger
+
+def up(cursor):
+    """创建科考数据表"""
+
+    try:
+        logger.info("[迁移041] 创建科考数据表")
+
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS expeditions (
+                expedition_id TEXT PRIMARY KEY,
+                status TEXT NOT NULL DEFAULT 'active',
+                end_ts INTEGER,
+                data TEXT NOT NULL,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+
+        # 启动时按状态查询进行中科考的截止时间
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_expeditions_status_end
+            ON expeditions(status, end_ts)
+        """)
+
+        logger.info("[迁移041] 科考数据表创建成功")
+
+    except Exception as e:
+        logger.error(f"[迁移041] 迁移失败: {e}")
+        raise
+
+def down(cursor):
+    """回滚：删除科考数据表"""
+
+    try:
+        logger.info("[迁移041-回滚] 删除科考数据表")
+
+        cursor.execute("DROP INDEX IF EXISTS idx_expeditions_status_end")
+        cursor.execute("DROP TABLE IF EXISTS expeditions")
+
+        logger.info("[迁移041-回滚] 科考数据表删除成功")
+
+    except Exception as e:
+        logger.error(f"[迁移041-回滚] 回滚失败: {e}")
+        raise
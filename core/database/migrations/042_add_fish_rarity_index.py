@@ -0,0 +1,37 @@
+"""
+迁移042：为鱼类模板的稀有度添加索引
+按稀有度筛选鱼塘/水族箱时通过 fish 表过滤稀有度，get_fishes_by_rarity 也直接走索引
+"""
+
+from astrbot.api import logger
+
+def up(cursor):
+    """创建 fish(rarity, fish_id) 索引"""
+
+    try:
+        logger.info("[迁移042] 创建鱼类稀有度索引")
+
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_fish_rarity
+            ON fish(rarity, fish_id)
+        """)
+
+        logger.info("[迁移042] 鱼类稀有度索引创建成功")
+
+    except Exception as e:
+        logger.error(f"[迁移042] 迁移失败: {e}")
+        raise
+
+def down(cursor):
+    """回滚：删除鱼类稀有度索引"""
+
+    try:
+        logger.info("[迁移042-回滚] 删除鱼类稀有度索引")
+
+        cursor.execute("DROP INDEX IF EXISTS idx_fish_rarity")
+
+        logger.info("[迁移042-回滚] 鱼类稀有度索引删除成功")
+
+    except Exception as e:
+        logger.error(f"[迁移042-回滚] 回滚失败: {e}")
+        raise
@@ -0,0 +1,37 @@
+"""
+迁移043：为市场商品添加 (item_type, market_id) 复合索引
+WebUI 市场列表按 market_id 倒序游标分页，按类型筛选时可直接沿索引有序读取，无需排序
+"""
+
+from astrbot.api import logger
+
+def up(cursor):
+    """创建 market(item_type, market_id) 索引"""
+
+    try:
+        logger.info("[迁移043] 创建市场类型游标索引")
+
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_market_type_id
+            ON market(item_type, market_id)
+        """)
+
+        logger.info("[迁移043] 市场类型游标索引创建成功")
+
+    except Exception as e:
+        logger.error(f"[迁移043] 迁移失败: {e}")
+        raise
+
+def down(cursor):
+    """回滚：删除市场类型游标索引"""
+
+    try:
+        logger.info("[迁移043-回滚] 删除市场类型游标索引")
+
+        cursor.execute("DROP INDEX IF EXISTS idx_market_type_id")
+
+        logger.info("[迁移043-回滚] 市场类型游标索引删除成功")
+
+    except Exception as e:
+        logger.error(f"[迁移043-回滚] 回滚失败: {e}")
+        raise
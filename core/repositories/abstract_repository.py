@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 from abc import ABC, abstractmethod
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
 from datetime import date, datetime
 
 # 从领域模型导入所有需要的实体
@@ -14,6 +14,29 @@ from ..domain.models import (
     Commodity, Exchange, UserCommodity  # 新增交易所模型导入
 )
 
+# ---------------------------------
+# 仓储层异常 (Repository Errors)
+# ---------------------------------
+
+class RepoError(Exception):
+    """仓储层异常基类"""
+    pass
+
+
+class RepoNotFound(RepoError):
+    """目标记录不存在"""
+    pass
+
+
+class RepoConflict(RepoError):
+    """写入与现有数据冲突（如违反约束）"""
+    pass
+
+
+class RepoTransient(RepoError):
+    """暂时性错误（如数据库被锁定），可稍后重试"""
+    pass
+
 # 定义用户成就进度的数据结构
 UserAchievementProgress = Dict[int, Dict[str, Any]] # {achievement_id: {progress: X, completed_at: Y}}
 
@@ -22,6 +45,9 @@ class AbstractUserRepository(ABC):
     # 根据ID获取用户
     @abstractmethod
     def get_by_id(self, user_id: str) -> Optional[User]: pass
+    # 根据ID批量获取用户（不存在的ID不会出现在结果中）
+    @abstractmethod
+    def get_by_ids(self, user_ids: List[str]) -> Dict[str, User]: pass
     # 检查用户是否存在
     @abstractmethod
     def check_exists(self, user_id: str) -> bool: pass
@@ -31,6 +57,9 @@ class AbstractUserRepository(ABC):
     # 更新用户信息
     @abstractmethod
     def update(self, user: User) -> None: pass
+    # 在一个事务中批量更新用户信息
+    @abstractmethod
+    def update_many(self, users: List[User]) -> None: pass
     # 获取所有用户ID
     @abstractmethod
     def get_all_user_ids(self, auto_fishing_only: bool = False) -> List[str]: pass
@@ -56,6 +85,16 @@ class AbstractUserRepository(ABC):
         """按总重量获取排行榜用户列表。"""
         raise NotImplementedError
 
+    @abstractmethod
+    def get_leaderboard_rows(self, order_by_column: str, limit: int) -> List[Dict[str, Any]]:
+        """按指定列获取排行榜，只返回排行榜需要的字段。"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_profile_row(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """获取用户资料展示所需的字段，用户不存在时返回 None。"""
+        raise NotImplementedError
+
     # 获取资产超过阈值的用户列表
     @abstractmethod
     def get_high_value_users(self, threshold: int) -> List[User]: pass
@@ -74,12 +113,20 @@ class AbstractUserRepository(ABC):
     # 删除用户
     @abstractmethod
     def delete_user(self, user_id: str) -> bool: pass
+    # 原子地扣除开户费并开通交易所账户
+    # 返回 (结果, 金币): 结果为 "ok" / "poor" / "already"，金币为操作后的余额
+    # 用户不存在时抛出 RepoNotFound，数据库暂时不可用时抛出 RepoTransient
+    @abstractmethod
+    def try_open_exchange_account(self, user_id: str, fee: int) -> Tuple[str, int]: pass
 
 class AbstractItemTemplateRepository(ABC):
     """物品模板数据仓储接口"""
     # 获取鱼类模板
     @abstractmethod
     def get_fish_by_id(self, fish_id: int) -> Optional[Fish]: pass
+    # 批量获取鱼类模板
+    @abstractmethod
+    def get_fishes_by_ids(self, fish_ids: List[int]) -> Dict[int, Fish]: pass
     # 获取所有鱼类模板
     @abstractmethod
     def get_all_fish(self) -> List[Fish]: pass
@@ -182,12 +229,24 @@ class AbstractInventoryRepository(ABC):
     # 获取用户的鱼类库存
     @abstractmethod
     def get_fish_inventory(self, user_id: str) -> List[UserFishInventoryItem]: pass
+    # 获取用户鱼塘中指定稀有度的鱼
+    @abstractmethod
+    def get_fish_inventory_by_rarity(self, user_id: str, rarity: int) -> List[UserFishInventoryItem]: pass
+    # 分页获取用户某类物品（fish/rod/bait/accessory/item）的元组行，不构造领域对象；limit 为 -1 时取全部
+    @abstractmethod
+    def get_inventory_rows(self, user_id: str, category: str, limit: int, offset: int = 0) -> List[Tuple]: pass
+    # 一次查询获取用户背包各类物品的条目数（fish/rod/bait/accessory/item）
+    @abstractmethod
+    def get_inventory_counts(self, user_id: str) -> Dict[str, int]: pass
     # 获取用户鱼类库存的总价值
     @abstractmethod
     def get_fish_inventory_value(self, user_id: str, rarity: Optional[int] = None) -> int: pass
     # 向用户鱼类库存添加鱼
     @abstractmethod
     def add_fish_to_inventory(self, user_id: str, fish_id: int, quantity: int = 1, quality_level: int = 0) -> None: pass
+    # 批量向用户鱼类库存添加鱼 {fish_id: 数量}
+    @abstractmethod
+    def add_fishes_to_inventory(self, user_id: str, fish_counts: Dict[int, int], quality_level: int = 0) -> None: pass
     # 清空用户鱼类库存
     @abstractmethod
     def clear_fish_inventory(self, user_id: str, rarity: Optional[int] = None) -> None: pass
@@ -199,6 +258,9 @@ class AbstractInventoryRepository(ABC):
     # 获取用户水族箱中的鱼
     @abstractmethod
     def get_aquarium_inventory(self, user_id: str) -> List[UserAquariumItem]: pass
+    # 获取用户水族箱中指定稀有度的鱼
+    @abstractmethod
+    def get_aquarium_inventory_by_rarity(self, user_id: str, rarity: int) -> List[UserAquariumItem]: pass
     # 获取用户水族箱中鱼的总价值
     @abstractmethod
     def get_aquarium_inventory_value(self, user_id: str, rarity: Optional[int] = None) -> int: pass
@@ -211,6 +273,12 @@ class AbstractInventoryRepository(ABC):
     # 更新用户水族箱中鱼的数量
     @abstractmethod
     def update_aquarium_fish_quantity(self, user_id: str, fish_id: int, delta: int, quality_level: int = 0) -> None: pass
+    # 在同一事务中将多种鱼从鱼塘移入水族箱 [(fish_id, quality_level, quantity)]
+    @abstractmethod
+    def move_fishes_to_aquarium(self, user_id: str, moves: List[Tuple[int, int, int]]) -> None: pass
+    # 在同一事务中将多种鱼从水族箱移回鱼塘 [(fish_id, quality_level, quantity)]
+    @abstractmethod
+    def move_fishes_to_pond(self, user_id: str, moves: List[Tuple[int, int, int]]) -> None: pass
     # 清空用户水族箱
     @abstractmethod
     def clear_aquarium_inventory(self, user_id: str, rarity: Optional[int] = None) -> None: pass
@@ -458,6 +526,11 @@ class AbstractMarketRepository(ABC):
     def get_all_listings(self, page: int = None, per_page: int = None, 
                         item_type: str = None, min_price: int = None, 
                         max_price: int = None, search: str = None) -> tuple: pass
+    # 按 market_id 倒序游标分页获取市场商品（market_id < before_id）
+    @abstractmethod
+    def get_listings_page(self, limit: int, before_id: Optional[int] = None,
+                          item_type: str = None, min_price: int = None,
+                          max_price: int = None) -> List[MarketListing]: pass
     # 添加一个市场商品
     @abstractmethod
     def add_listing(self, listing: MarketListing) -> None: pass
@@ -535,6 +608,21 @@ class AbstractLogRepository(ABC):
     def get_user_fish_stat(self, user_id: str, fish_id: int) -> Optional["UserFishStat"]:
         pass
 
+class AbstractExpeditionRepository(ABC):
+    """科考数据仓储接口（每个科考一行，data 为序列化后的 JSON 文本）"""
+    # 获取所有科考（含已结束）: {expedition_id: 科考数据}
+    @abstractmethod
+    def get_all(self) -> Dict[str, Dict[str, Any]]: pass
+    # 获取进行中科考的截止时间: [(expedition_id, end_ts)]
+    @abstractmethod
+    def get_active_end_times(self) -> List[Tuple[str, Optional[int]]]: pass
+    # 在一个事务中批量写入与删除科考: upserts 为 {expedition_id: (status, end_ts, JSON 文本)}
+    @abstractmethod
+    def save_many(self, upserts: Dict[str, Tuple[str, Optional[int], str]], deletes: List[str]) -> None: pass
+    # 在一个事务中写入科考并发放结算奖励: rewards 为 {user_id: (金币, 钻石)}
+    @abstractmethod
+    def save_settlement(self, upserts: Dict[str, Tuple[str, Optional[int], str]], rewards: Dict[str, Tuple[int, int]]) -> None: pass
+
 class AbstractAchievementRepository(ABC):
     """成就数据仓储接口"""
     # 获取所有成就的模板信息
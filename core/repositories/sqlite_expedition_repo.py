@@ -0,0 +1,103 @@
+import json
+import sqlite3
+from typing import Optional, List, Dict, Any, Tuple
+
+from astrbot.api import logger
+
+from .abstract_repository import AbstractExpeditionRepository
+from ..database.connection_manager import DatabaseConnectionManager
+
+
+class SqliteExpeditionRepository(AbstractExpeditionRepository):
+    """科考数据仓储的SQLite实现"""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._connection_manager = DatabaseConnectionManager(db_path)
+
+    def _get_connection(self) -> sqlite3.Connection:
+        """获取一个线程安全的数据库连接。"""
+        return self._connection_manager.get_connection()
+
+    def get_all(self) -> Dict[str, Dict[str, Any]]:
+        result: Dict[str, Dict[str, Any]] = {}
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT expedition_id, data FROM expeditions")
+            for row in cursor.fetchall():
+                try:
+                    data = json.loads(row["data"])
+                except ValueError as e:
+                    logger.error(f"科考 {row['expedition_id']} 数据解析失败，已跳过: {e}")
+                    continue
+                if isinstance(data, dict):
+                    result[row["expedition_id"]] = data
+        return result
+
+    def get_active_end_times(self) -> List[Tuple[str, Optional[int]]]:
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT expedition_id, end_ts FROM expeditions WHERE status = 'active'")
+            return [(row["expedition_id"], row["end_ts"]) for row in cursor.fetchall()]
+
+    def save_many(self, upserts: Dict[str, Tuple[str, Optional[int], str]], deletes: List[str]) -> None:
+        if not upserts and not deletes:
+            return
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                if upserts:
+                    cursor.executemany(
+                        """
+                        INSERT INTO expeditions (expedition_id, status, end_ts, data, updated_at)
+                        VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+                        ON CONFLICT(expedition_id) DO UPDATE SET
+                            status = excluded.status,
+                            end_ts = excluded.end_ts,
+                            data = excluded.data,
+                            updated_at = excluded.updated_at
+                        """,
+                        [(exp_id, status, end_ts, data) for exp_id, (status, end_ts, data) in upserts.items()],
+                    )
+                if deletes:
+                    cursor.executemany(
+                        "DELETE FROM expeditions WHERE expedition_id = ?",
+                        [(exp_id,) for exp_id in deletes],
+                    )
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+    def save_settlement(self, upserts: Dict[str, Tuple[str, Optional[int], str]], rewards: Dict[str, Tuple[int, int]]) -> None:
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.executemany(
+                    """
+                    INSERT INTO expeditions (expedition_id, status, end_ts, data, updated_at)
+                    VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+                    ON CONFLICT(expedition_id) DO UPDATE SET
+                        status = excluded.status,
+                        end_ts = excluded.end_ts,
+                        data = excluded.data,
+                        updated_at = excluded.updated_at
+                    """,
+                    [(exp_id, status, end_ts, data) for exp_id, (status, end_ts, data) in upserts.items()],
+                )
+                if rewards:
+                    # 按增量发放，SET 中的 coins 取更新前的值，同步维护历史最高金币数
+                    cursor.executemany(
+                        """
+                        UPDATE users SET
+                            coins = coins + ?,
+                            premium_currency = premium_currency + ?,
+                            max_coins = MAX(IFNULL(max_coins, 0), coins + ?)
+                        WHERE user_id = ?
+                        """,
+                        [(coins, premium, coins, user_id) for user_id, (coins, premium) in rewards.items()],
+                    )
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
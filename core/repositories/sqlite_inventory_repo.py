@@ -1,6 +1,6 @@
 import sqlite3
 import threading
-from typing import Optional, List, Dict, Any, Set
+from typing import Optional, List, Dict, Any, Set, Tuple
 from datetime import datetime
 import json
 
@@ -19,6 +19,15 @@ class InsufficientFishQuantityError(Exception):
 class SqliteInventoryRepository(AbstractInventoryRepository):
     """用户库存仓储的SQLite实现"""
 
+    # get_inventory_rows 各类物品的查询，按主键排序保证分页稳定
+    _INVENTORY_ROW_QUERIES = {
+        "fish": "SELECT fish_id, quality_level, quantity FROM user_fish_inventory WHERE user_id = ? AND quantity > 0 ORDER BY fish_id, quality_level",
+        "rod": "SELECT rod_id, current_durability FROM user_rods WHERE user_id = ? ORDER BY rod_instance_id",
+        "bait": "SELECT bait_id, quantity FROM user_bait_inventory WHERE user_id = ? ORDER BY bait_id",
+        "accessory": "SELECT accessory_id FROM user_accessories WHERE user_id = ? ORDER BY accessory_instance_id",
+        "item": "SELECT item_id, quantity FROM user_items WHERE user_id = ? ORDER BY item_id",
+    }
+
     def __init__(self, db_path: str):
         self.db_path = db_path
         self._connection_manager = DatabaseConnectionManager(db_path)
@@ -88,6 +97,43 @@ class SqliteInventoryRepository(AbstractInventoryRepository):
             cursor.execute("SELECT user_id, fish_id, quality_level, quantity FROM user_fish_inventory WHERE user_id = ? AND quantity > 0", (user_id,))
             return [self._row_to_fish_item(row) for row in cursor.fetchall()]
 
+    def get_inventory_rows(self, user_id: str, category: str, limit: int, offset: int = 0) -> List[Tuple]:
+        """只读场景（如WebUI列表）使用：在 SQL 中分页并直接返回元组，不构造领域对象；limit 为 -1 时不限条数"""
+        query = self._INVENTORY_ROW_QUERIES.get(category)
+        if query is None:
+            raise ValueError("Invalid inventory category")
+        with self._connection_manager.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"{query} LIMIT ? OFFSET ?", (user_id, limit, offset))
+            return [tuple(row) for row in cursor.fetchall()]
+
+    def get_fish_inventory_by_rarity(self, user_id: str, rarity: int) -> List[UserFishInventoryItem]:
+        """在 SQL 中按稀有度过滤鱼塘，避免取回整个鱼塘再筛选"""
+        with self._connection_manager.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT ufi.user_id, ufi.fish_id, ufi.quality_level, ufi.quantity
+                FROM user_fish_inventory ufi
+                JOIN fish f ON f.fish_id = ufi.fish_id
+                WHERE ufi.user_id = ? AND f.rarity = ? AND ufi.quantity > 0
+                ORDER BY ufi.fish_id, ufi.quality_level
+            """, (user_id, rarity))
+            return [self._row_to_fish_item(row) for row in cursor.fetchall()]
+
+    def get_inventory_counts(self, user_id: str) -> Dict[str, int]:
+        """用一条语句统计背包各类物品的条目数，避免分别取回整张列表"""
+        with self._connection_manager.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT
+                    (SELECT COUNT(*) FROM user_fish_inventory WHERE user_id = ? AND quantity > 0),
+                    (SELECT COUNT(*) FROM user_rods WHERE user_id = ?),
+                    (SELECT COUNT(*) FROM user_bait_inventory WHERE user_id = ?),
+                    (SELECT COUNT(*) FROM user_accessories WHERE user_id = ?),
+                    (SELECT COUNT(*) FROM user_items WHERE user_id = ?)
+            """, (user_id,) * 5)
+            return dict(zip(("fish", "rod", "bait", "accessory", "item"), cursor.fetchone()))
+
     def get_fish_inventory_value(self, user_id: str, rarity: Optional[int] = None) -> int:
         query = """
             SELECT SUM(f.base_value * ufi.quantity * (1 + ufi.quality_level))
@@ -116,6 +162,19 @@ class SqliteInventoryRepository(AbstractInventoryRepository):
             """, (user_id, fish_id, quality_level, quantity))
             conn.commit()
 
+    def add_fishes_to_inventory(self, user_id: str, fish_counts: Dict[int, int], quality_level: int = 0) -> None:
+        """用一次 executemany 在同一事务中添加多种鱼"""
+        if not fish_counts:
+            return
+        with self._connection_manager.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.executemany("""
+                INSERT INTO user_fish_inventory (user_id, fish_id, quality_level, quantity)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(user_id, fish_id, quality_level) DO UPDATE SET quantity = quantity + excluded.quantity
+            """, [(user_id, fish_id, quality_level, quantity) for fish_id, quantity in fish_counts.items()])
+            conn.commit()
+
     def clear_fish_inventory(self, user_id: str, rarity: Optional[int] = None) -> None:
         with self._connection_manager.get_connection() as conn:
             cursor = conn.cursor()
@@ -688,6 +747,19 @@ class SqliteInventoryRepository(AbstractInventoryRepository):
             """, (user_id,))
             return [self._row_to_aquarium_item(row) for row in cursor.fetchall()]
 
+    def get_aquarium_inventory_by_rarity(self, user_id: str, rarity: int) -> List[UserAquariumItem]:
+        """在 SQL 中按稀有度过滤水族箱"""
+        with self._connection_manager.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT ua.user_id, ua.fish_id, ua.quality_level, ua.quantity, ua.added_at
+                FROM user_aquarium ua
+                JOIN fish f ON f.fish_id = ua.fish_id
+                WHERE ua.user_id = ? AND f.rarity = ? AND ua.quantity > 0
+                ORDER BY ua.fish_id, ua.quality_level
+            """, (user_id, rarity))
+            return [self._row_to_aquarium_item(row) for row in cursor.fetchall()]
+
     def get_aquarium_inventory_value(self, user_id: str, rarity: Optional[int] = None) -> int:
         """获取用户水族箱中鱼的总价值"""
         query = """
@@ -750,6 +822,49 @@ class SqliteInventoryRepository(AbstractInventoryRepository):
         elif delta < 0:
             self.remove_fish_from_aquarium(user_id, fish_id, -delta, quality_level)
 
+    def move_fishes_to_aquarium(self, user_id: str, moves: List[Tuple[int, int, int]]) -> None:
+        """在同一事务中将多种鱼从鱼塘移入水族箱
+        Raises InsufficientFishQuantityError if any fish is short in the pond.
+        """
+        self._move_fishes(user_id, moves, "user_fish_inventory", "user_aquarium")
+
+    def move_fishes_to_pond(self, user_id: str, moves: List[Tuple[int, int, int]]) -> None:
+        """在同一事务中将多种鱼从水族箱移回鱼塘
+        Raises InsufficientFishQuantityError if any fish is short in the aquarium.
+        """
+        self._move_fishes(user_id, moves, "user_aquarium", "user_fish_inventory")
+
+    def _move_fishes(self, user_id: str, moves: List[Tuple[int, int, int]], source: str, target: str) -> None:
+        """批量扣减 source 表并累加到 target 表，任一条数量不足则整体回滚"""
+        if not moves:
+            return
+        target_columns = "user_id, fish_id, quality_level, quantity"
+        target_values = "?, ?, ?, ?"
+        if target == "user_aquarium":
+            target_columns += ", added_at"
+            target_values += ", CURRENT_TIMESTAMP"
+        with self._connection_manager.get_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.executemany(f"""
+                    UPDATE {source}
+                    SET quantity = quantity - ?
+                    WHERE user_id = ? AND fish_id = ? AND quality_level = ? AND quantity >= ?
+                """, [(quantity, user_id, fish_id, quality_level, quantity) for fish_id, quality_level, quantity in moves])
+                if cursor.rowcount != len(moves):
+                    raise InsufficientFishQuantityError(f"用户 {user_id} 的 {source} 中鱼类数量不足，批量移动已取消")
+                cursor.execute(f"DELETE FROM {source} WHERE user_id = ? AND quantity <= 0", (user_id,))
+                cursor.executemany(f"""
+                    INSERT INTO {target} ({target_columns})
+                    VALUES ({target_values})
+                    ON CONFLICT(user_id, fish_id, quality_level) DO UPDATE SET
+                        quantity = quantity + excluded.quantity
+                """, [(user_id, fish_id, quality_level, quantity) for fish_id, quality_level, quantity in moves])
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
     def clear_aquarium_inventory(self, user_id: str, rarity: Optional[int] = None) -> None:
         """清空用户水族箱"""
         with self._connection_manager.get_connection() as conn:
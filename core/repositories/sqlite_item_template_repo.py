@@ -169,6 +169,24 @@ class SqliteItemTemplateRepository(AbstractItemTemplateRepository):
             cursor.execute("SELECT * FROM fish WHERE fish_id = ?", (fish_id,))
             return self._row_to_fish(cursor.fetchone())
 
+    def get_fishes_by_ids(self, fish_ids: List[int]) -> Dict[int, Fish]:
+        """用一条 IN 查询批量读取鱼类模板"""
+        unique_ids = list(dict.fromkeys(fish_ids))
+        if not unique_ids:
+            return {}
+        result: Dict[int, Fish] = {}
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            # 分批查询，避免超出 SQLite 的参数数量上限
+            for start in range(0, len(unique_ids), 500):
+                batch = unique_ids[start:start + 500]
+                placeholders = ", ".join(["?"] * len(batch))
+                cursor.execute(f"SELECT * FROM fish WHERE fish_id IN ({placeholders})", batch)
+                for row in cursor.fetchall():
+                    fish = self._row_to_fish(row)
+                    result[fish.fish_id] = fish
+        return result
+
     def get_all_fish(self) -> List[Fish]:
         with self._get_connection() as conn:
             cursor = conn.cursor()
@@ -270,6 +270,93 @@ class SqliteMarketRepository(AbstractMarketRepository):
             
             return listings, total_count
 
+    def get_listings_page(self, limit: int, before_id: Optional[int] = None,
+                          item_type: str = None, min_price: int = None,
+                          max_price: int = None) -> List[MarketListing]:
+        """
+        游标（keyset）分页获取市场商品：按 market_id 倒序返回 market_id < before_id 的前 limit 条。
+        不统计总数，也不使用 OFFSET，翻页开销与页码无关。
+        """
+        with self.db_manager.get_connection() as conn:
+            cursor = conn.cursor()
+
+            cursor.execute("PRAGMA table_info(market)")
+            cols = [row[1] for row in cursor.fetchall()]
+            select_instance_id = "m.item_instance_id" if "item_instance_id" in cols else "NULL AS item_instance_id"
+            select_is_anonymous = "m.is_anonymous" if "is_anonymous" in cols else "0 AS is_anonymous"
+            select_quality_level = "m.quality_level" if "quality_level" in cols else "0 AS quality_level"
+
+            where_conditions = []
+            params = []
+            if before_id is not None:
+                where_conditions.append("m.market_id < ?")
+                params.append(before_id)
+            if item_type:
+                where_conditions.append("m.item_type = ?")
+                params.append(item_type)
+            if min_price is not None:
+                where_conditions.append("m.price >= ?")
+                params.append(min_price)
+            if max_price is not None:
+                where_conditions.append("m.price <= ?")
+                params.append(max_price)
+            where_clause = " AND ".join(where_conditions) if where_conditions else "1=1"
+
+            query = f"""
+                SELECT
+                    m.market_id,
+                    m.user_id,
+                    u.nickname AS seller_nickname,
+                    m.item_type,
+                    m.item_id,
+                    {select_instance_id},
+                    m.quantity,
+                    m.price,
+                    m.refine_level,
+                    m.listed_at,
+                    {select_is_anonymous},
+                    {select_quality_level},
+                    CASE
+                        WHEN m.item_type = 'rod' THEN r.name
+                        WHEN m.item_type = 'accessory' THEN a.name
+                        WHEN m.item_type = 'item' THEN i.name
+                        WHEN m.item_type = 'fish' THEN f.name
+                        WHEN m.item_type = 'commodity' THEN c.name
+                        ELSE '未知物品'
+                    END AS item_name,
+                    CASE
+                        WHEN m.item_type = 'rod' THEN r.description
+                        WHEN m.item_type = 'accessory' THEN a.description
+                        WHEN m.item_type = 'item' THEN i.description
+                        WHEN m.item_type = 'fish' THEN f.description
+                        WHEN m.item_type = 'commodity' THEN c.description
+                        ELSE ''
+                    END AS item_description,
+                    CASE
+                        WHEN m.item_type = 'rod' THEN r.rarity
+                        WHEN m.item_type = 'accessory' THEN a.rarity
+                        WHEN m.item_type = 'item' THEN i.rarity
+                        WHEN m.item_type = 'fish' THEN f.rarity
+                        WHEN m.item_type = 'commodity' THEN 1
+                        ELSE 0
+                    END AS rarity,
+                    m.expires_at
+                FROM market m
+                JOIN users u ON m.user_id = u.user_id
+                LEFT JOIN rods r ON m.item_type = 'rod' AND m.item_id = r.rod_id
+                LEFT JOIN accessories a ON m.item_type = 'accessory' AND m.item_id = a.accessory_id
+                LEFT JOIN items i ON m.item_type = 'item' AND m.item_id = i.item_id
+                LEFT JOIN fish f ON m.item_type = 'fish' AND m.item_id = f.fish_id
+                LEFT JOIN commodities c ON m.item_type = 'commodity' AND m.item_id = c.commodity_id
+                WHERE {where_clause}
+                ORDER BY m.market_id DESC
+                LIMIT ?
+            """
+            params.append(limit)
+
+            cursor.execute(query, params)
+            return [self._row_to_market_listing(row) for row in cursor.fetchall()]
+
     def add_listing(self, listing: MarketListing) -> None:
         """添加一个市场商品"""
         with self.db_manager.get_connection() as conn:
@@ -1,29 +1,52 @@
 import dataclasses
 import sqlite3
-import threading
 from datetime import datetime
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple
 
 from astrbot.api import logger
 
 from ..domain.models import User, TaxRecord
-from .abstract_repository import AbstractUserRepository
+from .abstract_repository import AbstractUserRepository, RepoConflict, RepoNotFound, RepoTransient
+from ..database.connection_manager import DatabaseConnectionManager
+
+# UPDATE ... RETURNING 需要 SQLite 3.35+
+_SUPPORTS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+# 用户资料展示（WebUI /info）所需的列
+_PROFILE_COLUMNS = (
+    "user_id, nickname, coins, premium_currency, total_fishing_count, total_weight_caught, "
+    "consecutive_login_days, fish_pond_capacity, max_coins, created_at"
+)
+
+
+def _parse_datetime(dt_val):
+    """将数据库中的时间值（datetime 或字符串）解析为 datetime"""
+    if isinstance(dt_val, datetime):
+        return dt_val
+    if isinstance(dt_val, str):
+        try:
+            return datetime.fromisoformat(dt_val.replace("Z", "+00:00"))
+        except ValueError:
+            try:
+                return datetime.strptime(dt_val, "%Y-%m-%d %H:%M:%S.%f")
+            except ValueError:
+                try:
+                    return datetime.strptime(dt_val, "%Y-%m-%d %H:%M:%S")
+                except ValueError:
+                    return None
+    return None
+
 
 class SqliteUserRepository(AbstractUserRepository):
     """用户数据仓储的SQLite实现"""
 
     def __init__(self, db_path: str):
         self.db_path = db_path
-        self._local = threading.local()
+        self._connection_manager = DatabaseConnectionManager(db_path)
 
     def _get_connection(self) -> sqlite3.Connection:
-        conn = getattr(self._local, "connection", None)
-        if conn is None:
-            conn = sqlite3.connect(self.db_path, detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES)
-            conn.row_factory = sqlite3.Row
-            conn.execute("PRAGMA foreign_keys = ON;")
-            self._local.connection = conn
-        return conn
+        """获取一个线程安全的数据库连接。"""
+        return self._connection_manager.get_connection()
 
     def _row_to_user(self, row: sqlite3.Row) -> Optional[User]:
         """
@@ -33,22 +56,6 @@ class SqliteUserRepository(AbstractUserRepository):
         if not row:
             return None
             
-        def parse_datetime(dt_val):
-            if isinstance(dt_val, datetime):
-                return dt_val
-            if isinstance(dt_val, str):
-                try:
-                    return datetime.fromisoformat(dt_val.replace("Z", "+00:00"))
-                except ValueError:
-                    try:
-                        return datetime.strptime(dt_val, "%Y-%m-%d %H:%M:%S.%f")
-                    except ValueError:
-                        try:
-                            return datetime.strptime(dt_val, "%Y-%m-%d %H:%M:%S")
-                        except ValueError:
-                            return None
-            return None
-        
         # 使用 .keys() 检查字段是否存在，确保向后兼容性
         row_keys = row.keys()
         
@@ -64,23 +71,23 @@ class SqliteUserRepository(AbstractUserRepository):
             consecutive_login_days=row["consecutive_login_days"],
             fish_pond_capacity=row["fish_pond_capacity"],
             aquarium_capacity=row["aquarium_capacity"] if "aquarium_capacity" in row_keys else 50,
-            created_at=parse_datetime(row["created_at"]),
+            created_at=_parse_datetime(row["created_at"]),
             equipped_rod_instance_id=row["equipped_rod_instance_id"],
             equipped_accessory_instance_id=row["equipped_accessory_instance_id"],
             current_title_id=row["current_title_id"],
             current_bait_id=row["current_bait_id"],
-            bait_start_time=parse_datetime(row["bait_start_time"]),
+            bait_start_time=_parse_datetime(row["bait_start_time"]),
 
             max_wipe_bomb_multiplier=row["max_wipe_bomb_multiplier"] if "max_wipe_bomb_multiplier" in row_keys else 0.0,
             min_wipe_bomb_multiplier=row["min_wipe_bomb_multiplier"] if "min_wipe_bomb_multiplier" in row_keys else None,
 
             auto_fishing_enabled=bool(row["auto_fishing_enabled"]),
-            last_fishing_time=parse_datetime(row["last_fishing_time"]),
-            last_wipe_bomb_time=parse_datetime(row["last_wipe_bomb_time"]),
-            last_steal_time=parse_datetime(row["last_steal_time"]),
-            last_electric_fish_time=parse_datetime(row["last_electric_fish_time"]) if "last_electric_fish_time" in row_keys else None,
-            last_login_time=parse_datetime(row["last_login_time"]),
-            last_stolen_at=parse_datetime(row["last_stolen_at"]),
+            last_fishing_time=_parse_datetime(row["last_fishing_time"]),
+            last_wipe_bomb_time=_parse_datetime(row["last_wipe_bomb_time"]),
+            last_steal_time=_parse_datetime(row["last_steal_time"]),
+            last_electric_fish_time=_parse_datetime(row["last_electric_fish_time"]) if "last_electric_fish_time" in row_keys else None,
+            last_login_time=_parse_datetime(row["last_login_time"]),
+            last_stolen_at=_parse_datetime(row["last_stolen_at"]),
             wipe_bomb_forecast=row["wipe_bomb_forecast"],
             fishing_zone_id=row["fishing_zone_id"],
 
@@ -94,12 +101,12 @@ class SqliteUserRepository(AbstractUserRepository):
             wof_current_level=row["wof_current_level"] if "wof_current_level" in row_keys else 0,
             wof_current_prize=row["wof_current_prize"] if "wof_current_prize" in row_keys else 0,
             wof_entry_fee=row["wof_entry_fee"] if "wof_entry_fee" in row_keys else 0,
-            last_wof_play_time=parse_datetime(row["last_wof_play_time"]) if "last_wof_play_time" in row_keys else None,
-            wof_last_action_time=parse_datetime(row["wof_last_action_time"]) if "wof_last_action_time" in row_keys else None,
+            last_wof_play_time=_parse_datetime(row["last_wof_play_time"]) if "last_wof_play_time" in row_keys else None,
+            wof_last_action_time=_parse_datetime(row["wof_last_action_time"]) if "wof_last_action_time" in row_keys else None,
             wof_plays_today=row["wof_plays_today"] if "wof_plays_today" in row_keys else 0,
             last_wof_date=row["last_wof_date"] if "last_wof_date" in row_keys else None,
             # --- [新功能] 添加骰宝冷却字段的读取 ---
-            last_sicbo_time=parse_datetime(row["last_sicbo_time"]) if "last_sicbo_time" in row_keys else None,
+            last_sicbo_time=_parse_datetime(row["last_sicbo_time"]) if "last_sicbo_time" in row_keys else None,
             
             # --- [新功能] 添加交易所账户状态字段的读取 ---
             exchange_account_status=bool(row["exchange_account_status"]) if "exchange_account_status" in row_keys else False,
@@ -112,6 +119,24 @@ class SqliteUserRepository(AbstractUserRepository):
             row = cursor.fetchone()
             return self._row_to_user(row)
 
+    def get_by_ids(self, user_ids: List[str]) -> Dict[str, User]:
+        """用一条 IN 查询批量读取用户"""
+        unique_ids = list(dict.fromkeys(user_ids))
+        if not unique_ids:
+            return {}
+        result: Dict[str, User] = {}
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            # 分批查询，避免超出 SQLite 的参数数量上限
+            for start in range(0, len(unique_ids), 500):
+                batch = unique_ids[start:start + 500]
+                placeholders = ", ".join(["?"] * len(batch))
+                cursor.execute(f"SELECT * FROM users WHERE user_id IN ({placeholders})", batch)
+                for row in cursor.fetchall():
+                    user = self._row_to_user(row)
+                    result[user.user_id] = user
+        return result
+
     def check_exists(self, user_id: str) -> bool:
         with self._get_connection() as conn:
             cursor = conn.cursor()
@@ -162,6 +187,33 @@ class SqliteUserRepository(AbstractUserRepository):
             logger.error(f"更新用户 {user.user_id} 数据时发生数据库错误: {e}")
             raise
 
+    def update_many(self, users: List[User]) -> None:
+        """用一次 executemany 在同一事务中更新多个用户"""
+        if not users:
+            return
+        fields = [f.name for f in dataclasses.fields(User) if f.name != 'user_id']
+        set_clause = ", ".join([f"{field} = ?" for field in fields])
+        rows = []
+        for user in users:
+            # 自动更新历史最高金币数
+            if user.coins > user.max_coins:
+                user.max_coins = user.coins
+            rows.append(tuple(getattr(user, field) for field in fields) + (user.user_id,))
+
+        sql = f"UPDATE users SET {set_clause} WHERE user_id = ?"
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                try:
+                    cursor.executemany(sql, rows)
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+        except sqlite3.Error as e:
+            logger.error(f"批量更新 {len(users)} 个用户数据时发生数据库错误: {e}")
+            raise
+
     def get_all_user_ids(self, auto_fishing_only: bool = False) -> List[str]:
         query = "SELECT user_id FROM users"
         if auto_fishing_only:
@@ -194,6 +246,31 @@ class SqliteUserRepository(AbstractUserRepository):
     def get_top_users_by_weight(self, limit: int) -> List[User]:
         return self._get_top_users_base_query("total_weight_caught", limit)
 
+    def get_leaderboard_rows(self, order_by_column: str, limit: int) -> List[Dict[str, Any]]:
+        """只查询排行榜需要的列，不构造完整的 User 对象"""
+        if order_by_column not in ["total_fishing_count", "coins", "total_weight_caught", "max_coins"]:
+            raise ValueError("Invalid order by column")
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                SELECT user_id, nickname, coins, max_coins,
+                       total_fishing_count AS fish_count, total_weight_caught, current_title_id
+                FROM users ORDER BY {order_by_column} DESC LIMIT ?
+            """, (limit,))
+            return [dict(row) for row in cursor.fetchall()]
+
+    def get_profile_row(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """只查询用户资料展示所需的列，不构造完整的 User 对象"""
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"SELECT {_PROFILE_COLUMNS} FROM users WHERE user_id = ?", (user_id,))
+            row = cursor.fetchone()
+        if row is None:
+            return None
+        profile = dict(row)
+        profile["created_at"] = _parse_datetime(profile["created_at"])
+        return profile
+
     def get_high_value_users(self, threshold: int) -> List[User]:
         with self._get_connection() as conn:
             cursor = conn.cursor()
@@ -242,4 +319,50 @@ class SqliteUserRepository(AbstractUserRepository):
                 return cursor.rowcount > 0
             except sqlite3.Error:
                 conn.rollback()
-                return False
\ No newline at end of file
+                return False
+
+    def try_open_exchange_account(self, user_id: str, fee: int) -> Tuple[str, int]:
+        """
+        在一条 UPDATE 中完成余额检查、扣费与开户，避免并发下的重复扣费。
+        成功时通过 RETURNING 直接取得扣费后的余额；仅在失败时再查询一次以区分原因。
+        """
+        try:
+            return self._try_open_exchange_account(user_id, fee)
+        except sqlite3.OperationalError as e:
+            raise RepoTransient(str(e)) from e
+        except sqlite3.IntegrityError as e:
+            raise RepoConflict(str(e)) from e
+
+    def _try_open_exchange_account(self, user_id: str, fee: int) -> Tuple[str, int]:
+        update_sql = """
+            UPDATE users
+            SET coins = coins - ?, exchange_account_status = 1
+            WHERE user_id = ? AND coins >= ?
+              AND (exchange_account_status = 0 OR exchange_account_status IS NULL)
+        """
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            if _SUPPORTS_RETURNING:
+                cursor.execute(update_sql + " RETURNING coins", (fee, user_id, fee))
+                row = cursor.fetchone()
+                conn.commit()
+                if row is not None:
+                    return "ok", row["coins"]
+            else:
+                cursor.execute(update_sql, (fee, user_id, fee))
+                conn.commit()
+                if cursor.rowcount > 0:
+                    cursor.execute("SELECT coins FROM users WHERE user_id = ?", (user_id,))
+                    return "ok", cursor.fetchone()["coins"]
+
+            cursor.execute(
+                "SELECT coins, exchange_account_status FROM users WHERE user_id = ?",
+                (user_id,),
+            )
+            row = cursor.fetchone()
+
+        if row is None:
+            raise RepoNotFound(user_id)
+        if row["exchange_account_status"]:
+            return "already", row["coins"]
+        return "poor", row["coins"]
@@ -1,9 +1,16 @@
-from typing import Dict, Any, List, Optional
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
 from datetime import datetime
 
 from ..repositories.abstract_repository import AbstractInventoryRepository, AbstractUserRepository, AbstractItemTemplateRepository
+from ..repositories.sqlite_inventory_repo import InsufficientFishQuantityError
 from ..domain.models import User, UserAquariumItem, AquariumUpgrade, Fish
 
+# 水族箱查询缓存的最大用户数，超出时淘汰最久未访问的条目
+_AQUARIUM_CACHE_MAX_SIZE = 1024
+
 
 class AquariumService:
     """水族箱服务，处理水族箱相关的业务逻辑"""
@@ -15,8 +22,35 @@ class AquariumService:
         self.user_repo = user_repo
         self.item_template_repo = item_template_repo
 
+        # 水族箱查询短时缓存: user_id -> (写入时间, 查询结果)
+        # 本服务内的写操作会立即失效对应条目；其他服务（如市场购买）写入后最多延迟一个 TTL 可见
+        # 按 LRU 限制条目数，过期条目随淘汰移除；处理器在工作线程中调用，读写需加锁
+        self._aquarium_cache: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._aquarium_cache_ttl = 2.0
+        self._aquarium_cache_lock = threading.Lock()
+
+    def _invalidate_aquarium(self, user_id: str) -> None:
+        with self._aquarium_cache_lock:
+            self._aquarium_cache.pop(user_id, None)
+
     def get_user_aquarium(self, user_id: str) -> Dict[str, Any]:
-        """获取用户水族箱信息"""
+        """获取用户水族箱信息（带短时缓存）"""
+        with self._aquarium_cache_lock:
+            cached = self._aquarium_cache.get(user_id)
+            if cached and time.monotonic() - cached[0] < self._aquarium_cache_ttl:
+                self._aquarium_cache.move_to_end(user_id)
+                return cached[1]
+
+        result = self._load_user_aquarium(user_id)
+        if result["success"]:
+            with self._aquarium_cache_lock:
+                self._aquarium_cache[user_id] = (time.monotonic(), result)
+                self._aquarium_cache.move_to_end(user_id)
+                if len(self._aquarium_cache) > _AQUARIUM_CACHE_MAX_SIZE:
+                    self._aquarium_cache.popitem(last=False)
+        return result
+
+    def _load_user_aquarium(self, user_id: str) -> Dict[str, Any]:
         aquarium_items = self.inventory_repo.get_aquarium_inventory(user_id)
         total_value = self.inventory_repo.get_aquarium_inventory_value(user_id)
         total_count = self.inventory_repo.get_aquarium_total_count(user_id)
@@ -26,10 +60,11 @@ class AquariumService:
         if not user:
             return {"success": False, "message": "用户不存在"}
 
-        # 为了丰富信息，可以从模板仓储获取鱼的详细信息
+        # 为了丰富信息，从模板仓储一次性获取所有鱼的详细信息
+        templates = self.item_template_repo.get_fishes_by_ids([item.fish_id for item in aquarium_items])
         enriched_items = []
         for item in aquarium_items:
-            if fish_template := self.item_template_repo.get_fish_by_id(item.fish_id):
+            if fish_template := templates.get(item.fish_id):
                 # 计算实际价值（高品质鱼双倍价值）
                 actual_value = fish_template.base_value * (1 + item.quality_level)
                 enriched_items.append({
@@ -85,6 +120,7 @@ class AquariumService:
         # 从鱼塘移除鱼，添加到水族箱（保持品质）
         self.inventory_repo.update_fish_quantity(user_id, fish_id, -quantity, quality_level)
         self.inventory_repo.add_fish_to_aquarium(user_id, fish_id, quantity, quality_level)
+        self._invalidate_aquarium(user_id)
 
         quality_label = "✨高品质" if quality_level == 1 else "普通"
         return {
@@ -92,6 +128,115 @@ class AquariumService:
             "message": f"成功将 {quality_label}{fish_template.name} x{quantity} 放入水族箱！"
         }
 
+    def get_user_fishes_by_rarity(self, user_id: str, rarity: int, in_aquarium: bool = False) -> List[Dict[str, Any]]:
+        """获取鱼塘（或水族箱）中指定稀有度的鱼，稀有度过滤在数据库中完成"""
+        if in_aquarium:
+            items = self.inventory_repo.get_aquarium_inventory_by_rarity(user_id, rarity)
+        else:
+            items = self.inventory_repo.get_fish_inventory_by_rarity(user_id, rarity)
+        templates = self.item_template_repo.get_fishes_by_ids([item.fish_id for item in items])
+        return [
+            {
+                "fish_id": item.fish_id,
+                "name": templates[item.fish_id].name,
+                "rarity": rarity,
+                "quantity": item.quantity,
+                "quality_level": item.quality_level,
+            }
+            for item in items
+            if item.fish_id in templates
+        ]
+
+    def add_fishes_to_aquarium_batch(self, user_id: str, items: List[Tuple[int, int, int]]) -> Dict[str, Any]:
+        """将多种鱼一次性从鱼塘放入水族箱
+
+        Args:
+            items: [(fish_id, quality_level, quantity)]
+
+        Returns:
+            success/moved/hq_count/success_count，以及 failed: [(fish_id, quality_level, 原因)]
+        """
+        user = self.user_repo.get_by_id(user_id)
+        if not user:
+            return {"success": False, "message": "用户不存在"}
+
+        templates = self.item_template_repo.get_fishes_by_ids([fish_id for fish_id, _, _ in items])
+        pond = {
+            (item.fish_id, item.quality_level): item.quantity
+            for item in self.inventory_repo.get_fish_inventory(user_id)
+        }
+        current_count = self.inventory_repo.get_aquarium_total_count(user_id)
+
+        # 与逐条调用 add_fish_to_aquarium 的校验顺序一致，容量按已接受的条目累加
+        moves, failed = [], []
+        for fish_id, quality_level, quantity in items:
+            fish_template = templates.get(fish_id)
+            if not fish_template:
+                failed.append((fish_id, quality_level, "鱼类不存在"))
+                continue
+            if current_count + quantity > user.aquarium_capacity:
+                failed.append((fish_id, quality_level,
+                               f"水族箱容量不足！当前容量：{user.aquarium_capacity}，已有：{current_count}，需要：{quantity}"))
+                continue
+            if pond.get((fish_id, quality_level), 0) < quantity:
+                quality_label = "✨高品质" if quality_level == 1 else "普通"
+                failed.append((fish_id, quality_level, f"鱼塘中没有足够的{quality_label}{fish_template.name}"))
+                continue
+            pond[(fish_id, quality_level)] -= quantity
+            current_count += quantity
+            moves.append((fish_id, quality_level, quantity))
+
+        try:
+            self.inventory_repo.move_fishes_to_aquarium(user_id, moves)
+        except InsufficientFishQuantityError:
+            # 校验后鱼塘数量被并发修改，整批已回滚
+            return {"success": False, "message": "鱼塘中的鱼数量已变化，本次未移动任何鱼，请重新操作"}
+        self._invalidate_aquarium(user_id)
+        return self._batch_move_result(moves, failed)
+
+    def remove_fishes_from_aquarium_batch(self, user_id: str, items: List[Tuple[int, int, int]]) -> Dict[str, Any]:
+        """将多种鱼一次性从水族箱移回鱼塘，参数与返回值同 add_fishes_to_aquarium_batch"""
+        user = self.user_repo.get_by_id(user_id)
+        if not user:
+            return {"success": False, "message": "用户不存在"}
+
+        templates = self.item_template_repo.get_fishes_by_ids([fish_id for fish_id, _, _ in items])
+        aquarium = {
+            (item.fish_id, item.quality_level): item.quantity
+            for item in self.inventory_repo.get_aquarium_inventory(user_id)
+        }
+
+        moves, failed = [], []
+        for fish_id, quality_level, quantity in items:
+            fish_template = templates.get(fish_id)
+            if not fish_template:
+                failed.append((fish_id, quality_level, "鱼类不存在"))
+                continue
+            if aquarium.get((fish_id, quality_level), 0) < quantity:
+                quality_label = "✨高品质" if quality_level == 1 else "普通"
+                failed.append((fish_id, quality_level, f"水族箱中没有足够的{quality_label}{fish_template.name}"))
+                continue
+            aquarium[(fish_id, quality_level)] -= quantity
+            moves.append((fish_id, quality_level, quantity))
+
+        try:
+            self.inventory_repo.move_fishes_to_pond(user_id, moves)
+        except InsufficientFishQuantityError:
+            # 校验后水族箱数量被并发修改，整批已回滚
+            return {"success": False, "message": "水族箱中的鱼数量已变化，本次未移动任何鱼，请重新操作"}
+        self._invalidate_aquarium(user_id)
+        return self._batch_move_result(moves, failed)
+
+    @staticmethod
+    def _batch_move_result(moves: List[Tuple[int, int, int]], failed: List[Tuple[int, int, str]]) -> Dict[str, Any]:
+        return {
+            "success": True,
+            "moved": sum(quantity for _, _, quantity in moves),
+            "hq_count": sum(quantity for _, quality_level, quantity in moves if quality_level == 1),
+            "success_count": len(moves),
+            "failed": failed,
+        }
+
     def remove_fish_from_aquarium(self, user_id: str, fish_id: int, quantity: int = 1, quality_level: int = 0) -> Dict[str, Any]:
         """从水族箱移除鱼到鱼塘"""
         # 检查用户是否存在
@@ -114,6 +259,7 @@ class AquariumService:
         # 从水族箱移除鱼，添加到鱼塘（保持品质）
         self.inventory_repo.remove_fish_from_aquarium(user_id, fish_id, quantity, quality_level)
         self.inventory_repo.add_fish_to_inventory(user_id, fish_id, quantity, quality_level)
+        self._invalidate_aquarium(user_id)
 
         quality_label = "✨高品质" if quality_level == 1 else "普通"
         return {
@@ -160,6 +306,7 @@ class AquariumService:
 
         try:
             self.user_repo.update(user)
+            self._invalidate_aquarium(user_id)
             
             # 验证更新是否生效
             updated_user = self.user_repo.get_by_id(user_id)
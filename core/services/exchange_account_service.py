@@ -1,10 +1,19 @@
-from typing import Dict, Any
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
 
 from astrbot.api import logger
 
 from ..domain.models import User
-from ..repositories.abstract_repository import AbstractUserRepository
+from ..repositories.abstract_repository import AbstractUserRepository, RepoNotFound, RepoTransient
 
+# 固定文案的返回结果，调用方只读取不修改，可直接复用
+_RESP_NO_USER = {"success": False, "message": "用户不存在"}
+_RESP_ALREADY_OPEN = {"success": False, "message": "您已经开通了交易所账户"}
+_RESP_NOT_OPENED = {"success": False, "message": "您还没有开通交易所账户，请先使用「交易所 开户」开通"}
+_RESP_STATUS_OK = {"success": True, "message": "账户状态正常"}
+_RESP_BUSY = {"success": False, "message": "系统繁忙，请稍后再试"}
 
 class ExchangeAccountService:
     """交易所账户管理服务"""
@@ -12,51 +21,117 @@ class ExchangeAccountService:
     def __init__(self, user_repo: AbstractUserRepository, config: Dict[str, Any] = None):
         self.user_repo = user_repo
         self.config = config or {}
+        self.invalidate_config()
 
-    def open_exchange_account(self, user_id: str) -> Dict[str, Any]:
-        """开通交易所账户"""
-        try:
-            # 检查用户是否存在
-            user = self.user_repo.get_by_id(user_id)
-            if not user:
-                return {"success": False, "message": "用户不存在"}
-            
-            # 检查是否已经开通
-            if hasattr(user, 'exchange_account_status') and user.exchange_account_status:
-                return {"success": False, "message": "您已经开通了交易所账户"}
-            
-            # 获取开户费用
-            account_fee = self.config.get("account_fee", 100000)
-            
-            # 检查金币是否足够
-            if user.coins < account_fee:
-                return {"success": False, "message": f"金币不足！开通交易所账户需要 {account_fee:,} 金币，您当前只有 {user.coins:,} 金币"}
-            
-            # 扣除金币
-            user.coins -= account_fee
-            
-            # 开通账户
-            user.exchange_account_status = True
-            self.user_repo.update(user)
-            
-            return {"success": True, "message": f"交易所账户开通成功！已扣除 {account_fee:,} 金币"}
-        except Exception as e:
-            logger.error(f"开通交易所账户失败: {e}")
-            return {"success": False, "message": f"开通失败: {str(e)}"}
-
-    def check_exchange_account(self, user_id: str) -> Dict[str, Any]:
-        """检查交易所账户状态"""
+        # 用户查询短时缓存: user_id -> (写入时间, User)
+        self._user_cache: Dict[str, Tuple[float, User]] = {}
+        self._cache_ttl = 5.0
+
+        # 近期确认“未开户”的用户: user_id -> 写入时间（LRU，限制容量）
+        # 开户只会经由本服务完成，成功时会移除对应条目，因此可以使用更长的 TTL
+        self._no_account_ids: "OrderedDict[str, float]" = OrderedDict()
+        self._no_account_ttl = 60.0
+        self._no_account_max_size = 10000
+
+        # 按用户串行化开户操作，避免同一用户的并发请求重复访问数据库
+        self._user_locks: Dict[str, threading.Lock] = {}
+        self._locks_mutex = threading.Lock()
+        self._max_user_locks = 1000
+
+    def invalidate_config(self) -> None:
+        """重新读取开户费用配置（配置热更新后调用）"""
+        self._account_fee = int(self.config.get("account_fee", 100000))
+        self._account_fee_str = f"{self._account_fee:,}"
+
+    def _get_user_cached(self, user_id: str) -> Optional[User]:
+        """带 TTL 的用户查询，命中缓存时不访问数据库"""
+        cached = self._user_cache.get(user_id)
+        if cached and time.monotonic() - cached[0] < self._cache_ttl:
+            return cached[1]
+
+        user = self.user_repo.get_by_id(user_id)
+        if user:
+            self._user_cache[user_id] = (time.monotonic(), user)
+        else:
+            self._user_cache.pop(user_id, None)
+        return user
+
+    def _is_known_without_account(self, user_id: str) -> bool:
+        """判断用户是否近期已确认未开户"""
+        ts = self._no_account_ids.get(user_id)
+        if ts is None:
+            return False
+        if time.monotonic() - ts >= self._no_account_ttl:
+            self._no_account_ids.pop(user_id, None)
+            return False
+        self._no_account_ids.move_to_end(user_id)
+        return True
+
+    def _mark_without_account(self, user_id: str) -> None:
+        """记录用户未开户，超过容量时淘汰最久未使用的条目"""
+        self._no_account_ids[user_id] = time.monotonic()
+        self._no_account_ids.move_to_end(user_id)
+        while len(self._no_account_ids) > self._no_account_max_size:
+            self._no_account_ids.popitem(last=False)
+
+    def _get_user_lock(self, user_id: str) -> threading.Lock:
+        """获取用户专属锁，数量过多时清理未被占用的锁"""
+        with self._locks_mutex:
+            lock = self._user_locks.get(user_id)
+            if lock is None:
+                if len(self._user_locks) >= self._max_user_locks:
+                    for uid in [uid for uid, l in self._user_locks.items() if not l.locked()]:
+                        del self._user_locks[uid]
+                lock = threading.Lock()
+                self._user_locks[user_id] = lock
+            return lock
+
+    def open_exchange_account(self, user_id: str, user: Optional[User] = None) -> Dict[str, Any]:
+        """
+        开通交易所账户
+
+        调用方已加载用户时可通过 user 传入；开户状态只会由未开通变为已开通，
+        因此可据此直接拒绝重复开户，扣费本身仍以数据库中的最新数据为准。
+        """
+        if user is not None and user.exchange_account_status:
+            return _RESP_ALREADY_OPEN
+        with self._get_user_lock(user_id):
+            return self._open_exchange_account_locked(user_id)
+
+    def _open_exchange_account_locked(self, user_id: str) -> Dict[str, Any]:
+        """开通交易所账户（调用方需持有该用户的锁）"""
+        # 余额检查、扣费与开户在同一条语句中完成，避免并发重复扣费
         try:
+            status, coins = self.user_repo.try_open_exchange_account(user_id, self._account_fee)
+        except RepoNotFound:
+            return _RESP_NO_USER
+        except RepoTransient as e:
+            logger.error("开通交易所账户失败: %s", e)
+            return _RESP_BUSY
+
+        if status == "ok":
+            self._user_cache.pop(user_id, None)
+            self._no_account_ids.pop(user_id, None)
+            return {"success": True, "message": f"交易所账户开通成功！已扣除 {self._account_fee_str} 金币"}
+        if status == "already":
+            return _RESP_ALREADY_OPEN
+        return {"success": False, "message": f"金币不足！开通交易所账户需要 {self._account_fee_str} 金币，您当前只有 {coins:,} 金币"}
+
+    def check_exchange_account(self, user_id: str, user: Optional[User] = None) -> Dict[str, Any]:
+        """检查交易所账户状态（调用方已加载用户时可通过 user 传入，避免重复查询）"""
+        if user is None:
+            # 近期已确认未开户的用户直接返回，无需查询
+            if self._is_known_without_account(user_id):
+                return _RESP_NOT_OPENED
+
             # 检查用户是否存在
-            user = self.user_repo.get_by_id(user_id)
-            if not user:
-                return {"success": False, "message": "用户不存在"}
-            
-            # 检查是否已开通
-            if not hasattr(user, 'exchange_account_status') or not user.exchange_account_status:
-                return {"success": False, "message": "您还没有开通交易所账户，请先使用「交易所 开户」开通"}
-            
-            return {"success": True, "message": "账户状态正常"}
-        except Exception as e:
-            logger.error(f"检查交易所账户失败: {e}")
-            return {"success": False, "message": f"检查失败: {str(e)}"}
+            user = self._get_user_cached(user_id)
+        if not user:
+            return _RESP_NO_USER
+        
+        # 检查是否已开通
+        if not user.exchange_account_status:
+            self._mark_without_account(user_id)
+            return _RESP_NOT_OPENED
+        
+        return _RESP_STATUS_OK
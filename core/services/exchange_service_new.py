@@ -1,10 +1,11 @@
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 
 from astrbot.api import logger
 
 from .exchange_price_service import ExchangePriceService
 from .exchange_inventory_service import ExchangeInventoryService
 from .exchange_account_service import ExchangeAccountService
+from ..domain.models import User
 from ..repositories.abstract_repository import AbstractExchangeRepository, AbstractUserRepository, AbstractLogRepository
 
 
@@ -56,13 +57,13 @@ class ExchangeService:
         return self.price_service.stop_daily_price_update_task()
 
     # 账户管理相关方法
-    def open_exchange_account(self, user_id: str) -> Dict[str, Any]:
+    def open_exchange_account(self, user_id: str, user: Optional[User] = None) -> Dict[str, Any]:
         """开通交易所账户"""
-        return self.account_service.open_exchange_account(user_id)
+        return self.account_service.open_exchange_account(user_id, user)
 
-    def check_exchange_account(self, user_id: str) -> Dict[str, Any]:
+    def check_exchange_account(self, user_id: str, user: Optional[User] = None) -> Dict[str, Any]:
         """检查交易所账户状态"""
-        return self.account_service.check_exchange_account(user_id)
+        return self.account_service.check_exchange_account(user_id, user)
 
     # 库存管理相关方法
     def get_user_commodities(self, user_id: str) -> List:
@@ -1,9 +1,14 @@
+import heapq
 import json
+import logging
 import os
 import random
 import threading
+import time
 import traceback
-from typing import Dict, Any, List, Optional
+from collections import Counter
+from itertools import chain
+from typing import Dict, Any, List, Optional, Set, Tuple
 from datetime import datetime, timedelta
 from astrbot.api import logger
 
@@ -12,9 +17,76 @@ from ..repositories.abstract_repository import (
     AbstractInventoryRepository,
     AbstractItemTemplateRepository,
     AbstractLogRepository,
+    AbstractExpeditionRepository,
 )
 from ..utils import get_now
 
+# orjson 为可选依赖：安装后序列化/解析快数倍，未安装时回退到标准库 json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# numpy 可选：用于向量化拼手气红包分配，未安装时使用逐个分配的二倍均值算法
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# 目标键（1~5星）与成员贡献的初始值，新成员使用 _ZERO_CONTRIB.copy()
+_STAR_KEYS = ("1_star", "2_star", "3_star", "4_star", "5_star")
+_ZERO_CONTRIB = dict.fromkeys(_STAR_KEYS, 0)
+
+# 各科考类型的固定参数
+_TYPE_NAMES = {"short": "探险", "medium": "征服", "long": "圣域"}
+_TYPE_CONFIG = {
+    "short": {
+        "duration_hours": 24,
+        "targets": 100,
+        "base_reward": 100,
+        "required_item_id": 35,  # 探险许可证
+        "join_cost": 1000000  # 100w金币
+    },
+    "medium": {
+        "duration_hours": 48,
+        "targets": 500,
+        "base_reward": 500,
+        "required_item_id": 36,  # 征服许可证
+        "join_cost": 5000000  # 500w金币
+    },
+    "long": {
+        "duration_hours": 72,
+        "targets": 1000,
+        "base_reward": 1000,
+        "required_item_id": 37,  # 圣域许可证
+        "join_cost": 10000000  # 1000w金币
+    },
+}
+# 4星和5星鱼的特殊目标数量
+_FOUR_STAR_TARGETS = {"short": 50, "medium": 100, "long": 500}
+_FIVE_STAR_TARGETS = {"short": 10, "medium": 50, "long": 100}
+# 结算钻石奖励基础值
+_PREMIUM_BASE = {"short": 1000, "medium": 5000, "long": 10000}
+# 星级事件影响的人数与量子成像获得的鱼数
+_EVENT_MEMBER_COUNT = {"short": 1, "medium": 2, "long": 3}
+_EVENT_FISH_COUNT = {"short": 1, "medium": 2, "long": 3}
+# 深渊漩涡获得的5星鱼数量
+_ABYSS_FISH_COUNT = {"short": 10, "medium": 20, "long": 30}
+
+
+def _dumps_json(data: Any) -> bytes:
+    """序列化为紧凑的 UTF-8 JSON 字节串"""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _loads_json(raw: bytes) -> Any:
+    """解析 UTF-8 JSON 字节串"""
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
 
 class ExpeditionService:
     """科学考察服务"""
@@ -25,63 +97,344 @@ class ExpeditionService:
         inventory_repo: AbstractInventoryRepository,
         item_template_repo: AbstractItemTemplateRepository,
         log_repo: AbstractLogRepository,
+        expedition_repo: AbstractExpeditionRepository,
         config: Dict[str, Any],
     ):
         self.user_repo = user_repo
         self.inventory_repo = inventory_repo
         self.item_template_repo = item_template_repo
         self.log_repo = log_repo
+        self.expedition_repo = expedition_repo
         self.config = config
         self._expedition_lock = threading.RLock()
-        self._settle_timers: Dict[str, threading.Timer] = {}
+        # 自动结算调度：(end_ts, expedition_id) 最小堆 + 单个后台线程
+        self._settle_heap: List[Tuple[float, str]] = []
+        self._scheduled_ids: Set[str] = set()
+        self._settle_cond = threading.Condition()
+        self._settle_thread: Optional[threading.Thread] = None
+        self._settle_stopped = False
+        # os.replace 已保证文件不会被写坏；fsync 只提升掉电时最后一次写入的持久性，默认关闭
+        self._fsync_on_write = bool(config.get("expedition_fsync", False))
 
         # 数据文件路径
         self.data_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "data")
         os.makedirs(self.data_dir, exist_ok=True)
+        # 科考数据存放在数据库 expeditions 表（每个科考一行）；
+        # 旧版的 active_expeditions.json 与 active_expeditions/ 分片目录仅用于首次加载时导入
+        self.expeditions_dir = os.path.join(self.data_dir, "active_expeditions")
         self.expeditions_file = os.path.join(self.data_dir, "active_expeditions.json")
         self.history_file = os.path.join(self.data_dir, "expedition_history.json")
+        # 历史记录采用“JSON 快照 + 追加写的 JSONL 日志”：每次结算只追加一行，
+        # 日志行数超过阈值时再合并回快照
+        self.history_log_file = os.path.join(self.data_dir, "expedition_history.jsonl")
+        self._history_compact_threshold = 500
+        self._history_cache: Optional[Dict[str, Any]] = None
+        self._history_cache_key: Optional[Tuple[Optional[int], Optional[int]]] = None
+        self._history_log_lines = 0
+
+        # 深渊漩涡事件用的5星鱼ID列表：(缓存时间, ID列表)，过期后重新查询以感知鱼类模板的修改
+        self._five_star_fish_ids: Optional[Tuple[float, List[int]]] = None
+        self._five_star_cache_ttl = 300.0
+
+        # 科考数据的内存缓存；所有写入都经过本服务，首次加载后缓存即为最新数据
+        self._expeditions_cache: Optional[Dict[str, Any]] = None
+
+        # 高频更新（出售鱼、进度汇总）只修改缓存并记录脏的科考ID，由后台定时器合并写库
+        self._dirty_ids: Set[str] = set()
+        self._flush_timer: Optional[threading.Timer] = None
+        self._flush_delay = 0.3
+        # 已写入（或即将写入）数据库的科考ID，用于发现需要删除的行
+        self._persisted_ids: Set[str] = set()
+
+        # 写库与 _expedition_lock 分离：锁内只序列化出快照，数据库 I/O 交给唯一的后台写库线程。
+        # 版本号保证较旧的快照不会覆盖较新的
+        self._snapshot_version = 0
+        # 待写队列: expedition_id -> (快照版本, (状态, 截止时间戳, JSON 字节串) 或 None 表示删除)，同一科考只保留最新的一份
+        self._write_queue: Dict[str, Tuple[int, Optional[Tuple[str, Optional[int], bytes]]]] = {}
+        self._writer_cond = threading.Condition()
+        self._writer_thread: Optional[threading.Thread] = None
+        self._writer_busy = False
+        # 写库线程与结算的同步写入互斥，保证较旧的快照不会在结算写入之后落库
+        self._db_write_lock = threading.Lock()
+        # expedition_id -> (已写入的快照版本, 内容哈希)；内容未变时跳过写库
+        self._row_state: Dict[str, Tuple[int, Optional[int]]] = {}
+
+        # user_id -> 进行中的 expedition_id 索引，基于当前缓存的科考字典构建
+        self._user_index: Dict[str, str] = {}
+        self._user_index_owner: Optional[Dict[str, Any]] = None
+        # creator_id -> 该队长最近一条已结束的 expedition_id，结算时据此 O(1) 删除上一条
+        self._last_ended_by_creator: Dict[str, str] = {}
+        self._last_ended_owner: Optional[Dict[str, Any]] = None
+        # expedition_id -> 上次汇总进度的 time.monotonic()
+        self._progress_last_ts: Dict[str, float] = {}
+
+    def _get_mtime_ns(self, path: str) -> Optional[int]:
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _mark_dirty_and_schedule_flush(self, expedition_id: str) -> None:
+        """标记科考数据待写盘，并在短暂延迟后统一写入"""
+        with self._expedition_lock:
+            self._dirty_ids.add(expedition_id)
+            if self._flush_timer is None:
+                timer = threading.Timer(self._flush_delay, self._flush_now)
+                timer.daemon = True
+                self._flush_timer = timer
+                timer.start()
+
+    def _flush_now(self) -> None:
+        """将缓存中尚未写库的科考数据写入数据库"""
+        with self._expedition_lock:
+            self._flush_timer = None
+            if not self._dirty_ids:
+                return
+            if self._expeditions_cache is None:
+                self._dirty_ids.clear()
+                return
+            snapshot = self._snapshot_expeditions(self._expeditions_cache, list(self._dirty_ids))
+        self._write_expeditions_snapshot(snapshot)
+
+    def flush(self, timeout: float = 10.0) -> None:
+        """立即写入所有待保存的科考数据，并等待写库线程处理完毕（插件停用时调用）"""
+        with self._expedition_lock:
+            timer = self._flush_timer
+        if timer:
+            timer.cancel()
+        self._flush_now()
+        with self._writer_cond:
+            self._writer_cond.wait_for(lambda: not self._write_queue and not self._writer_busy, timeout)
 
     def _load_expeditions(self) -> Dict[str, Any]:
-        """加载进行中的科考数据"""
-        data = self._safe_load_json_with_backup(self.expeditions_file)
-        if isinstance(data, dict):
+        """加载科考数据；首次调用时从数据库读取，之后直接返回缓存的对象"""
+        with self._expedition_lock:
+            if self._expeditions_cache is not None:
+                return self._expeditions_cache
+            self._import_legacy_expedition_files()
+            try:
+                data = self.expedition_repo.get_all()
+            except Exception as e:
+                logger.error(f"读取科考数据失败: {e}")
+                return {}
+            self._persisted_ids = set(data)
+            self._expeditions_cache = data
             return data
-        logger.error(f"科考数据文件内容类型异常，期望 dict，实际 {type(data)}")
-        return {}
 
-    def _save_expeditions(self, expeditions: Dict[str, Any]) -> None:
-        """保存科考数据"""
+    def _import_legacy_expedition_files(self) -> None:
+        """将旧版 JSON 文件（单文件或分片目录）中的科考导入数据库，完成后重命名为 .migrated"""
+        sources = [path for path in (self.expeditions_file, self.expeditions_dir) if os.path.exists(path)]
+        if not sources:
+            return
+
+        legacy: Dict[str, Any] = {}
+        if os.path.isfile(self.expeditions_file):
+            data = self._safe_load_json_with_backup(self.expeditions_file)
+            if isinstance(data, dict):
+                legacy.update(data)
+        if os.path.isdir(self.expeditions_dir):
+            with os.scandir(self.expeditions_dir) as entries:
+                for entry in entries:
+                    if entry.name.endswith(".json"):
+                        data = self._safe_load_json_with_backup(entry.path)
+                        if isinstance(data, dict) and data:
+                            legacy[entry.name[:-len(".json")]] = data
+
+        try:
+            existing = self.expedition_repo.get_all()
+            upserts = {
+                exp_id: (exp.get("status", "active"), exp.get("end_ts"), _dumps_json(exp).decode("utf-8"))
+                for exp_id, exp in legacy.items()
+                if isinstance(exp, dict) and exp_id not in existing
+            }
+            self.expedition_repo.save_many(upserts, [])
+            for path in sources:
+                os.replace(path, f"{path}.migrated")
+            logger.info(f"已将 {len(upserts)} 条科考数据从 JSON 文件导入数据库")
+        except Exception as e:
+            logger.error(f"导入旧版科考数据失败: {e}")
+
+    def _save_expeditions(self, expeditions: Dict[str, Any], changed_ids: Optional[List[str]] = None) -> None:
+        """保存科考数据；changed_ids 为空时与数据库中的全部科考比对"""
+        self._write_expeditions_snapshot(self._snapshot_expeditions(expeditions, changed_ids))
+
+    def _snapshot_expeditions(
+        self, expeditions: Dict[str, Any], changed_ids: Optional[List[str]] = None
+    ) -> Optional[Tuple[int, Dict[str, Optional[Tuple[str, Optional[int], bytes]]]]]:
+        """在锁内把变更的科考序列化为快照，返回 (版本号, {ID: (状态, 截止时间戳, JSON 字节串) 或 None 表示删除})；阻止写入时返回 None"""
         try:
             with self._expedition_lock:
-                if not expeditions:
-                    existing = self._try_load_json(self.expeditions_file)
-                    if isinstance(existing, dict) and existing:
-                        logger.error(
-                            "检测到尝试用空对象覆盖非空科考数据，已阻止写入以避免丢档。\n"
-                            + "".join(traceback.format_stack(limit=10))
+                if changed_ids is None:
+                    if not expeditions and self._persisted_ids:
+                        # 调用栈格式化开销较大，仅在日志级别启用时生成
+                        if logger.isEnabledFor(logging.ERROR):
+                            logger.error(
+                                "检测到尝试用空对象覆盖非空科考数据，已阻止写入以避免丢档。\n%s",
+                                "".join(traceback.format_stack(limit=10)),
+                            )
+                        # 缓存中的对象可能已被清空，丢弃以便下次从数据库重新读取
+                        self._expeditions_cache = None
+                        self._dirty_ids.clear()
+                        return None
+                    changed = set(expeditions) | self._persisted_ids
+                else:
+                    changed = set(changed_ids)
+
+                rows: Dict[str, Optional[Tuple[str, Optional[int], bytes]]] = {}
+                for expedition_id in changed:
+                    expedition = expeditions.get(expedition_id)
+                    if expedition is None:
+                        rows[expedition_id] = None
+                        self._persisted_ids.discard(expedition_id)
+                    else:
+                        rows[expedition_id] = (
+                            expedition.get("status", "active"),
+                            expedition.get("end_ts"),
+                            _dumps_json(expedition),
                         )
-                        return
+                        self._persisted_ids.add(expedition_id)
 
-                    logger.warning(
-                        "即将写入空的科考数据（{}）。若非预期清空，请检查调用链。\n" + "".join(traceback.format_stack(limit=8))
-                    )
-                self._atomic_write_json_with_backup(self.expeditions_file, expeditions)
+                self._snapshot_version += 1
+                self._expeditions_cache = expeditions
+                self._dirty_ids.difference_update(changed)
+                return self._snapshot_version, rows
         except Exception as e:
             logger.error(f"保存科考数据失败: {e}")
+            return None
+
+    def _write_expeditions_snapshot(
+        self, snapshot: Optional[Tuple[int, Dict[str, Optional[Tuple[str, Optional[int], bytes]]]]]
+    ) -> None:
+        """将快照交给写库线程；调用方只承担序列化的开销，不等待数据库 I/O"""
+        if snapshot is None:
+            return
+        version, rows = snapshot
+        with self._writer_cond:
+            for expedition_id, row in rows.items():
+                queued = self._write_queue.get(expedition_id)
+                if queued is None or queued[0] < version:
+                    self._write_queue[expedition_id] = (version, row)
+            if self._writer_thread is None or not self._writer_thread.is_alive():
+                self._writer_thread = threading.Thread(
+                    target=self._writer_loop, name="expedition-writer", daemon=True
+                )
+                self._writer_thread.start()
+            self._writer_cond.notify()
+
+    def _writer_loop(self) -> None:
+        """写库线程：每次取走队列中的全部科考，在一个事务中写入"""
+        while True:
+            with self._writer_cond:
+                while not self._write_queue:
+                    self._writer_cond.wait()
+                batch, self._write_queue = self._write_queue, {}
+                self._writer_busy = True
+
+            try:
+                with self._db_write_lock:
+                    upserts: Dict[str, Tuple[str, Optional[int], str]] = {}
+                    deletes: List[str] = []
+                    new_state: Dict[str, Tuple[int, Optional[int]]] = {}
+                    for expedition_id, (version, row) in batch.items():
+                        state = self._row_state.get(expedition_id)
+                        # 已有更新的快照写入时跳过旧快照
+                        if state is not None and state[0] >= version:
+                            continue
+                        if row is None:
+                            deletes.append(expedition_id)
+                            new_state[expedition_id] = (version, None)
+                            continue
+                        status, end_ts, payload = row
+                        payload_hash = hash(payload)
+                        if state is None or state[1] != payload_hash:
+                            upserts[expedition_id] = (status, end_ts, payload.decode("utf-8"))
+                        new_state[expedition_id] = (version, payload_hash)
+
+                    self.expedition_repo.save_many(upserts, deletes)
+                    self._row_state.update(new_state)
+            except Exception as e:
+                logger.error(f"保存科考数据失败: {e}")
+                # 写入失败的科考重新标记为脏，由下一次写库（或停用时的 flush）重试
+                with self._expedition_lock:
+                    self._dirty_ids.update(batch)
+            finally:
+                with self._writer_cond:
+                    self._writer_busy = False
+                    self._writer_cond.notify_all()
+
+    def _history_files_key(self) -> Tuple[Optional[int], Optional[int]]:
+        return self._get_mtime_ns(self.history_file), self._get_mtime_ns(self.history_log_file)
 
     def _load_history(self) -> Dict[str, Any]:
-        """加载科考历史记录"""
-        data = self._safe_load_json_with_backup(self.history_file)
-        if isinstance(data, dict):
-            return data
-        logger.error(f"科考历史文件内容类型异常，期望 dict，实际 {type(data)}")
-        return {}
+        """加载科考历史记录（快照 + 日志回放，后写入的记录覆盖同一用户的旧记录）"""
+        with self._expedition_lock:
+            key = self._history_files_key()
+            if self._history_cache is not None and self._history_cache_key == key:
+                return self._history_cache
+
+            history = self._safe_load_json_with_backup(self.history_file)
+            if not isinstance(history, dict):
+                logger.error(f"科考历史文件内容类型异常，期望 dict，实际 {type(history)}")
+                history = {}
+
+            line_count = 0
+            try:
+                with open(self.history_log_file, "r", encoding="utf-8") as f:
+                    for line in f:
+                        line = line.strip()
+                        if not line:
+                            continue
+                        line_count += 1
+                        try:
+                            entry = _loads_json(line)
+                        except ValueError:
+                            logger.warning("科考历史日志中存在无法解析的行，已跳过")
+                            continue
+                        if isinstance(entry, dict):
+                            history.update(entry)
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                logger.error(f"读取科考历史日志失败: {e}")
+
+            self._history_cache = history
+            self._history_cache_key = key
+            self._history_log_lines = line_count
+            return history
+
+    def _append_history(self, records: Dict[str, Dict[str, Any]]) -> None:
+        """追加用户结算记录 {user_id: record}，同一次结算的所有记录写成一行"""
+        if not records:
+            return
+        try:
+            with self._expedition_lock:
+                history = self._load_history()
+                with open(self.history_log_file, "ab") as f:
+                    f.write(_dumps_json(records) + b"\n")
+                history.update(records)
+                self._history_log_lines += 1
+                self._history_cache_key = self._history_files_key()
+
+                if self._history_log_lines > self._history_compact_threshold:
+                    self._save_history(history)
+        except Exception as e:
+            self._history_cache = None
+            logger.error(f"保存科考历史失败: {e}")
 
     def _save_history(self, history: Dict[str, Any]) -> None:
-        """保存科考历史记录"""
+        """将完整历史写回快照文件并清空追加日志"""
         try:
-            self._atomic_write_json_with_backup(self.history_file, history)
+            with self._expedition_lock:
+                self._atomic_write_json_with_backup(self.history_file, history)
+                try:
+                    os.remove(self.history_log_file)
+                except FileNotFoundError:
+                    pass
+                self._history_cache = history
+                self._history_cache_key = self._history_files_key()
+                self._history_log_lines = 0
         except Exception as e:
+            self._history_cache = None
             logger.error(f"保存科考历史失败: {e}")
 
     def _safe_load_json_with_backup(self, path: str) -> Any:
@@ -109,23 +462,32 @@ class ExpeditionService:
         return {}
 
     def _try_load_json(self, path: str) -> Any:
-        if not os.path.exists(path):
-            return None
+        # 一次 stat 同时判断文件是否存在与是否为空
         try:
-            if os.path.getsize(path) <= 0:
+            if os.stat(path).st_size <= 0:
                 return {}
-        except Exception:
+        except FileNotFoundError:
+            return None
+        except OSError:
             pass
 
         try:
-            with open(path, "r", encoding="utf-8") as f:
-                return json.load(f)
+            with open(path, "rb") as f:
+                return _loads_json(f.read())
         except Exception as e:
             logger.error(f"读取JSON失败: {path} - {e}")
             return None
 
-    def _atomic_write_json_with_backup(self, path: str, data: Any) -> None:
-        """原子写 JSON，并维护一个 .bak 备份，避免写入中断导致文件被截断。"""
+    def _fsync_if_enabled(self, f) -> None:
+        if self._fsync_on_write:
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _atomic_write_json_with_backup(self, path: str, data: Any, payload: Optional[bytes] = None) -> None:
+        """原子写 JSON，并维护一个 .bak 备份，避免写入中断导致文件被截断。
+
+        payload 为已序列化好的 JSON 字节串时直接写入，否则序列化 data。
+        """
         directory = os.path.dirname(path)
         os.makedirs(directory, exist_ok=True)
 
@@ -133,31 +495,45 @@ class ExpeditionService:
         bak_path = f"{path}.bak"
         bak_tmp_path = f"{bak_path}.tmp"
 
-        payload = json.dumps(data, ensure_ascii=False, indent=2)
-
         # 先备份当前主文件内容（如果存在且可读）
         try:
             if os.path.exists(path):
                 with open(path, "rb") as src:
                     existing = src.read()
+                # 主文件内容与待写入内容一致时，备份和主文件都无需重写
+                if payload is not None and len(existing) == len(payload) and existing == payload:
+                    return
                 if existing:
                     with open(bak_tmp_path, "wb") as bf:
                         bf.write(existing)
-                        bf.flush()
-                        os.fsync(bf.fileno())
+                        self._fsync_if_enabled(bf)
                     os.replace(bak_tmp_path, bak_path)
         except Exception as e:
             logger.warning(f"写入备份失败（将继续保存主文件）: {e}")
 
-        # 原子写主文件
-        with open(tmp_path, "w", encoding="utf-8") as f:
-            f.write(payload)
-            f.flush()
-            os.fsync(f.fileno())
+        # 原子写主文件：先写临时文件再替换
+        try:
+            if payload is None and orjson is None:
+                # 标准库 json 直接流式序列化到临时文件，不额外生成完整的字符串副本
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+                    self._fsync_if_enabled(f)
+            else:
+                if payload is None:
+                    payload = _dumps_json(data)
+                with open(tmp_path, "wb") as f:
+                    f.write(payload)
+                    self._fsync_if_enabled(f)
+        except Exception:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
         os.replace(tmp_path, path)
 
     def _prune_storage_to_current_and_last(self) -> None:
-        """仅保留所有进行中的科考，以及“每个队长”最近一条已结束科考。
+        """仅保留所有进行中的科考，以及“每个队长”最近一条已结束科考（启动时执行一次）。
 
         说明：如果只保留全局最新一条 ended，当多个队伍并行/先后结算时，
         其他队伍的 ended 会被清掉，造成“科考状态查不到上次结果”的体验。
@@ -174,11 +550,8 @@ class ExpeditionService:
                     if exp.get("status", "active") != "ended":
                         continue
                     creator_id = exp.get("creator_id") or "unknown"
-                    ended_at_str = exp.get("ended_at") or exp.get("end_time")
-                    try:
-                        ended_at = datetime.strptime(ended_at_str, "%Y-%m-%d %H:%M:%S") if ended_at_str else datetime.min
-                    except Exception:
-                        ended_at = datetime.min
+                    # "%Y-%m-%d %H:%M:%S" 定长补零，字符串序即时间序，无需 strptime
+                    ended_at = exp.get("ended_at") or exp.get("end_time") or ""
                     ended_by_creator.setdefault(creator_id, []).append((exp_id, ended_at))
 
                 # 对每个队长：仅保留最新一条 ended
@@ -196,28 +569,36 @@ class ExpeditionService:
                 for exp_id in to_delete:
                     expeditions.pop(exp_id, None)
 
-                self._save_expeditions(expeditions)
+                self._save_expeditions(expeditions, to_delete)
         except Exception as e:
             logger.error(f"修剪科考存储失败: {e}")
 
     def _record_user_expedition_result(self, user_id: str, expedition: Dict[str, Any], reward: Dict[str, Any]) -> None:
-        """记录用户的科考结算结果"""
-        history = self._load_history()
-        
-        type_names = {"short": "探险", "medium": "征服", "long": "圣域"}
-        
-        history[user_id] = {
-            "expedition_id": expedition.get("expedition_id", "unknown"),
-            "expedition_type": type_names.get(expedition.get("type", ""), expedition.get("type", "")),
-            "completion_rate": expedition.get("total_progress", 0),
-            "contribution": reward.get("contribution", 0),
-            "coins_reward": reward.get("coins", 0),
-            "premium_reward": reward.get("premium", 0),
-            "settled_at": get_now().strftime("%Y-%m-%d %H:%M:%S")
+        """记录单个用户的科考结算结果"""
+        self._record_user_expedition_results(expedition, {user_id: reward})
+
+    def _record_user_expedition_results(self, expedition: Dict[str, Any], rewards_by_user: Dict[str, Dict[str, Any]]) -> None:
+        """批量记录一次结算中所有用户的结果，只追加一次历史日志"""
+        expedition_id = expedition.get("expedition_id", "unknown")
+        expedition_type = _TYPE_NAMES.get(expedition.get("type", ""), expedition.get("type", ""))
+        completion_rate = expedition.get("total_progress", 0)
+        settled_at = get_now().strftime("%Y-%m-%d %H:%M:%S")
+
+        records = {
+            user_id: {
+                "expedition_id": expedition_id,
+                "expedition_type": expedition_type,
+                "completion_rate": completion_rate,
+                "contribution": reward.get("contribution", 0),
+                "coins_reward": reward.get("coins", 0),
+                "premium_reward": reward.get("premium", 0),
+                "settled_at": settled_at
+            }
+            for user_id, reward in rewards_by_user.items()
         }
-        
-        self._save_history(history)
-        logger.info(f"已保存用户 {user_id} 的科考结算记录")
+
+        self._append_history(records)
+        logger.info(f"已保存科考 {expedition_id} 的 {len(records)} 条用户结算记录")
 
     def _generate_expedition_id(self) -> str:
         """生成科考ID"""
@@ -259,35 +640,10 @@ class ExpeditionService:
         if self.get_user_expedition(creator_id):
             return {"success": False, "message": "你已经在另一个科考队伍中了"}
 
-        # 确定科考参数
-        type_config = {
-            "short": {
-                "duration_hours": 24, 
-                "targets": 100, 
-                "base_reward": 100,
-                "required_item_id": 35,  # 探险许可证
-                "join_cost": 1000000  # 100w金币
-            },
-            "medium": {
-                "duration_hours": 48, 
-                "targets": 500, 
-                "base_reward": 500,
-                "required_item_id": 36,  # 征服许可证
-                "join_cost": 5000000  # 500w金币
-            },
-            "long": {
-                "duration_hours": 72, 
-                "targets": 1000, 
-                "base_reward": 1000,
-                "required_item_id": 37,  # 圣域许可证
-                "join_cost": 10000000  # 1000w金币
-            },
-        }
-
-        if expedition_type not in type_config:
+        if expedition_type not in _TYPE_CONFIG:
             return {"success": False, "message": "科考类型错误，请使用：探险、征服或圣域"}
 
-        config = type_config[expedition_type]
+        config = _TYPE_CONFIG[expedition_type]
 
         # 检查并消耗许可证
         required_item_id = config["required_item_id"]
@@ -307,22 +663,18 @@ class ExpeditionService:
         
         # 随机选择5种目标鱼（1-5星各一种）
         targets = {}
-        # 4星和5星鱼的特殊目标数量
-        four_star_targets = {"short": 50, "medium": 100, "long": 500}
-        five_star_targets = {"short": 10, "medium": 50, "long": 100}
-        
-        for rarity in range(1, 6):
+        for rarity, target_key in enumerate(_STAR_KEYS, start=1):
             fish = self._select_random_fish(rarity)
             if fish:
                 # 4星和5星鱼使用特殊的目标数量，其他星级使用通用配置
                 if rarity == 5:
-                    required_count = five_star_targets[expedition_type]
+                    required_count = _FIVE_STAR_TARGETS[expedition_type]
                 elif rarity == 4:
-                    required_count = four_star_targets[expedition_type]
+                    required_count = _FOUR_STAR_TARGETS[expedition_type]
                 else:
                     required_count = config["targets"]
                     
-                targets[f"{rarity}_star"] = {
+                targets[target_key] = {
                     "fish_id": fish["fish_id"],
                     "fish_name": fish["fish_name"],
                     "rarity": rarity,
@@ -342,23 +694,22 @@ class ExpeditionService:
             "type": expedition_type,
             "start_time": now.strftime("%Y-%m-%d %H:%M:%S"),
             "end_time": end_time.strftime("%Y-%m-%d %H:%M:%S"),
+            "end_ts": int(end_time.replace(microsecond=0).timestamp()),
             "creator_id": creator_id,
             "creator_name": user.nickname or f"渔夫{creator_id[-4:]}",
             "base_reward": config["base_reward"],
             "join_cost": config["join_cost"],  # 保存入场费用
             "targets": targets,
+            # 目标鱼ID -> 目标键；JSON 对象键只能是字符串，统一使用 str(fish_id)
+            "target_fish_id_to_key": {str(t["fish_id"]): key for key, t in targets.items()},
+            "total_caught": 0,
+            "total_required": sum(t["required"] for t in targets.values()),
             "participants": {
                 creator_id: {
                     "user_id": creator_id,
                     "nickname": user.nickname or f"渔夫{creator_id[-4:]}",
                     "joined_at": now.strftime("%Y-%m-%d %H:%M:%S"),
-                    "contribution": {
-                        "1_star": 0,
-                        "2_star": 0,
-                        "3_star": 0,
-                        "4_star": 0,
-                        "5_star": 0
-                    }
+                    "contribution": _ZERO_CONTRIB.copy()
                 }
             },
             "total_progress": 0.0,
@@ -398,23 +749,19 @@ class ExpeditionService:
                     "user_id": user_id,
                     "nickname": invited_user.nickname or f"渔夫{user_id[-4:]}",
                     "joined_at": now.strftime("%Y-%m-%d %H:%M:%S"),
-                    "contribution": {
-                        "1_star": 0,
-                        "2_star": 0,
-                        "3_star": 0,
-                        "4_star": 0,
-                        "5_star": 0
-                    }
+                    "contribution": _ZERO_CONTRIB.copy()
                 }
 
         # 保存科考数据
         with self._expedition_lock:
             expeditions = self._load_expeditions()
             expeditions[expedition_id] = expedition
-            self._save_expeditions(expeditions)
+            snapshot = self._snapshot_expeditions(expeditions, [expedition_id])
+            self._index_add_participants(expeditions, expedition)
+        self._write_expeditions_snapshot(snapshot)
 
         # 安排一次性自动结算
-        self._schedule_settlement(expedition_id, expedition["end_time"])
+        self._schedule_settlement(expedition_id, expedition["end_ts"])
 
         # 生成目标鱼列表文本
         targets_text = "\n".join([
@@ -422,11 +769,9 @@ class ExpeditionService:
             for t in targets.values()
         ])
 
-        type_names = {"short": "探险", "medium": "征服", "long": "圣域"}
-        
         # 构建返回消息
         success_count = len(expedition["participants"]) - 1  # 减去队长
-        message = (f"🔬 {type_names[expedition_type]}科考已发起！\n"
+        message = (f"🔬 {_TYPE_NAMES[expedition_type]}科考已发起！\n"
                   f"📋 邀请码：{expedition_id}\n"
                   f"⏰ 截止时间：{end_time.strftime('%m-%d %H:%M')}\n"
                   f"💰 参与费用：{config['join_cost']:,}金币\n"
@@ -474,10 +819,7 @@ class ExpeditionService:
                 return {"success": False, "message": "该科考已结束"}
 
             # 检查是否已过期
-            end_time = datetime.strptime(expedition["end_time"], "%Y-%m-%d %H:%M:%S")
-            now = get_now()
-            
-            if now > end_time:
+            if get_now().timestamp() > self._get_end_ts(expedition):
                 return {"success": False, "message": "该科考已过期"}
 
             # 检查是否已在队伍中
@@ -498,26 +840,22 @@ class ExpeditionService:
                 "user_id": user_id,
                 "nickname": user.nickname or f"渔夫{user_id[-4:]}",
                 "joined_at": now.strftime("%Y-%m-%d %H:%M:%S"),
-                "contribution": {
-                    "1_star": 0,
-                    "2_star": 0,
-                    "3_star": 0,
-                    "4_star": 0,
-                    "5_star": 0
-                }
+                "contribution": _ZERO_CONTRIB.copy()
             }
 
-            # 保存
-            expeditions[expedition_id] = expedition
-            self._save_expeditions(expeditions)
+            # 保存（锁内只生成快照，写盘在锁外进行）
+            snapshot = self._snapshot_expeditions(expeditions, [expedition_id])
+            self._get_user_index(expeditions)[user_id] = expedition_id
+            member_count = len(expedition["participants"])
 
-            return {
-                "success": True,
-                "message": f"✅ 成功加入科考队伍！\n"
-                          f"队长：{expedition['creator_name']}\n"
-                          f"当前成员：{len(expedition['participants'])}人\n"
-                          f"💸 支付了 {join_cost:,} 金币"
-            }
+        self._write_expeditions_snapshot(snapshot)
+        return {
+            "success": True,
+            "message": f"✅ 成功加入科考队伍！\n"
+                      f"队长：{expedition['creator_name']}\n"
+                      f"当前成员：{member_count}人\n"
+                      f"💸 支付了 {join_cost:,} 金币"
+        }
 
     def leave_expedition(self, user_id: str) -> Dict[str, Any]:
         """退出科考队伍"""
@@ -533,28 +871,124 @@ class ExpeditionService:
                 return {"success": False, "message": "队长不能退出科考，请使用 /结束科考 来结束考察"}
 
             # 移除成员（保留贡献记录）
+            snapshot = None
             expeditions = self._load_expeditions()
             if expedition_id in expeditions:
                 if user_id in expeditions[expedition_id]["participants"]:
                     del expeditions[expedition_id]["participants"][user_id]
-                    self._save_expeditions(expeditions)
-
-            return {"success": True, "message": "已退出科考队伍（你的贡献已保留，但不会获得最终奖励）"}
+                    snapshot = self._snapshot_expeditions(expeditions, [expedition_id])
+                    self._get_user_index(expeditions).pop(user_id, None)
+
+        self._write_expeditions_snapshot(snapshot)
+        return {"success": True, "message": "已退出科考队伍（你的贡献已保留，但不会获得最终奖励）"}
+
+    def _get_user_index(self, expeditions: Dict[str, Any]) -> Dict[str, str]:
+        """获取成员索引；缓存的科考字典被替换（如从磁盘重新加载）时重建"""
+        if self._user_index_owner is not expeditions:
+            index: Dict[str, str] = {}
+            for exp_id, exp in expeditions.items():
+                if exp.get("status") == "active":
+                    for uid in exp.get("participants", {}):
+                        index[uid] = exp_id
+            self._user_index = index
+            self._user_index_owner = expeditions
+        return self._user_index
+
+    def _index_add_participants(self, expeditions: Dict[str, Any], expedition: Dict[str, Any]) -> None:
+        index = self._get_user_index(expeditions)
+        for uid in expedition["participants"]:
+            index[uid] = expedition["expedition_id"]
+
+    def _index_remove_participants(self, expeditions: Dict[str, Any], expedition: Dict[str, Any]) -> None:
+        index = self._get_user_index(expeditions)
+        expedition_id = expedition["expedition_id"]
+        for uid in expedition["participants"]:
+            if index.get(uid) == expedition_id:
+                del index[uid]
+        self._progress_last_ts.pop(expedition_id, None)
+
+    def _get_last_ended_index(self, expeditions: Dict[str, Any]) -> Dict[str, str]:
+        """获取每个队长最近一条已结束科考的索引；缓存的科考字典被替换时重建"""
+        if self._last_ended_owner is not expeditions:
+            newest: Dict[str, Tuple[str, str]] = {}
+            for exp_id, exp in expeditions.items():
+                if exp.get("status", "active") != "ended":
+                    continue
+                creator_id = exp.get("creator_id") or "unknown"
+                # 时间字符串格式固定，可直接按字符串比较先后
+                ended_at = exp.get("ended_at") or exp.get("end_time") or ""
+                if creator_id not in newest or ended_at > newest[creator_id][1]:
+                    newest[creator_id] = (exp_id, ended_at)
+            self._last_ended_by_creator = {creator_id: v[0] for creator_id, v in newest.items()}
+            self._last_ended_owner = expeditions
+        return self._last_ended_by_creator
+
+    def _replace_last_ended(self, expeditions: Dict[str, Any], expedition: Dict[str, Any]) -> List[str]:
+        """记录刚结束的科考，并删除同一队长的上一条已结束科考；返回需要写盘的科考ID"""
+        index = self._get_last_ended_index(expeditions)
+        expedition_id = expedition["expedition_id"]
+        creator_id = expedition.get("creator_id") or "unknown"
+        previous_id = index.get(creator_id)
+        index[creator_id] = expedition_id
+        if previous_id and previous_id != expedition_id:
+            expeditions.pop(previous_id, None)
+            return [expedition_id, previous_id]
+        return [expedition_id]
+
+    def _get_end_ts(self, expedition: Dict[str, Any]) -> int:
+        """获取科考截止时间戳；旧数据没有 end_ts 时解析 end_time 并回填"""
+        end_ts = expedition.get("end_ts")
+        if end_ts is None:
+            end_ts = int(datetime.strptime(expedition["end_time"], "%Y-%m-%d %H:%M:%S").timestamp())
+            expedition["end_ts"] = end_ts
+        return end_ts
 
     def get_user_expedition(self, user_id: str) -> Optional[Dict[str, Any]]:
         """获取用户当前参与的科考"""
-        expeditions = self._load_expeditions()
-        for exp in expeditions.values():
-            if user_id in exp["participants"] and exp["status"] == "active":
+        with self._expedition_lock:
+            expeditions = self._load_expeditions()
+            expedition_id = self._get_user_index(expeditions).get(user_id)
+            if not expedition_id:
+                return None
+            exp = expeditions.get(expedition_id)
+            if exp and exp["status"] == "active" and user_id in exp["participants"]:
                 return exp
-        return None
+            return None
+
+    def is_user_in_expedition(self, user_id: str) -> bool:
+        """O(1) 判断用户是否在进行中的科考里（仅查成员索引，不做其它校验）。
+        索引已基于当前缓存建立时不加锁直接读取，事件循环上的调用不会等待持锁结算的写库操作"""
+        expeditions = self._expeditions_cache
+        if expeditions is not None and self._user_index_owner is expeditions:
+            return user_id in self._user_index
+        with self._expedition_lock:
+            return user_id in self._get_user_index(self._load_expeditions())
+
+    def _recompute_progress(self, expedition: Dict[str, Any]) -> None:
+        """按成员贡献完整重算各目标完成数、累计值与总进度"""
+        for target_key, target in expedition["targets"].items():
+            total_caught = sum(
+                participant["contribution"].get(target_key, 0)
+                for participant in expedition["participants"].values()
+            )
+            target["caught"] = min(total_caught, target["required"])
+
+        total_caught = sum(t["caught"] for t in expedition["targets"].values())
+        total_required = sum(t["required"] for t in expedition["targets"].values())
+        expedition["total_caught"] = total_caught
+        expedition["total_required"] = total_required
+        expedition["total_progress"] = total_caught / total_required if total_required > 0 else 0
 
-    def update_expedition_progress(self, expedition_id: str) -> Dict[str, Any]:
+    def update_expedition_progress(self, expedition_id: str, min_interval: float = 0) -> Dict[str, Any]:
         """
         更新科考进度（重新汇总）
 
         说明：科考贡献已改为“出售鱼类时”写入 participants[*].contribution。
         因此这里不再从钓鱼记录/统计表重算贡献，只做一次汇总（用于定时任务、查看状态、结算前校正）。
+
+        Args:
+            expedition_id: 科考ID
+            min_interval: 距上次汇总不足该秒数时跳过，用于合并多名成员同时查看状态触发的重复汇总
         
         Returns:
             更新结果信息
@@ -564,22 +998,18 @@ class ExpeditionService:
             if expedition_id not in expeditions:
                 return {"success": False, "message": "科考不存在"}
 
+            now = time.monotonic()
+            last_ts = self._progress_last_ts.get(expedition_id)
+            if min_interval > 0 and last_ts is not None and now - last_ts < min_interval:
+                return {"success": True, "message": "科考进度已是最新"}
+            self._progress_last_ts[expedition_id] = now
+
             expedition = expeditions[expedition_id]
 
             # 重新计算总进度（只汇总已记录的贡献）
-            for target_key, target in expedition["targets"].items():
-                total_caught = sum(
-                    participant["contribution"].get(target_key, 0)
-                    for participant in expedition["participants"].values()
-                )
-                target["caught"] = min(total_caught, target["required"])
-
-            total_caught = sum(t["caught"] for t in expedition["targets"].values())
-            total_required = sum(t["required"] for t in expedition["targets"].values())
-            expedition["total_progress"] = total_caught / total_required if total_required > 0 else 0
+            self._recompute_progress(expedition)
 
-            expeditions[expedition_id] = expedition
-            self._save_expeditions(expeditions)
+            self._mark_dirty_and_schedule_flush(expedition_id)
 
         logger.info(
             f"科考 {expedition_id} 进度已汇总完成，总进度：{expedition['total_progress']*100:.1f}%"
@@ -613,9 +1043,7 @@ class ExpeditionService:
             expedition = expeditions[expedition_id]
             
             # 检查科考是否已经结束
-            now = get_now()
-            end_time = datetime.strptime(expedition["end_time"], "%Y-%m-%d %H:%M:%S")
-            if now > end_time:
+            if get_now().timestamp() > self._get_end_ts(expedition):
                 return None  # 科考已结束，不再接受进度更新
             
             # 初始化稀有鱼记录
@@ -624,19 +1052,29 @@ class ExpeditionService:
             if user_id not in expedition["rare_fish_caught"]:
                 expedition["rare_fish_caught"][user_id] = []
 
-            # 构建目标鱼ID映射
-            target_fish_ids = {target["fish_id"]: key for key, target in expedition["targets"].items()}
+            # 目标鱼ID映射与进度累计值在创建时生成，旧数据在此补齐
+            target_fish_ids = expedition.get("target_fish_id_to_key")
+            if target_fish_ids is None:
+                target_fish_ids = {str(t["fish_id"]): key for key, t in expedition["targets"].items()}
+                expedition["target_fish_id_to_key"] = target_fish_ids
+            if "total_caught" not in expedition or "total_required" not in expedition:
+                self._recompute_progress(expedition)
 
             # 检查出售的鱼中是否有目标鱼
             updated_targets = {}  # 记录更新的目标鱼 {fish_name: {quantity: X, progress: "X/Y"}}
             has_target_update = False
             has_rare_update = False
 
+            # 一次查询取回所有出售鱼的模板
+            fish_templates = self.item_template_repo.get_fishes_by_ids(
+                [fish_id for fish_id, quantity in sold_fish.items() if quantity and quantity > 0]
+            )
+
             for fish_id, quantity in sold_fish.items():
                 if not quantity or quantity <= 0:
                     continue
 
-                fish_template = self.item_template_repo.get_fish_by_id(fish_id)
+                fish_template = fish_templates.get(fish_id)
                 fish_rarity = getattr(fish_template, "rarity", None)
 
                 # 记录6~10星稀有鱼（用于结算事件池），改为“出售触发”写入
@@ -644,12 +1082,18 @@ class ExpeditionService:
                     expedition["rare_fish_caught"][user_id].extend([fish_id] * quantity)
                     has_rare_update = True
 
-                if fish_id in target_fish_ids:
-                    target_key = target_fish_ids[fish_id]
+                target_key = target_fish_ids.get(str(fish_id))
+                if target_key is not None:
                     current_contribution = expedition["participants"][user_id]["contribution"].get(target_key, 0)
                     expedition["participants"][user_id]["contribution"][target_key] = current_contribution + quantity
                     has_target_update = True
 
+                    # 增量更新目标完成数与累计值，避免每次出售都重新汇总所有成员贡献
+                    target = expedition["targets"][target_key]
+                    new_caught = min(target["caught"] + quantity, target["required"])
+                    expedition["total_caught"] += new_caught - target["caught"]
+                    target["caught"] = new_caught
+
                     fish_name = fish_template.name if fish_template else f"鱼{fish_id}"
                     updated_targets[fish_name] = {
                         "quantity": quantity,
@@ -660,22 +1104,13 @@ class ExpeditionService:
             if not has_target_update and not has_rare_update:
                 return None
             
-            # 仅当目标鱼贡献变化时才需要重新计算进度
+            # 仅当目标鱼贡献变化时才需要更新进度（已在循环中增量累加）
             if has_target_update:
-                for target_key, target in expedition["targets"].items():
-                    total_caught = sum(
-                        participant["contribution"].get(target_key, 0)
-                        for participant in expedition["participants"].values()
-                    )
-                    target["caught"] = min(total_caught, target["required"])
-
-                total_caught = sum(t["caught"] for t in expedition["targets"].values())
-                total_required = sum(t["required"] for t in expedition["targets"].values())
-                expedition["total_progress"] = total_caught / total_required if total_required > 0 else 0
+                total_required = expedition["total_required"]
+                expedition["total_progress"] = expedition["total_caught"] / total_required if total_required > 0 else 0
             
             # 保存更新
-            expeditions[expedition_id] = expedition
-            self._save_expeditions(expeditions)
+            self._mark_dirty_and_schedule_flush(expedition_id)
         
         # 若没有目标鱼更新，则只记录稀有鱼池，不向外层提示
         if not has_target_update:
@@ -693,80 +1128,62 @@ class ExpeditionService:
 
         return {"updated": True, "targets": updated_targets, "total_progress": expedition["total_progress"]}
 
+    def _format_history_lines(self, user_history: Dict[str, Any]) -> List[str]:
+        """格式化用户上次科考结算记录"""
+        return [
+            "📜 上次科考结算记录",
+            "━━━━━━━━━━━━━━━━━━━━",
+            f"🔬 类型：{user_history['expedition_type']}",
+            f"📊 完成度：{user_history['completion_rate'] * 100:.1f}%",
+            f"🎯 贡献：{user_history['contribution']}条",
+            f"💰 金币奖励：{user_history['coins_reward']:,}",
+            f"💎 钻石奖励：{user_history['premium_reward']}",
+            f"⏰ 结算时间：{user_history['settled_at']}",
+        ]
+
     def get_expedition_status(self, user_id: str) -> Dict[str, Any]:
         """获取用户当前科考的详细状态"""
-        # 加载历史记录
-        history = self._load_history()
-        user_history = history.get(user_id)
-        
-        # 获取当前科考
+        # 获取当前科考（成员索引查找）
         expedition = self.get_user_expedition(user_id)
-        
+
+        # 如果科考已超时，自动结算并返回结算信息（不再依赖队长触发）
+        if expedition:
+            remaining_seconds = self._get_end_ts(expedition) - get_now().timestamp()
+            if remaining_seconds < 0:
+                expedition_id = expedition["expedition_id"]
+                logger.info(f"科考 {expedition_id} 已超时，用户 {user_id} 查看状态时触发自动结算")
+                settle_result = self._settle_expedition(expedition_id, manual=False)
+
+                # 结算后再读取历史记录，确保本次结算被读取
+                user_history_after = self._load_history().get(user_id)
+                combined_parts = []
+                if user_history_after:
+                    combined_parts.extend(self._format_history_lines(user_history_after))
+                    combined_parts.append("")
+                # 追加这次结算报告
+                combined_parts.append(settle_result.get("message", ""))
+                return {
+                    "success": True,
+                    "message": "\n".join(combined_parts)
+                }
+
+        # 常规路径：历史记录与当前科考均来自内存缓存
+        user_history = self._load_history().get(user_id)
+
         # 如果既没有历史记录也不在科考中
         if not user_history and not expedition:
             return {"success": False, "message": "你还没有参加过任何科考"}
-        
-        message_parts = []
-        
+
         # 显示上次科考结算记录
-        if user_history:
-            message_parts.append("📜 上次科考结算记录")
-            message_parts.append("━━━━━━━━━━━━━━━━━━━━")
-            message_parts.append(f"🔬 类型：{user_history['expedition_type']}")
-            message_parts.append(f"📊 完成度：{user_history['completion_rate'] * 100:.1f}%")
-            message_parts.append(f"🎯 贡献：{user_history['contribution']}条")
-            message_parts.append(f"💰 金币奖励：{user_history['coins_reward']:,}")
-            message_parts.append(f"💎 钻石奖励：{user_history['premium_reward']}")
-            message_parts.append(f"⏰ 结算时间：{user_history['settled_at']}")
-        
+        history_text = "\n".join(self._format_history_lines(user_history)) if user_history else ""
+
         # 如果当前不在科考中，只返回历史记录
         if not expedition:
             return {
                 "success": True,
-                "message": "\n".join(message_parts)
-            }
-        
-        # 如果有历史记录，添加分隔符
-        if user_history:
-            message_parts.append("")
-            message_parts.append("")
-        
-        expedition_id = expedition["expedition_id"]
-        
-        # 检查科考是否已经超时
-        end_time = datetime.strptime(expedition["end_time"], "%Y-%m-%d %H:%M:%S")
-        now = get_now()
-        
-        # 如果科考已超时，自动结算并返回结算信息（不再依赖队长触发）
-        if now > end_time:
-            logger.info(f"科考 {expedition_id} 已超时，用户 {user_id} 查看状态时触发自动结算")
-            settle_result = self._settle_expedition(expedition_id, manual=False)
-            
-            # 结算后重新加载历史记录，确保本次结算被读取
-            history_after = self._load_history()
-            user_history_after = history_after.get(user_id)
-            combined_parts = []
-            if user_history_after:
-                combined_parts.append("📜 上次科考结算记录")
-                combined_parts.append("━━━━━━━━━━━━━━━━━━━━")
-                combined_parts.append(f"🔬 类型：{user_history_after['expedition_type']}")
-                combined_parts.append(f"📊 完成度：{user_history_after['completion_rate'] * 100:.1f}%")
-                combined_parts.append(f"🎯 贡献：{user_history_after['contribution']}条")
-                combined_parts.append(f"💰 金币奖励：{user_history_after['coins_reward']:,}")
-                combined_parts.append(f"💎 钻石奖励：{user_history_after['premium_reward']}")
-                combined_parts.append(f"⏰ 结算时间：{user_history_after['settled_at']}")
-                combined_parts.append("")
-            # 追加这次结算报告
-            combined_parts.append(settle_result.get("message", ""))
-            return {
-                "success": True,
-                "message": "\n".join(combined_parts)
+                "message": history_text
             }
 
-        # 显示当前科考状态
-        message_parts.append(f"🔬 当前科考状态 [{expedition['expedition_id']}]")
-        message_parts.append("━━━━━━━━━━━━━━━━━━━━")
-        
         # 格式化目标鱼信息
         targets_info = []
         for target in expedition["targets"].values():
@@ -779,39 +1196,40 @@ class ExpeditionService:
                 f"  {'⭐' * target['rarity']} {target['fish_name']}: "
                 f"{bar} {target['caught']}/{target['required']} ({progress_pct:.0f}%)"
             )
+        targets_text = "\n".join(targets_info)
+
+        # 格式化成员贡献（前5名）
+        totals = [(sum(p["contribution"].values()), p["nickname"]) for p in expedition["participants"].values()]
+        participants_text = "\n".join(
+            f"  {nickname}: {total_contrib}条"
+            for total_contrib, nickname in heapq.nlargest(5, totals, key=lambda x: x[0])
+        )
 
-        # 格式化成员贡献
-        participants_info = []
-        for p in sorted(
-            expedition["participants"].values(),
-            key=lambda x: sum(x["contribution"].values()),
-            reverse=True
-        ):
-            total_contrib = sum(p["contribution"].values())
-            participants_info.append(f"  {p['nickname']}: {total_contrib}条")
-
-        type_names = {"short": "探险", "medium": "征服", "long": "圣域"}
-        
         # 计算剩余时间
-        remaining = end_time - now
-        hours = int(remaining.total_seconds() / 3600)
-        minutes = int((remaining.total_seconds() % 3600) / 60)
-
-        message_parts.append(f"📋 类型：{type_names.get(expedition['type'], expedition['type'])}")
-        message_parts.append(f"👑 队长：{expedition['creator_name']}")
-        message_parts.append(f"👥 成员：{len(expedition['participants'])}人")
-        message_parts.append(f"⏰ 剩余时间：{hours}小时{minutes}分钟")
-        message_parts.append(f"📊 总进度：{expedition['total_progress'] * 100:.1f}%")
-        message_parts.append("")
-        message_parts.append("🎯 目标鱼类：")
-        message_parts.extend(targets_info)
-        message_parts.append("")
-        message_parts.append("👤 贡献排行：")
-        message_parts.extend(participants_info[:5])
+        hours, rest = divmod(int(remaining_seconds), 3600)
+        minutes = rest // 60
+
+        # 显示当前科考状态
+        status_text = (
+            f"🔬 当前科考状态 [{expedition['expedition_id']}]\n"
+            f"━━━━━━━━━━━━━━━━━━━━\n"
+            f"📋 类型：{_TYPE_NAMES.get(expedition['type'], expedition['type'])}\n"
+            f"👑 队长：{expedition['creator_name']}\n"
+            f"👥 成员：{len(expedition['participants'])}人\n"
+            f"⏰ 剩余时间：{hours}小时{minutes}分钟\n"
+            f"📊 总进度：{expedition['total_progress'] * 100:.1f}%\n"
+            f"\n"
+            f"🎯 目标鱼类：\n"
+            f"{targets_text}\n"
+            f"\n"
+            f"👤 贡献排行：\n"
+            f"{participants_text}"
+        )
 
         return {
             "success": True,
-            "message": "\n".join(message_parts)
+            # 有历史记录时，与当前状态之间空两行
+            "message": f"{history_text}\n\n\n{status_text}" if history_text else status_text
         }
 
     def test_complete_expedition(self, user_id: str) -> Dict[str, Any]:
@@ -834,11 +1252,12 @@ class ExpeditionService:
                 target["caught"] = target["required"]
             
             # 设置总进度为100%
+            exp["total_caught"] = sum(t["required"] for t in exp["targets"].values())
+            exp["total_required"] = exp["total_caught"]
             exp["total_progress"] = 1.0
             
             # 保存修改
-            expeditions[expedition_id] = exp
-            self._save_expeditions(expeditions)
+            self._save_expeditions(expeditions, [expedition_id])
         
         logger.info(f"管理员 {user_id} 将科考 {expedition_id} 强制设置为100%完成")
         
@@ -870,49 +1289,46 @@ class ExpeditionService:
             if expedition.get("status") == "ended":
                 return {"success": True, "message": expedition.get("settlement_report", "科考已结算")}
             
-            # 在结算前强制汇总一次进度，确保包含最新的出售贡献
+            # 在结算前强制汇总一次进度，确保包含最新的出售贡献；
+            # 直接在已加载的字典上重算，随本次结算一并写盘
             logger.info(f"科考 {expedition_id} 结算前强制更新进度")
-            self.update_expedition_progress(expedition_id)
-            # 重新加载最新数据
-            expeditions = self._load_expeditions()
-            expedition = expeditions[expedition_id]
+            self._recompute_progress(expedition)
             
-            # 计算总贡献
-            total_contribution = 0
-            for participant in expedition["participants"].values():
-                total_contribution += sum(participant["contribution"].values())
+            # 计算各成员及队伍总贡献（每人只求和一次，后续发奖直接查表）
+            contribution_totals = {
+                user_id: sum(participant["contribution"].values())
+                for user_id, participant in expedition["participants"].items()
+            }
+            total_contribution = sum(contribution_totals.values())
 
             if total_contribution == 0:
                 # 没有任何贡献：仍记录结算历史（贡献/奖励均为0），便于队长和成员查询“上次科考”
-                completion_rate = expedition.get("total_progress", 0)
-                for user_id, participant in expedition["participants"].items():
-                    reward_stub = {
+                self._record_user_expedition_results(expedition, {
+                    user_id: {
                         "nickname": participant.get("nickname", ""),
                         "contribution": 0,
                         "coins": 0,
                         "premium": 0,
                     }
-                    self._record_user_expedition_result(user_id, expedition, reward_stub)
+                    for user_id, participant in expedition["participants"].items()
+                })
                 # 标记为已结束并保留记录，不删除
-                expedition["status"] = "ended"
-                expedition["ended_at"] = get_now().strftime("%Y-%m-%d %H:%M:%S")
-                expeditions[expedition_id] = expedition
-                self._save_expeditions(expeditions)
-                # 修剪：仅保留进行中和最近一条已结束科考
-                self._prune_storage_to_current_and_last()
+                ended = {"status": "ended", "ended_at": get_now().strftime("%Y-%m-%d %H:%M:%S")}
+                self._commit_settlement(dict(expedition, **ended), {})
+                expedition.update(ended)
+                self._index_remove_participants(expeditions, expedition)
+                # 每个队长仅保留最近一条已结束科考
+                self._save_expeditions(expeditions, self._replace_last_ended(expeditions, expedition))
                 return {
                     "success": True,
                     "message": "科考已结束（无人贡献，无奖励发放）"
                 }
 
-            # 检查星级完成度并触发事件
-            completed_rarities = []
-            for target_key, target in expedition["targets"].items():
-                if target["caught"] >= target["required"]:
-                    completed_rarities.append(target["rarity"])
-            
-            # 去重并排序
-            completed_rarities = sorted(set(completed_rarities))
+            # 检查星级完成度并触发事件（去重并排序）
+            completed_rarities = sorted({
+                target["rarity"] for target in expedition["targets"].values()
+                if target["caught"] >= target["required"]
+            })
             
             # 触发事件判定
             event_results = []
@@ -925,8 +1341,7 @@ class ExpeditionService:
             completion_rate = expedition["total_progress"]
             
             # 钻石奖励基础值
-            type_premium_base = {"short": 1000, "medium": 5000, "long": 10000}
-            base_premium = type_premium_base.get(expedition["type"], 1000)
+            base_premium = _PREMIUM_BASE.get(expedition["type"], 1000)
             total_premium = int(base_premium * completion_rate)
             
             # 计算拼手气红包奖池（参与人数 × 入场费）
@@ -937,11 +1352,15 @@ class ExpeditionService:
             # 随机分配奖池金币（拼手气红包算法）
             random_coin_rewards = self._distribute_lucky_money(pool_coins, participant_count)
 
-            # 分配奖励给各成员
+            # 分配奖励给各成员：一次查询取回所有有贡献的成员，发放完毕后一次性写回
             rewards = {}
             reward_index = 0
+            contributors = self.user_repo.get_by_ids([
+                user_id for user_id, total in contribution_totals.items() if total > 0
+            ])
+            reward_deltas: Dict[str, Tuple[int, int]] = {}
             for user_id, participant in expedition["participants"].items():
-                user_contribution = sum(participant["contribution"].values())
+                user_contribution = contribution_totals[user_id]
                 if user_contribution > 0:
                     # 按贡献比例分配钻石
                     personal_premium = max(1, int(total_premium * (user_contribution / total_contribution)))
@@ -950,16 +1369,9 @@ class ExpeditionService:
                     random_coins = random_coin_rewards[reward_index] if reward_index < len(random_coin_rewards) else 0
                     reward_index += 1
                     
-                    # 发放金币和钻石
-                    user = self.user_repo.get_by_id(user_id)
-                    if user:
-                        # 只有随机金币奖励
-                        user.coins += random_coins
-                        
-                        # 钻石奖励
-                        user.premium_currency += personal_premium
-                        
-                        self.user_repo.update(user)
+                    # 发放金币和钻石（只有随机金币奖励），与已结束的科考行在同一事务中写入
+                    if user_id in contributors:
+                        reward_deltas[user_id] = (random_coins, personal_premium)
                         
                         rewards[user_id] = {
                             "nickname": participant["nickname"],
@@ -967,109 +1379,148 @@ class ExpeditionService:
                             "coins": random_coins,
                             "premium": personal_premium
                         }
-                        
-                        # 保存用户的科考结算记录
-                        self._record_user_expedition_result(user_id, expedition, rewards[user_id])
 
-            # 确保所有参与者（即使贡献为0）也有“上次科考”历史记录可查
+            # 生成结算报告
+            events_text = "\n\n✨ 特殊事件：\n" + "\n".join(event_results) if event_results else ""
+            rewards_text = "\n".join(
+                f"  {reward['nickname']}: {reward['coins']:,}金币 + {reward['premium']}钻石"
+                for reward in sorted(rewards.values(), key=lambda x: x["contribution"], reverse=True)
+            )
+            report = (
+                f"🎉 {_TYPE_NAMES.get(expedition['type'], '')}科考已结束！\n"
+                f"━━━━━━━━━━━━━━━━━━━━\n"
+                f"📊 完成度：{completion_rate * 100:.1f}%\n"
+                f"💎 总钻石奖励：{total_premium}\n"
+                f"🎲 拼手气奖池：{pool_coins:,}金币"
+                f"{events_text}\n"
+                f"\n"
+                f"👤 个人奖励："
+            )
+            if rewards_text:
+                report += "\n" + rewards_text
+
+            # 发放奖励与“已结束”状态同步写入同一事务；只排队给写库线程的话，
+            # 进程在落库前退出会使科考重启后仍为进行中并被再次结算
+            ended = {
+                "status": "ended",
+                "ended_at": get_now().strftime("%Y-%m-%d %H:%M:%S"),
+                "settlement_report": report,
+            }
+            self._commit_settlement(dict(expedition, **ended), reward_deltas)
+
+            # 保存所有参与者的科考结算记录（贡献为0的也记录，确保“上次科考”可查），一次写入
+            history_rewards = dict(rewards)
             for user_id, participant in expedition["participants"].items():
-                if user_id in rewards:
+                if user_id in history_rewards:
                     continue
-                reward_stub = {
+                history_rewards[user_id] = {
                     "nickname": participant.get("nickname", ""),
                     "contribution": 0,
                     "coins": 0,
                     "premium": 0,
                 }
-                self._record_user_expedition_result(user_id, expedition, reward_stub)
-
-            # 生成结算报告
-            type_names = {"short": "探险", "medium": "征服", "long": "圣域"}
-            report_lines = [
-                f"🎉 {type_names.get(expedition['type'], '')}科考已结束！",
-                f"━━━━━━━━━━━━━━━━━━━━",
-                f"📊 完成度：{completion_rate * 100:.1f}%",
-                f"💎 总钻石奖励：{total_premium}",
-                f"🎲 拼手气奖池：{pool_coins:,}金币"
-            ]
-            
-            # 添加事件结果
-            if event_results:
-                report_lines.append("")
-                report_lines.append("✨ 特殊事件：")
-                for event in event_results:
-                    report_lines.append(event)
-            
-            report_lines.append("")
-            report_lines.append("👤 个人奖励：")
-
-            for reward in sorted(rewards.values(), key=lambda x: x["contribution"], reverse=True):
-                report_lines.append(
-                    f"  {reward['nickname']}: "
-                    f"{reward['coins']:,}金币 + "
-                    f"{reward['premium']}钻石"
-                )
+            self._record_user_expedition_results(expedition, history_rewards)
 
             # 标记为已结束并保留记录（包含结算报告）
-            expedition["status"] = "ended"
-            expedition["ended_at"] = get_now().strftime("%Y-%m-%d %H:%M:%S")
-            expedition["settlement_report"] = "\n".join(report_lines)
-            expeditions[expedition_id] = expedition
-            self._save_expeditions(expeditions)
+            expedition.update(ended)
+            self._index_remove_participants(expeditions, expedition)
+            # 每个队长仅保留最近一条已结束科考
+            self._save_expeditions(expeditions, self._replace_last_ended(expeditions, expedition))
             self._cancel_settlement_timer(expedition_id)
-            # 修剪：仅保留进行中和最近一条已结束科考
-            self._prune_storage_to_current_and_last()
 
             return {
                 "success": True,
-                "message": "\n".join(report_lines),
+                "message": report,
                 "rewards": rewards
             }
 
+    def _commit_settlement(self, expedition: Dict[str, Any], reward_deltas: Dict[str, Tuple[int, int]]) -> None:
+        """同步写入结算结果：在一个事务中发放奖励并写入已结束的科考行（需持有 _expedition_lock）"""
+        expedition_id = expedition["expedition_id"]
+        payload = _dumps_json(expedition)
+        self._snapshot_version += 1
+        with self._db_write_lock:
+            self.expedition_repo.save_settlement(
+                {expedition_id: (expedition["status"], expedition.get("end_ts"), payload.decode("utf-8"))},
+                reward_deltas,
+            )
+            # 写库线程随后遇到该科考较旧的快照时直接跳过
+            self._row_state[expedition_id] = (self._snapshot_version, hash(payload))
+        self._persisted_ids.add(expedition_id)
+
     def schedule_active_expeditions(self) -> None:
         """为当前进行中的科考安排一次性结算任务（仅在启动时调用）"""
+        # 启动时做一次全量修剪，清理旧版本遗留的多余已结束科考
+        self._prune_storage_to_current_and_last()
         expeditions = self._load_expeditions()
-        for exp_id, exp in expeditions.items():
-            if exp.get("status", "active") != "active":
-                continue
-            end_time = exp.get("end_time")
-            if not end_time:
-                continue
-            self._schedule_settlement(exp_id, end_time)
-
-    def _schedule_settlement(self, expedition_id: str, end_time_str: str) -> None:
-        """安排单次结算定时器"""
         try:
-            with self._expedition_lock:
-                if expedition_id in self._settle_timers:
-                    return
-            end_time = datetime.strptime(end_time_str, "%Y-%m-%d %H:%M:%S")
-            now = get_now()
-            delay = max(0, (end_time - now).total_seconds())
-
-            def _settle_job():
+            # 直接按索引查询进行中科考的截止时间，无需解析完整数据
+            active_end_times = self.expedition_repo.get_active_end_times()
+        except Exception as e:
+            logger.error(f"查询进行中科考失败: {e}")
+            return
+        for exp_id, end_ts in active_end_times:
+            if end_ts is None:
+                # 旧数据没有 end_ts 列，回退到解析 end_time
+                exp = expeditions.get(exp_id)
+                if not exp or not exp.get("end_time"):
+                    continue
                 try:
-                    self._settle_expedition(expedition_id, manual=False)
+                    end_ts = self._get_end_ts(exp)
                 except Exception as e:
-                    logger.error(f"科考自动结算失败: {e}")
-
-            timer = threading.Timer(delay, _settle_job)
-            timer.daemon = True
-            with self._expedition_lock:
-                self._settle_timers[expedition_id] = timer
-            timer.start()
-        except Exception as e:
-            logger.error(f"安排科考结算失败: {e}")
+                    logger.error(f"安排科考结算失败: {e}")
+                    continue
+            self._schedule_settlement(exp_id, end_ts)
+
+    def _schedule_settlement(self, expedition_id: str, end_ts: float) -> None:
+        """安排单次结算：加入到期堆，由唯一的后台线程在到期时执行"""
+        with self._settle_cond:
+            if expedition_id in self._scheduled_ids:
+                return
+            heapq.heappush(self._settle_heap, (end_ts, expedition_id))
+            self._scheduled_ids.add(expedition_id)
+            if self._settle_thread is None or not self._settle_thread.is_alive():
+                self._settle_stopped = False
+                self._settle_thread = threading.Thread(
+                    target=self._settlement_loop, name="expedition-settle", daemon=True
+                )
+                self._settle_thread.start()
+            self._settle_cond.notify()
 
     def _cancel_settlement_timer(self, expedition_id: str) -> None:
-        """取消定时器"""
-        with self._expedition_lock:
-            timer = self._settle_timers.pop(expedition_id, None)
-        if timer:
+        """取消已安排的结算（堆中的条目在到期时被跳过）"""
+        with self._settle_cond:
+            self._scheduled_ids.discard(expedition_id)
+
+    def _settlement_loop(self) -> None:
+        """后台结算线程：等待堆顶到期，依次结算"""
+        while True:
+            with self._settle_cond:
+                while not self._settle_stopped:
+                    if not self._settle_heap:
+                        self._settle_cond.wait()
+                        continue
+                    delay = self._settle_heap[0][0] - get_now().timestamp()
+                    if delay <= 0:
+                        break
+                    self._settle_cond.wait(timeout=delay)
+                if self._settle_stopped:
+                    return
+                _, expedition_id = heapq.heappop(self._settle_heap)
+                if expedition_id not in self._scheduled_ids:
+                    continue  # 已取消或已结算
+                self._scheduled_ids.discard(expedition_id)
+
             try:
-                timer.cancel()
-            except Exception:
-                pass
+                self._settle_expedition(expedition_id, manual=False)
+            except Exception as e:
+                logger.error(f"科考自动结算失败: {e}")
+
+    def stop_settlement_scheduler(self) -> None:
+        """停止后台结算线程"""
+        with self._settle_cond:
+            self._settle_stopped = True
+            self._settle_cond.notify_all()
 
     def _distribute_lucky_money(self, total_amount: int, count: int) -> list:
         """拼手气红包算法：随机分配金额
@@ -1086,9 +1537,23 @@ class ExpeditionService:
         
         if count == 1:
             return [total_amount]
-        
-        # 使用二倍均值算法
+
+        if np is not None:
+            # 向量化分配：金额足够时每人先保底1金币，其余按随机权重一次性切分，
+            # 取整后剩下的零头随机补给不同的人，保证总额不变
+            base = 1 if total_amount >= count else 0
+            rest = total_amount - base * count
+            weights = np.random.random(count)
+            amounts = np.floor(weights / weights.sum() * rest).astype(np.int64) + base
+            remainder = total_amount - int(amounts.sum())
+            if remainder > 0:
+                amounts[np.random.choice(count, remainder, replace=False)] += 1
+            return amounts.tolist()
+
+        # 使用二倍均值算法；循环内用局部变量绑定方法，省去每次的属性查找
         amounts = []
+        append = amounts.append
+        randint = random.randint
         remaining = total_amount
         
         for i in range(count - 1):
@@ -1098,12 +1563,12 @@ class ExpeditionService:
             if max_amount < 1:
                 max_amount = 1
             
-            amount = random.randint(1, max(1, max_amount))
-            amounts.append(amount)
+            amount = randint(1, max_amount)
+            append(amount)
             remaining -= amount
         
         # 最后一个人获得剩余所有金额
-        amounts.append(max(0, remaining))
+        append(max(0, remaining))
         
         # 随机打乱顺序，增加随机性
         random.shuffle(amounts)
@@ -1120,8 +1585,6 @@ class ExpeditionService:
         Returns:
             事件结果文本，如果没有触发事件则返回None
         """
-        import random
-        
         # 三种事件及其触发率
         events = [
             {"name": "quantum_imaging", "rate": 0.10},  # 量子成像效应
@@ -1144,8 +1607,8 @@ class ExpeditionService:
             return None
         
         # 根据科考类型确定影响人数
-        participant_count = {"short": 1, "medium": 2, "long": 3}.get(expedition["type"], 1)
-        fish_count = {"short": 1, "medium": 2, "long": 3}.get(expedition["type"], 1)
+        participant_count = _EVENT_MEMBER_COUNT.get(expedition["type"], 1)
+        fish_count = _EVENT_FISH_COUNT.get(expedition["type"], 1)
         
         # 获取参与者列表
         participant_ids = list(expedition["participants"].keys())
@@ -1159,14 +1622,17 @@ class ExpeditionService:
         if triggered_event == "quantum_imaging":
             # ①量子成像效应：随机成员获得其他成员钓起的6~10星鱼
             result_lines = []
-            rare_fish_pool = []
             
-            # 收集所有成员钓起的稀有鱼
-            for user_id in participant_ids:
-                if user_id in expedition.get("rare_fish_caught", {}):
-                    rare_fish_pool.extend(expedition["rare_fish_caught"][user_id])
+            # 收集所有成员钓起的稀有鱼（只统计仍在队伍中的成员）
+            rare_fish_caught = expedition.get("rare_fish_caught", {})
+            rare_fish_pool = list(chain.from_iterable(
+                rare_fish_caught.get(user_id, ()) for user_id in participant_ids
+            ))
             
             if rare_fish_pool:
+                from core.services.aquarium_service import AquariumService
+                aquarium_service = AquariumService(self.user_repo, self.item_template_repo)
+
                 for user_id in selected_users:
                     user = self.user_repo.get_by_id(user_id)
                     if user:
@@ -1174,9 +1640,6 @@ class ExpeditionService:
                         selected_fish = random.choices(rare_fish_pool, k=min(fish_count, len(rare_fish_pool)))
                         
                         # 添加到用户鱼塘
-                        from core.services.aquarium_service import AquariumService
-                        aquarium_service = AquariumService(self.user_repo, self.item_template_repo)
-                        
                         for fish_id in selected_fish:
                             aquarium_service.add_fish_to_aquarium(user_id, fish_id)
                         
@@ -1192,9 +1655,6 @@ class ExpeditionService:
             for user_id in selected_users:
                 user = self.user_repo.get_by_id(user_id)
                 if user and user.aquarium:
-                    from core.services.aquarium_service import AquariumService
-                    aquarium_service = AquariumService(self.user_repo, self.item_template_repo)
-                    
                     # 将鱼塘中所有鱼的品质提升为"优良"或"完美"
                     improved_count = 0
                     for fish_entry in user.aquarium:
@@ -1212,25 +1672,21 @@ class ExpeditionService:
         
         elif triggered_event == "abyss_vortex":
             # ③深渊漩涡：随机成员获得5星鱼
-            fish_count_by_type = {"short": 10, "medium": 20, "long": 30}
-            total_fish = fish_count_by_type.get(expedition["type"], 10)
+            total_fish = _ABYSS_FISH_COUNT.get(expedition["type"], 10)
             
             result_lines = []
             
-            # 获取所有5星鱼的模板
-            all_fish = self.item_template_repo.get_all_fish()
-            five_star_fish = [f for f in all_fish if f.rarity == 5]
+            five_star_fish_ids = self._get_five_star_fish_ids()
             
-            if five_star_fish:
+            if five_star_fish_ids:
                 for user_id in selected_users:
                     user = self.user_repo.get_by_id(user_id)
                     if user:
                         # 随机选择5星鱼
-                        selected_fish_ids = [random.choice(five_star_fish).fish_id for _ in range(total_fish)]
+                        selected_fish_ids = random.choices(five_star_fish_ids, k=total_fish)
                         
-                        # 添加到背包
-                        for fish_id in selected_fish_ids:
-                            self.inventory_repo.add_or_update_item(user_id, fish_id, 1)
+                        # 按鱼ID汇总后一次写入鱼塘
+                        self.inventory_repo.add_fishes_to_inventory(user_id, Counter(selected_fish_ids))
                         
                         nickname = expedition["participants"][user_id]["nickname"]
                         result_lines.append(f"  {nickname} 获得了{total_fish}条5星鱼")
@@ -1239,19 +1695,28 @@ class ExpeditionService:
         
         return None
 
+    def _get_five_star_fish_ids(self) -> List[int]:
+        """获取所有5星鱼ID（带缓存），避免每次事件都查询鱼类模板"""
+        cached = self._five_star_fish_ids
+        if cached and time.monotonic() - cached[0] < self._five_star_cache_ttl:
+            return cached[1]
+        fish_ids = [f.fish_id for f in self.item_template_repo.get_fishes_by_rarity(5)]
+        self._five_star_fish_ids = (time.monotonic(), fish_ids)
+        return fish_ids
+
     def get_all_active_expeditions(self) -> List[Dict[str, Any]]:
         """获取所有进行中的科考（用于WebUI显示）"""
         expeditions = self._load_expeditions()
         active_list = []
+        now_ts = get_now().timestamp()
         
         for exp in expeditions.values():
             if exp["status"] == "active":
                 # 计算剩余时间
-                end_time = datetime.strptime(exp["end_time"], "%Y-%m-%d %H:%M:%S")
-                now = get_now()
-                remaining = end_time - now
+                remaining_seconds = self._get_end_ts(exp) - now_ts
                 
-                if remaining.total_seconds() > 0:
+                if remaining_seconds > 0:
+                    hours, rest = divmod(int(remaining_seconds), 3600)
                     active_list.append({
                         "expedition_id": exp["expedition_id"],
                         "type": exp["type"],
@@ -1260,8 +1725,8 @@ class ExpeditionService:
                         "total_progress": exp["total_progress"],
                         "targets": exp["targets"],
                         "participants": exp["participants"],
-                        "remaining_hours": int(remaining.total_seconds() / 3600),
-                        "remaining_minutes": int((remaining.total_seconds() % 3600) / 60)
+                        "remaining_hours": hours,
+                        "remaining_minutes": rest // 60
                     })
         
         return active_list
@@ -1270,23 +1735,33 @@ class ExpeditionService:
         """自动结算所有已超时的科考，返回结算数量"""
         settled_count = 0
         try:
-            with self._expedition_lock:
-                expeditions = self._load_expeditions()
-                now = get_now()
-                expired_ids = []
-
-                for exp_id, exp in expeditions.items():
-                    if exp.get("status", "active") != "active":
-                        continue
-                    end_time_str = exp.get("end_time")
-                    if not end_time_str:
-                        continue
-                    try:
-                        end_time = datetime.strptime(end_time_str, "%Y-%m-%d %H:%M:%S")
-                    except Exception:
-                        continue
-                    if now > end_time:
-                        expired_ids.append(exp_id)
+            expired_ids = []
+            with self._settle_cond:
+                # 调度已启动时，所有进行中科考都在到期堆中，只需弹出堆顶已到期的条目
+                use_heap = self._settle_thread is not None
+                if use_heap:
+                    now_ts = get_now().timestamp()
+                    while self._settle_heap and self._settle_heap[0][0] <= now_ts:
+                        _, exp_id = heapq.heappop(self._settle_heap)
+                        if exp_id in self._scheduled_ids:
+                            self._scheduled_ids.discard(exp_id)
+                            expired_ids.append(exp_id)
+
+            if not use_heap:
+                with self._expedition_lock:
+                    expeditions = self._load_expeditions()
+                    now_ts = get_now().timestamp()
+                    for exp_id, exp in expeditions.items():
+                        if exp.get("status", "active") != "active":
+                            continue
+                        if not exp.get("end_time"):
+                            continue
+                        try:
+                            end_ts = self._get_end_ts(exp)
+                        except Exception:
+                            continue
+                        if now_ts > end_ts:
+                            expired_ids.append(exp_id)
 
             for exp_id in expired_ids:
                 result = self._settle_expedition(exp_id, manual=False)
@@ -581,13 +581,11 @@ class MarketService:
             logger.error(f"获取用户商品列表时发生错误: {e}")
             return {"success": False, "message": f"获取商品列表失败: {str(e)}"}
 
-    # --- 管理员功能 ---
-
-    def get_all_market_listings_for_admin(self, page: int = 1, per_page: int = 20, 
-                                         item_type: str = None, min_price: int = None, 
-                                         max_price: int = None, search: str = None) -> Dict[str, Any]:
+    def get_market_listings_by_page(self, page: int = 1, per_page: int = 20,
+                                    item_type: str = None, min_price: int = None,
+                                    max_price: int = None, search: str = None) -> Dict[str, Any]:
         """
-        为管理员提供分页的市场商品列表，支持筛选和搜索。
+        按页码分页的市场商品列表，只查询当前页与筛选后的总数，不做全市场统计。
         """
         try:
             # 验证分页参数
@@ -622,11 +620,40 @@ class MarketService:
                     search=search
                 )
             
+            return {
+                "success": True, 
+                "listings": listings,
+                "pagination": {
+                    "current_page": page, 
+                    "total_pages": total_pages, 
+                    "total_items": total_items,
+                    "per_page": per_page, 
+                    "has_prev": page > 1, 
+                    "has_next": page < total_pages
+                }
+            }
+        except Exception as e:
+            logger.error(f"获取市场列表失败: {e}")
+            return {"success": False, "message": f"获取市场列表失败: {e}"}
+
+    # --- 管理员功能 ---
+
+    def get_all_market_listings_for_admin(self, page: int = 1, per_page: int = 20, 
+                                         item_type: str = None, min_price: int = None, 
+                                         max_price: int = None, search: str = None) -> Dict[str, Any]:
+        """
+        为管理员提供分页的市场商品列表，支持筛选和搜索。
+        """
+        result = self.get_market_listings_by_page(page, per_page, item_type, min_price, max_price, search)
+        if not result["success"]:
+            return result
+        try:
+            listings = result["listings"]
             # 获取统计信息
             all_listings, total_count = self.market_repo.get_all_listings()
-            stats = {
+            result["stats"] = {
                 "total_listings": total_count, 
-                "filtered_listings": total_items,
+                "filtered_listings": result["pagination"]["total_items"],
                 "total_value": sum(item.price * item.quantity for item in listings),
                 "rod_count": len([i for i in all_listings if i.item_type == "rod"]),
                 "accessory_count": len([i for i in all_listings if i.item_type == "accessory"]),
@@ -634,22 +661,41 @@ class MarketService:
                 "fish_count": sum(i.quantity for i in all_listings if i.item_type == "fish"),
                 "commodity_count": sum(i.quantity for i in all_listings if i.item_type == "commodity")
             }
-            
+            return result
+        except Exception as e:
+            logger.error(f"获取管理员市场列表失败: {e}")
+            return {"success": False, "message": f"获取市场列表失败: {e}"}
+
+    def get_market_listings_page(self, cursor: Optional[int] = None, per_page: int = 20,
+                                 item_type: str = None, min_price: int = None,
+                                 max_price: int = None) -> Dict[str, Any]:
+        """
+        游标分页的市场商品列表：cursor 为上一页返回的 next_cursor，首页传 None。
+        """
+        try:
+            if per_page < 1:
+                per_page = 20
+            # 多取一条用于判断是否还有下一页
+            listings = self.market_repo.get_listings_page(
+                per_page + 1,
+                before_id=cursor,
+                item_type=item_type,
+                min_price=min_price,
+                max_price=max_price
+            )
+            has_next = len(listings) > per_page
+            listings = listings[:per_page]
             return {
-                "success": True, 
+                "success": True,
                 "listings": listings,
                 "pagination": {
-                    "current_page": page, 
-                    "total_pages": total_pages, 
-                    "total_items": total_items,
-                    "per_page": per_page, 
-                    "has_prev": page > 1, 
-                    "has_next": page < total_pages
-                },
-                "stats": stats
+                    "per_page": per_page,
+                    "has_next": has_next,
+                    "next_cursor": listings[-1].market_id if has_next else None
+                }
             }
         except Exception as e:
-            logger.error(f"获取管理员市场列表失败: {e}")
+            logger.error(f"获取市场列表失败: {e}")
             return {"success": False, "message": f"获取市场列表失败: {e}"}
 
     def update_market_item_price(self, market_id: int, new_price: int) -> Dict[str, Any]:
@@ -14,6 +14,14 @@ from .gacha_service import GachaService
 from ..domain.models import User, TaxRecord
 from ..utils import get_now, get_today
 
+# 排行榜排序标准 -> users 表中的列
+_LEADERBOARD_COLUMNS = {
+    "coins": "coins",
+    "max_coins": "max_coins",
+    "fish_count": "total_fishing_count",
+    "total_weight_caught": "total_weight_caught",
+}
+
 
 class UserService:
     """封装与用户相关的业务逻辑"""
@@ -117,31 +125,11 @@ class UserService:
         Returns:
             包含排行榜数据的字典。
         """
-        top_users = []
-        if sort_by == "fish_count":
-            top_users = self.user_repo.get_top_users_by_fish_count(limit)
-        elif sort_by == "total_weight_caught":
-            top_users = self.user_repo.get_top_users_by_weight(limit)
-        elif sort_by == "max_coins":
-            top_users = self.user_repo.get_top_users_by_max_coins(limit)
-        else: # 默认按金币排序
-            top_users = self.user_repo.get_top_users_by_coins(limit)
-        
-        leaderboard = []
-        for user in top_users:
-            # --- [核心修复] ---
-            # 在组装字典时，必须包含 user_id 和 current_title_id
-            # 这样下游的 handler 才能根据这些ID去查询详细信息
-            leaderboard.append({
-                "user_id": user.user_id,  # <--- 添加 user_id
-                "nickname": user.nickname,
-                "coins": user.coins,
-                "max_coins": user.max_coins,  # 添加历史最高金币
-                "fish_count": user.total_fishing_count,
-                "total_weight_caught": user.total_weight_caught,
-                "current_title_id": user.current_title_id, # <--- 添加 current_title_id
-            })
-        # --- [修复结束] ---
+        # 排序标准 -> users 表列名，未知标准默认按金币排序
+        order_by_column = _LEADERBOARD_COLUMNS.get(sort_by, "coins")
+        # 数据库只返回排行榜需要的列；包含 user_id 和 current_title_id，
+        # 下游的 handler 根据这些ID去查询详细信息
+        leaderboard = self.user_repo.get_leaderboard_rows(order_by_column, limit)
         
         return {
             "success": True,
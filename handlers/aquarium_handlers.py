@@ -1,24 +1,116 @@
+import asyncio
+import re
+from itertools import groupby
+from operator import itemgetter
 from astrbot.api.event import AstrMessageEvent
 from ..utils import format_rarity_display
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, List, Optional, Tuple
 
 if TYPE_CHECKING:
     from ..main import FishingPlugin
 
+_HIGH_QUALITY_DISPLAY = " ✨高品质"
+
+_AQUARIUM_HELP_TEXT = """【🐠 水族箱系统帮助】：
+
+🔹 水族箱是一个安全的存储空间，鱼放在里面不会被偷
+🔹 默认容量50条，可以通过升级增加容量
+🔹 从市场购买的鱼默认放入水族箱
+🔹 可以正常上架和购买
+
+📋 可用命令：
+• /水族箱 - 查看水族箱中的鱼
+• /放入水族箱 <鱼ID> [数量] - 将鱼从鱼塘放入水族箱
+• /移出水族箱 <鱼ID> [数量] - 将鱼从水族箱移回鱼塘
+• /放入稀有度 <稀有度> - 将指定稀有度的所有鱼放入水族箱
+• /移出稀有度 <稀有度> - 将指定稀有度的所有鱼移回鱼塘
+• /升级水族箱 - 升级水族箱容量
+• /水族箱 帮助 - 显示此帮助信息
+
+💡 提示：使用「水族箱」命令查看鱼ID
+💡 稀有度范围：1-10 (1⭐~10⭐)"""
+
+# 按稀有度批量移动的结果消息模板
+_ADD_RARITY_MSG = "✅ 成功将 {success} 种{rarity}星鱼（共{moved}条）放入水族箱{hq_line}{fail_section}"
+_REMOVE_RARITY_MSG = "✅ 成功将 {success} 种{rarity}星鱼（共{moved}条）移回鱼塘{hq_line}{fail_section}"
+
+# 鱼ID短码：F3 / F3H（H代表✨高品质）或纯数字ID
+_FISH_TOKEN_RE = re.compile(r"F(\d+)(H?)|(\d+)")
+
+
+def _parse_fish_token(token: str) -> Tuple[int, int]:
+    """解析鱼ID短码，返回 (fish_id, quality_level)；格式错误时抛出 ValueError"""
+    match = _FISH_TOKEN_RE.fullmatch(token.strip().upper())
+    if not match:
+        raise ValueError(token)
+    if match.group(3) is not None:
+        return int(match.group(3)), 0
+    return int(match.group(1)), 1 if match.group(2) else 0
+
+
+def _parse_fish_args(args: List[str], usage: str) -> Tuple[Optional[int], int, int, Optional[str]]:
+    """解析 <鱼ID> [数量]，返回 (fish_id, quality_level, quantity, 错误信息)"""
+    if len(args) < 2:
+        return None, 0, 0, usage
+    try:
+        fish_id, quality_level = _parse_fish_token(args[1])
+        quantity = int(args[2]) if len(args) >= 3 else 1
+    except ValueError:
+        return None, 0, 0, "❌ 鱼ID格式错误！请使用F开头的短码（如F3、F3H）或纯数字ID"
+    if quantity <= 0:
+        return None, 0, 0, "❌ 数量必须是正整数"
+    return fish_id, quality_level, quantity, None
+
+
+def _format_rarity_move(template: str, rarity: int, result: dict, fishes: List[dict]) -> str:
+    """按模板一次性生成按稀有度批量移动的结果消息"""
+    fail_section = ""
+    if result["failed"]:
+        # 只有存在失败项时才需要鱼名映射
+        names = {(fish["fish_id"], fish["quality_level"]): fish["name"] for fish in fishes}
+        failed_items = [
+            f"{names.get((fish_id, quality_level))}({reason})"
+            for fish_id, quality_level, reason in result["failed"]
+        ]
+        fail_section = "\n\n⚠️ 以下鱼类移动失败：\n" + "\n".join(f"  - {item}" for item in failed_items[:5])
+        if len(failed_items) > 5:
+            fail_section += f"\n  ... 还有{len(failed_items)-5}项"
+    hq_count = result["hq_count"]
+    return template.format_map({
+        "success": result["success_count"],
+        "rarity": rarity,
+        "moved": result["moved"],
+        "hq_line": f"\n✨ 其中包含 {hq_count} 条高品质鱼" if hq_count > 0 else "",
+        "fail_section": fail_section,
+    })
+
+
+def _parse_rarity_arg(args: List[str], usage: str) -> Tuple[Optional[int], Optional[str]]:
+    """解析 <稀有度>（1-10），返回 (rarity, 错误信息)"""
+    if len(args) < 2:
+        return None, usage
+    try:
+        rarity = int(args[1])
+    except ValueError:
+        return None, "❌ 稀有度必须是数字（1-10）"
+    if rarity < 1 or rarity > 10:
+        return None, "❌ 稀有度必须在1-10之间"
+    return rarity, None
+
 
 async def aquarium(self: "FishingPlugin", event: AstrMessageEvent):
     """水族箱主命令：
     - "水族箱": 显示水族箱列表
     - "水族箱 帮助": 显示帮助
     """
-    args = event.message_str.strip().split()
+    args = event.message_str.strip().split(maxsplit=2)
     if len(args) >= 2 and args[1] == "帮助":
         async for r in aquarium_help(self, event):
             yield r
         return
 
     user_id = self._get_effective_user_id(event)
-    result = self.aquarium_service.get_user_aquarium(user_id)
+    result = await asyncio.to_thread(self.aquarium_service.get_user_aquarium, user_id)
 
     if not result["success"]:
         yield event.plain_result(f"❌ {result['message']}")
@@ -31,76 +123,44 @@ async def aquarium(self: "FishingPlugin", event: AstrMessageEvent):
         yield event.plain_result("🐠 您的水族箱是空的，快去钓鱼吧！")
         return
 
-    # 按稀有度分组
-    fishes_by_rarity = {}
-    for fish in fishes:
-        rarity = fish.get("rarity", "未知")
-        if rarity not in fishes_by_rarity:
-            fishes_by_rarity[rarity] = []
-        fishes_by_rarity[rarity].append(fish)
-
-    # 构造输出信息
-    message = "【🐠 水族箱】：\n"
-
-    for rarity in sorted(fishes_by_rarity.keys(), reverse=True):
-        if fish_list := fishes_by_rarity[rarity]:
-            message += f"\n {format_rarity_display(rarity)}：\n"
-            for fish in fish_list:
-                fish_id = int(fish.get('fish_id', 0) or 0)
-                quality_level = fish.get('quality_level', 0)
-                # 生成带品质标识的FID
-                if quality_level == 1:
-                    fcode = f"F{fish_id}H" if fish_id else "F0H"  # H代表✨高品质
-                else:
-                    fcode = f"F{fish_id}" if fish_id else "F0"   # 普通品质
-                # 显示品质信息
-                quality_display = ""
-                if quality_level == 1:
-                    quality_display = " ✨高品质"
-                message += f"  - {fish['name']}{quality_display} x  {fish['quantity']} （{fish['actual_value']}金币 / 个） ID: {fcode}\n"
-
-    message += f"\n🐟 总鱼数：{stats['total_count']} / {stats['capacity']} 条\n"
-    message += f"💰 总价值：{stats['total_value']} 金币\n"
-    message += f"📦 剩余空间：{stats['available_space']} 条\n"
-
-    yield event.plain_result(message)
+    # 构造输出信息：逐段收集后一次拼接
+    parts = ["【🐠 水族箱】：\n"]
+    append = parts.append
+
+    # 按稀有度从高到低分组；稳定排序，同一稀有度内保持原有顺序
+    by_rarity = itemgetter("rarity")
+    for rarity, fish_list in groupby(sorted(fishes, key=by_rarity, reverse=True), key=by_rarity):
+        append(f"\n {format_rarity_display(rarity)}：\n")
+        for fish in fish_list:
+            fish_id = fish["fish_id"]
+            # 生成带品质标识的FID，H代表✨高品质
+            if fish["quality_level"] == 1:
+                fcode, quality_display = f"F{fish_id}H", _HIGH_QUALITY_DISPLAY
+            else:
+                fcode, quality_display = f"F{fish_id}", ""
+            append(f"  - {fish['name']}{quality_display} x  {fish['quantity']} （{fish['actual_value']}金币 / 个） ID: {fcode}\n")
+
+    append(
+        f"\n🐟 总鱼数：{stats['total_count']} / {stats['capacity']} 条\n"
+        f"💰 总价值：{stats['total_value']} 金币\n"
+        f"📦 剩余空间：{stats['available_space']} 条\n"
+    )
+
+    yield event.plain_result("".join(parts))
 
 
 async def add_to_aquarium(self: "FishingPlugin", event: AstrMessageEvent):
     """将鱼从鱼塘添加到水族箱"""
     user_id = self._get_effective_user_id(event)
-    args = event.message_str.split(" ")
-    
-    if len(args) < 2:
-        yield event.plain_result("❌ 用法：/放入水族箱 <鱼ID> [数量]\n💡 使用「水族箱」命令查看水族箱中的鱼")
-        return
-
-    try:
-        # 解析鱼ID（支持F开头的短码，包括品质标识）
-        fish_token = args[1].strip().upper()
-        quality_level = 0  # 默认普通品质
-        
-        if fish_token.startswith('F'):
-            # 检查是否有品质标识H
-            if fish_token.endswith('H'):
-                quality_level = 1  # ✨高品质
-                fish_id = int(fish_token[1:-1])  # 去掉F前缀和H后缀
-            else:
-                fish_id = int(fish_token[1:])  # 去掉F前缀
-        else:
-            fish_id = int(fish_token)
-        
-        quantity = 1
-        if len(args) >= 3:
-            quantity = int(args[2])
-            if quantity <= 0:
-                yield event.plain_result("❌ 数量必须是正整数")
-                return
-    except ValueError:
-        yield event.plain_result("❌ 鱼ID格式错误！请使用F开头的短码（如F3、F3H）或纯数字ID")
+    args = event.message_str.split(" ", 3)
+    fish_id, quality_level, quantity, error = _parse_fish_args(
+        args, "❌ 用法：/放入水族箱 <鱼ID> [数量]\n💡 使用「水族箱」命令查看水族箱中的鱼"
+    )
+    if error:
+        yield event.plain_result(error)
         return
 
-    result = self.aquarium_service.add_fish_to_aquarium(user_id, fish_id, quantity, quality_level)
+    result = await asyncio.to_thread(self.aquarium_service.add_fish_to_aquarium, user_id, fish_id, quantity, quality_level)
     
     if result["success"]:
         yield event.plain_result(f"✅ {result['message']}")
@@ -111,38 +171,15 @@ async def add_to_aquarium(self: "FishingPlugin", event: AstrMessageEvent):
 async def remove_from_aquarium(self: "FishingPlugin", event: AstrMessageEvent):
     """将鱼从水族箱移回鱼塘"""
     user_id = self._get_effective_user_id(event)
-    args = event.message_str.split(" ")
-    
-    if len(args) < 2:
-        yield event.plain_result("❌ 用法：/移出水族箱 <鱼ID> [数量]\n💡 使用「水族箱」命令查看水族箱中的鱼")
+    args = event.message_str.split(" ", 3)
+    fish_id, quality_level, quantity, error = _parse_fish_args(
+        args, "❌ 用法：/移出水族箱 <鱼ID> [数量]\n💡 使用「水族箱」命令查看水族箱中的鱼"
+    )
+    if error:
+        yield event.plain_result(error)
         return
 
-    try:
-        # 解析鱼ID（支持F开头的短码，包括品质标识）
-        fish_token = args[1].strip().upper()
-        quality_level = 0  # 默认普通品质
-        
-        if fish_token.startswith('F'):
-            # 检查是否有品质标识H
-            if fish_token.endswith('H'):
-                quality_level = 1  # ✨高品质
-                fish_id = int(fish_token[1:-1])  # 去掉F前缀和H后缀
-            else:
-                fish_id = int(fish_token[1:])  # 去掉F前缀
-        else:
-            fish_id = int(fish_token)
-        
-        quantity = 1
-        if len(args) >= 3:
-            quantity = int(args[2])
-            if quantity <= 0:
-                yield event.plain_result("❌ 数量必须是正整数")
-                return
-    except ValueError:
-        yield event.plain_result("❌ 鱼ID格式错误！请使用F开头的短码（如F3、F3H）或纯数字ID")
-        return
-
-    result = self.aquarium_service.remove_fish_from_aquarium(user_id, fish_id, quantity, quality_level)
+    result = await asyncio.to_thread(self.aquarium_service.remove_fish_from_aquarium, user_id, fish_id, quantity, quality_level)
     
     if result["success"]:
         yield event.plain_result(f"✅ {result['message']}")
@@ -154,7 +191,7 @@ async def upgrade_aquarium(self: "FishingPlugin", event: AstrMessageEvent):
     """升级水族箱容量"""
     user_id = self._get_effective_user_id(event)
     # 直接尝试升级，失败时会返回具体原因（包含所需费用）
-    result = self.aquarium_service.upgrade_aquarium(user_id)
+    result = await asyncio.to_thread(self.aquarium_service.upgrade_aquarium, user_id)
     
     if result["success"]:
         yield event.plain_result(f"✅ {result['message']}")
@@ -167,151 +204,58 @@ async def upgrade_aquarium(self: "FishingPlugin", event: AstrMessageEvent):
 
 async def aquarium_help(self: "FishingPlugin", event: AstrMessageEvent):
     """水族箱帮助信息"""
-    message = """【🐠 水族箱系统帮助】：
-
-🔹 水族箱是一个安全的存储空间，鱼放在里面不会被偷
-🔹 默认容量50条，可以通过升级增加容量
-🔹 从市场购买的鱼默认放入水族箱
-🔹 可以正常上架和购买
-
-📋 可用命令：
-• /水族箱 - 查看水族箱中的鱼
-• /放入水族箱 <鱼ID> [数量] - 将鱼从鱼塘放入水族箱
-• /移出水族箱 <鱼ID> [数量] - 将鱼从水族箱移回鱼塘
-• /放入稀有度 <稀有度> - 将指定稀有度的所有鱼放入水族箱
-• /移出稀有度 <稀有度> - 将指定稀有度的所有鱼移回鱼塘
-• /升级水族箱 - 升级水族箱容量
-• /水族箱 帮助 - 显示此帮助信息
-
-💡 提示：使用「水族箱」命令查看鱼ID
-💡 稀有度范围：1-10 (1⭐~10⭐)"""
-    
-    yield event.plain_result(message)
+    yield event.plain_result(_AQUARIUM_HELP_TEXT)
 
 
 async def add_rarity_to_aquarium(self: "FishingPlugin", event: AstrMessageEvent):
     """按稀有度将鱼从鱼塘批量放入水族箱"""
     user_id = self._get_effective_user_id(event)
-    args = event.message_str.split(" ")
-    
-    if len(args) < 2:
-        yield event.plain_result("❌ 用法：/放入稀有度 <稀有度>\n💡 例如：/放入稀有度 3 （将所有3星鱼放入水族箱）")
+    args = event.message_str.split(" ", 2)
+    rarity, error = _parse_rarity_arg(args, "❌ 用法：/放入稀有度 <稀有度>\n💡 例如：/放入稀有度 3 （将所有3星鱼放入水族箱）")
+    if error:
+        yield event.plain_result(error)
         return
     
-    try:
-        rarity = int(args[1])
-        if rarity < 1 or rarity > 10:
-            yield event.plain_result("❌ 稀有度必须在1-10之间")
-            return
-    except ValueError:
-        yield event.plain_result("❌ 稀有度必须是数字（1-10）")
-        return
+    # 获取鱼塘中该稀有度的所有鱼（稀有度过滤在数据库中完成）
+    fishes = await asyncio.to_thread(self.aquarium_service.get_user_fishes_by_rarity, user_id, rarity)
     
-    # 获取鱼塘中该稀有度的所有鱼
-    inventory_result = self.inventory_service.get_user_fish_pond(user_id)
-    if not inventory_result.get("success"):
-        yield event.plain_result(f"❌ 获取鱼塘信息失败")
-        return
-    
-    fishes = inventory_result.get("fishes", [])
-    target_fishes = [f for f in fishes if f.get("rarity") == rarity]
-    
-    if not target_fishes:
+    if not fishes:
         yield event.plain_result(f"❌ 鱼塘中没有{rarity}星稀有度的鱼")
         return
     
-    # 批量添加到水族箱
-    total_moved = 0
-    high_quality_count = 0
-    success_count = 0
-    failed_items = []
-    
-    for fish in target_fishes:
-        fish_id = fish.get("fish_id")
-        quantity = fish.get("quantity", 0)
-        quality_level = fish.get("quality_level", 0)
-        
-        if quantity > 0:
-            result = self.aquarium_service.add_fish_to_aquarium(user_id, fish_id, quantity, quality_level)
-            if result.get("success"):
-                total_moved += quantity
-                if quality_level == 1:
-                    high_quality_count += quantity
-                success_count += 1
-            else:
-                failed_items.append(f"{fish.get('name')}({result.get('message')})")
-    
-    # 构建结果消息
-    message = f"✅ 成功将 {success_count} 种{rarity}星鱼（共{total_moved}条）放入水族箱"
-    if high_quality_count > 0:
-        message += f"\n✨ 其中包含 {high_quality_count} 条高品质鱼"
-    if failed_items:
-        message += f"\n\n⚠️ 以下鱼类移动失败：\n" + "\n".join(f"  - {item}" for item in failed_items[:5])
-        if len(failed_items) > 5:
-            message += f"\n  ... 还有{len(failed_items)-5}项"
-    
-    yield event.plain_result(message)
+    # 批量添加到水族箱（一次服务调用，单个事务）
+    # 查询结果已按稀有度和数量 > 0 过滤，直接转换为批量参数
+    items = [(fish["fish_id"], fish["quality_level"], fish["quantity"]) for fish in fishes]
+    result = await asyncio.to_thread(self.aquarium_service.add_fishes_to_aquarium_batch, user_id, items)
+    if not result["success"]:
+        yield event.plain_result(f"❌ {result['message']}")
+        return
+
+    yield event.plain_result(_format_rarity_move(_ADD_RARITY_MSG, rarity, result, fishes))
 
 
 async def remove_rarity_from_aquarium(self: "FishingPlugin", event: AstrMessageEvent):
     """按稀有度将鱼从水族箱批量移回鱼塘"""
     user_id = self._get_effective_user_id(event)
-    args = event.message_str.split(" ")
-    
-    if len(args) < 2:
-        yield event.plain_result("❌ 用法：/移出稀有度 <稀有度>\n💡 例如：/移出稀有度 1 （将所有1星鱼移回鱼塘）")
-        return
-    
-    try:
-        rarity = int(args[1])
-        if rarity < 1 or rarity > 10:
-            yield event.plain_result("❌ 稀有度必须在1-10之间")
-            return
-    except ValueError:
-        yield event.plain_result("❌ 稀有度必须是数字（1-10）")
-        return
-    
-    # 获取水族箱中该稀有度的所有鱼
-    aquarium_result = self.aquarium_service.get_user_aquarium(user_id)
-    if not aquarium_result.get("success"):
-        yield event.plain_result(f"❌ 获取水族箱信息失败")
+    args = event.message_str.split(" ", 2)
+    rarity, error = _parse_rarity_arg(args, "❌ 用法：/移出稀有度 <稀有度>\n💡 例如：/移出稀有度 1 （将所有1星鱼移回鱼塘）")
+    if error:
+        yield event.plain_result(error)
         return
     
-    fishes = aquarium_result.get("fishes", [])
-    target_fishes = [f for f in fishes if f.get("rarity") == rarity]
+    # 获取水族箱中该稀有度的所有鱼（稀有度过滤在数据库中完成）
+    fishes = await asyncio.to_thread(self.aquarium_service.get_user_fishes_by_rarity, user_id, rarity, in_aquarium=True)
     
-    if not target_fishes:
+    if not fishes:
         yield event.plain_result(f"❌ 水族箱中没有{rarity}星稀有度的鱼")
         return
     
-    # 批量移回鱼塘
-    total_moved = 0
-    high_quality_count = 0
-    success_count = 0
-    failed_items = []
-    
-    for fish in target_fishes:
-        fish_id = fish.get("fish_id")
-        quantity = fish.get("quantity", 0)
-        quality_level = fish.get("quality_level", 0)
-        
-        if quantity > 0:
-            result = self.aquarium_service.remove_fish_from_aquarium(user_id, fish_id, quantity, quality_level)
-            if result.get("success"):
-                total_moved += quantity
-                if quality_level == 1:
-                    high_quality_count += quantity
-                success_count += 1
-            else:
-                failed_items.append(f"{fish.get('name')}({result.get('message')})")
-    
-    # 构建结果消息
-    message = f"✅ 成功将 {success_count} 种{rarity}星鱼（共{total_moved}条）移回鱼塘"
-    if high_quality_count > 0:
-        message += f"\n✨ 其中包含 {high_quality_count} 条高品质鱼"
-    if failed_items:
-        message += f"\n\n⚠️ 以下鱼类移动失败：\n" + "\n".join(f"  - {item}" for item in failed_items[:5])
-        if len(failed_items) > 5:
-            message += f"\n  ... 还有{len(failed_items)-5}项"
-    
-    yield event.plain_result(message)
\ No newline at end of file
+    # 批量移回鱼塘（一次服务调用，单个事务）
+    # 查询结果已按稀有度和数量 > 0 过滤，直接转换为批量参数
+    items = [(fish["fish_id"], fish["quality_level"], fish["quantity"]) for fish in fishes]
+    result = await asyncio.to_thread(self.aquarium_service.remove_fishes_from_aquarium_batch, user_id, items)
+    if not result["success"]:
+        yield event.plain_result(f"❌ {result['message']}")
+        return
+
+    yield event.plain_result(_format_rarity_move(_REMOVE_RARITY_MSG, rarity, result, fishes))
\ No newline at end of file
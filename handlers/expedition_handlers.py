@@ -1,8 +1,105 @@
+import asyncio
+import re
 from astrbot.api import logger
 from astrbot.core.message.components import At
-from typing import Dict, Any
+from typing import Dict, Any, List
 from ..core.services.expedition_service import ExpeditionService
 
+# 原始消息中的 At 码（备用解析方案）
+_AT_RE = re.compile(r"\[CQ:at,qq=(\d+)\]")
+
+# 科考类型名称 -> 内部类型
+_EXP_TYPE_MAP = {"探险": "short", "征服": "medium", "圣域": "long"}
+
+_START_USAGE = (
+    "用法：/发起科考 <探险/征服/圣域> [@用户1 @用户2 ...]\n"
+    "示例：/发起科考 探险\n"
+    "示例：/发起科考 征服 @张三 @李四"
+)
+_TYPE_ERROR_MESSAGE = "科考类型错误，请选择：探险、征服或圣域"
+# 查看状态时触发的进度汇总在此间隔内合并为一次（出售时已增量更新，汇总只用于校正）
+_PROGRESS_MIN_INTERVAL = 5.0
+_NOT_IN_EXPEDITION_RESULT = {"success": False, "message": "你不在任何科考队伍中"}
+
+# 科考帮助文本为静态内容，模块加载时构建一次
+_EXPEDITION_HELP_TEXT = """🔬 科学考察系统帮助
+
+━━━━ 📋 科考类型 ━━━━
+🌊 探险（24小时）
+    ▸ 需要：探险许可证
+  ▸ 入场费：100万金币
+  ▸ 目标：1-3星各100条 | 4星50条 | 5星10条
+  ▸ 钻石奖池：1000钻石
+
+⚔️ 征服（48小时）
+    ▸ 需要：征服许可证
+  ▸ 入场费：500万金币
+  ▸ 目标：1-3星各500条 | 4星100条 | 5星50条
+  ▸ 钻石奖池：5000钻石
+
+👑 圣域（72小时）
+    ▸ 需要：圣域许可证
+  ▸ 入场费：1000万金币
+  ▸ 目标：1-3星各1000条 | 4星500条 | 5星100条
+  ▸ 钻石奖池：10000钻石
+
+━━━━ 🎮 参与规则 ━━━━
+▸ 发起者消耗对应许可证创建科考
+▸ 参与者支付金币入场费加入队伍
+▸ 每个玩家同时只能参与一个科考
+▸ 队长可提前结束科考进行结算
+▸ 到期后自动结算奖励
+
+━━━━ 🎯 科考目标 ━━━━
+▸ 系统随机选择5种鱼（1-5星各一种）
+▸ 队伍成员需要出售指定数量的目标鱼（出售时计入贡献）
+▸ 高星级鱼类目标数量较少，降低难度
+▸ 进度在出售目标鱼时实时更新
+
+━━━━ 💰 奖励分配 ━━━━
+【钻石奖励】按贡献比例分配
+  个人钻石 = 钻石奖池 × 完成度 × (个人贡献/总贡献)
+  
+【金币奖励】拼手气红包
+  奖池金额 = 参与人数 × 入场费 × 完成度
+  采用随机分配算法，手气拼人品！
+
+━━━━ ✨ 特殊事件 ━━━━
+当某个星级完成度达100%时，有概率特殊事件。
+
+━━━━ 📝 相关命令 ━━━━
+,发起科考 <探险/征服/圣域> [@用户]
+,加入科考 <邀请码>
+,退出科考
+,科考状态
+,结束科考（仅队长）
+,科考帮助
+
+━━━━ ⚠️ 注意事项 ━━━━
+▸ 队长不能中途退出，只能结束科考
+▸ 中途退出的成员不会获得奖励
+▸ 贡献会保留但无法获得结算奖励
+▸ 许可证可通过商店或抽奖获得
+▸ 入场费将进入奖池，完成度越高回报越高"""
+_EXPEDITION_HELP_RESULT = {"success": True, "message": _EXPEDITION_HELP_TEXT}
+
+
+def _extract_ats(message_obj, raw_message: str) -> List[str]:
+    """提取被@的用户ID：优先读取At组件，仅在没有组件列表时才用正则解析原始消息"""
+    # 首先尝试从message_obj中获取At组件（推荐方式）
+    if hasattr(message_obj, "message"):
+        # 排除机器人本身的id（未知时为 None，保留所有At）
+        self_id = getattr(message_obj, "self_id", None)
+        return [
+            str(comp.qq) for comp in message_obj.message
+            if isinstance(comp, At) and comp.qq != self_id
+        ]
+
+    # 组件列表不可用时，从原始消息中用正则提取（备用方案）
+    if "[CQ:at" not in raw_message:
+        return []
+    return _AT_RE.findall(raw_message)
+
 
 class ExpeditionHandlers:
     """科考命令处理器"""
@@ -17,56 +114,28 @@ class ExpeditionHandlers:
         """
         try:
             msg_text = event.message_str.strip()
-            parts = msg_text.split()
+            parts = msg_text.split(maxsplit=2)
             
             if len(parts) < 2:
-                return {
-                    "success": False,
-                    "message": "用法：/发起科考 <探险/征服/圣域> [@用户1 @用户2 ...]\n"
-                              "示例：/发起科考 探险\n"
-                              "示例：/发起科考 征服 @张三 @李四"
-                }
+                return {"success": False, "message": _START_USAGE}
             
             # 解析科考类型
-            type_map = {"探险": "short", "征服": "medium", "圣域": "long"}
-            exp_type_str = parts[1]
-            exp_type = type_map.get(exp_type_str)
+            exp_type = _EXP_TYPE_MAP.get(parts[1])
             
             if not exp_type:
-                return {
-                    "success": False,
-                    "message": "科考类型错误，请选择：探险、征服或圣域"
-                }
+                return {"success": False, "message": _TYPE_ERROR_MESSAGE}
             
             # 解析被邀请的用户（从At组件中提取）
-            invited_user_ids = []
-            message_obj = event.message_obj
-            
-            # 首先尝试从message_obj中获取At组件（推荐方式）
-            if hasattr(message_obj, "message"):
-                for comp in message_obj.message:
-                    if isinstance(comp, At):
-                        # 排除机器人本身的id
-                        if hasattr(message_obj, 'self_id') and comp.qq != message_obj.self_id:
-                            invited_user_ids.append(str(comp.qq))
-                        elif not hasattr(message_obj, 'self_id'):
-                            invited_user_ids.append(str(comp.qq))
-            
-            # 如果没有获取到，尝试从原始消息中用正则提取（备用方案）
-            if not invited_user_ids:
-                import re
-                raw_message = event.raw_message if hasattr(event, 'raw_message') else msg_text
-                at_pattern = r'\[CQ:at,qq=(\d+)\]'
-                matches = re.findall(at_pattern, raw_message)
-                if matches:
-                    invited_user_ids = matches
+            raw_message = event.raw_message if hasattr(event, 'raw_message') else msg_text
+            invited_user_ids = _extract_ats(event.message_obj, raw_message)
             
             if invited_user_ids:
                 logger.info(f"从消息中提取到被邀请用户: {invited_user_ids}")
             
             # 创建科考
             user_id = event.get_sender_id()
-            result = self.expedition_service.create_expedition(
+            result = await asyncio.to_thread(
+                self.expedition_service.create_expedition,
                 creator_id=user_id,
                 expedition_type=exp_type,
                 invited_users=invited_user_ids
@@ -85,7 +154,7 @@ class ExpeditionHandlers:
         """
         try:
             msg_text = event.message_str.strip()
-            parts = msg_text.split()
+            parts = msg_text.split(maxsplit=2)
             
             if len(parts) < 2:
                 return {
@@ -96,7 +165,7 @@ class ExpeditionHandlers:
             expedition_id = parts[1].strip()
             user_id = event.get_sender_id()
             
-            result = self.expedition_service.join_expedition(user_id, expedition_id)
+            result = await asyncio.to_thread(self.expedition_service.join_expedition, user_id, expedition_id)
             return result
             
         except Exception as e:
@@ -110,7 +179,9 @@ class ExpeditionHandlers:
         """
         try:
             user_id = event.get_sender_id()
-            result = self.expedition_service.leave_expedition(user_id)
+            if not self.expedition_service.is_user_in_expedition(user_id):
+                return _NOT_IN_EXPEDITION_RESULT
+            result = await asyncio.to_thread(self.expedition_service.leave_expedition, user_id)
             return result
             
         except Exception as e:
@@ -124,24 +195,32 @@ class ExpeditionHandlers:
         """
         try:
             user_id = event.get_sender_id()
-            
-            # 先更新当前科考的进度数据
-            current_exp = self.expedition_service.get_user_expedition(user_id)
-            if current_exp:
-                expedition_id = current_exp.get("expedition_id")
-                if expedition_id:
-                    try:
-                        self.expedition_service.update_expedition_progress(expedition_id)
-                    except Exception as update_error:
-                        logger.warning(f"更新科考进度失败: {update_error}")
-            
-            result = self.expedition_service.get_expedition_status(user_id)
+            result = await asyncio.to_thread(self._refresh_and_get_status, user_id)
             return result
             
         except Exception as e:
             logger.error(f"查看科考状态失败: {e}", exc_info=True)
             return {"success": False, "message": f"查看科考状态失败：{str(e)}"}
 
+    def _refresh_and_get_status(self, user_id: str) -> Dict[str, Any]:
+        """在工作线程中汇总当前科考进度并生成状态（两者都会等待科考锁与数据库）"""
+        # 先更新当前科考的进度数据（不在科考中的用户只需查看历史记录）
+        current_exp = None
+        if self.expedition_service.is_user_in_expedition(user_id):
+            current_exp = self.expedition_service.get_user_expedition(user_id)
+        if current_exp:
+            expedition_id = current_exp.get("expedition_id")
+            if expedition_id:
+                try:
+                    # 多名成员同时查看状态时，短时间内只汇总一次
+                    self.expedition_service.update_expedition_progress(
+                        expedition_id, min_interval=_PROGRESS_MIN_INTERVAL
+                    )
+                except Exception as update_error:
+                    logger.warning(f"更新科考进度失败: {update_error}")
+
+        return self.expedition_service.get_expedition_status(user_id)
+
     async def end_expedition(self, plugin, event) -> Dict[str, Any]:
         """
         结束科考（仅队长）
@@ -149,7 +228,9 @@ class ExpeditionHandlers:
         """
         try:
             user_id = event.get_sender_id()
-            result = self.expedition_service.end_expedition(user_id)
+            if not self.expedition_service.is_user_in_expedition(user_id):
+                return _NOT_IN_EXPEDITION_RESULT
+            result = await asyncio.to_thread(self.expedition_service.end_expedition, user_id)
             return result
             
         except Exception as e:
@@ -161,67 +242,7 @@ class ExpeditionHandlers:
         查看科考帮助
         命令：,科考帮助
         """
-        help_text = """🔬 科学考察系统帮助
-
-━━━━ 📋 科考类型 ━━━━
-🌊 探险（24小时）
-    ▸ 需要：探险许可证
-  ▸ 入场费：100万金币
-  ▸ 目标：1-3星各100条 | 4星50条 | 5星10条
-  ▸ 钻石奖池：1000钻石
-
-⚔️ 征服（48小时）
-    ▸ 需要：征服许可证
-  ▸ 入场费：500万金币
-  ▸ 目标：1-3星各500条 | 4星100条 | 5星50条
-  ▸ 钻石奖池：5000钻石
-
-👑 圣域（72小时）
-    ▸ 需要：圣域许可证
-  ▸ 入场费：1000万金币
-  ▸ 目标：1-3星各1000条 | 4星500条 | 5星100条
-  ▸ 钻石奖池：10000钻石
-
-━━━━ 🎮 参与规则 ━━━━
-▸ 发起者消耗对应许可证创建科考
-▸ 参与者支付金币入场费加入队伍
-▸ 每个玩家同时只能参与一个科考
-▸ 队长可提前结束科考进行结算
-▸ 到期后自动结算奖励
-
-━━━━ 🎯 科考目标 ━━━━
-▸ 系统随机选择5种鱼（1-5星各一种）
-▸ 队伍成员需要出售指定数量的目标鱼（出售时计入贡献）
-▸ 高星级鱼类目标数量较少，降低难度
-▸ 进度在出售目标鱼时实时更新
-
-━━━━ 💰 奖励分配 ━━━━
-【钻石奖励】按贡献比例分配
-  个人钻石 = 钻石奖池 × 完成度 × (个人贡献/总贡献)
-  
-【金币奖励】拼手气红包
-  奖池金额 = 参与人数 × 入场费 × 完成度
-  采用随机分配算法，手气拼人品！
-
-━━━━ ✨ 特殊事件 ━━━━
-当某个星级完成度达100%时，有概率特殊事件。
-
-━━━━ 📝 相关命令 ━━━━
-,发起科考 <探险/征服/圣域> [@用户]
-,加入科考 <邀请码>
-,退出科考
-,科考状态
-,结束科考（仅队长）
-,科考帮助
-
-━━━━ ⚠️ 注意事项 ━━━━
-▸ 队长不能中途退出，只能结束科考
-▸ 中途退出的成员不会获得奖励
-▸ 贡献会保留但无法获得结算奖励
-▸ 许可证可通过商店或抽奖获得
-▸ 入场费将进入奖池，完成度越高回报越高"""
-        
-        return {"success": True, "message": help_text}
+        return _EXPEDITION_HELP_RESULT
 
     async def test_expedition(self, plugin, event) -> Dict[str, Any]:
         """
@@ -229,7 +250,7 @@ class ExpeditionHandlers:
         命令：/测试科考
         """
         user_id = event.get_sender_id()
-        result = self.expedition_service.test_complete_expedition(user_id)
+        result = await asyncio.to_thread(self.expedition_service.test_complete_expedition, user_id)
         return result
 
 
@@ -20,6 +20,7 @@ from .core.repositories.sqlite_achievement_repo import SqliteAchievementReposito
 from .core.repositories.sqlite_user_buff_repo import SqliteUserBuffRepository
 from .core.repositories.sqlite_exchange_repo import SqliteExchangeRepository # 新增交易所Repo
 from .core.repositories.sqlite_red_packet_repo import SqliteRedPacketRepository # 新增红包Repo
+from .core.repositories.sqlite_expedition_repo import SqliteExpeditionRepository
 
 from .core.services.data_setup_service import DataSetupService
 from .core.services.item_template_service import ItemTemplateService
@@ -210,6 +211,7 @@ class FishingPlugin(Star):
         self.achievement_repo = SqliteAchievementRepository(db_path)
         self.buff_repo = SqliteUserBuffRepository(db_path)
         self.exchange_repo = SqliteExchangeRepository(db_path)
+        self.expedition_repo = SqliteExpeditionRepository(db_path)
 
         # --- 3. 组合根：实例化所有服务层，并注入依赖 ---
         # 3.1 核心服务必须在效果管理器之前实例化，以解决依赖问题
@@ -244,6 +246,7 @@ class FishingPlugin(Star):
             self.inventory_repo,
             self.item_template_repo,
             self.log_repo,
+            self.expedition_repo,
             self.game_config,
         )
         # 启动时为已存在的进行中科考安排一次性结算定时器
@@ -1374,6 +1377,8 @@ class FishingPlugin(Star):
         self.fishing_service.stop_daily_tax_task()  # 终止独立的税收线程
         self.achievement_service.stop_achievement_check_task()
         self.exchange_service.stop_daily_price_update_task() # 终止交易所后台任务
+        self.expedition_service.stop_settlement_scheduler()  # 终止科考自动结算线程
+        self.expedition_service.flush()  # 写入尚未落盘的科考数据并等待写盘线程完成
 
         # 取消红包清理任务
         if hasattr(self, '_red_packet_cleanup_task') and self._red_packet_cleanup_task:
@@ -4,10 +4,31 @@
 提供用户端WebUI所需的所有API端点
 """
 
-from quart import Blueprint, jsonify, current_app, request, session
+import asyncio
+import gzip
+import hashlib
+import hmac
+import itertools
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from quart import Blueprint, Response, g, jsonify, current_app, request, session
 import functools
 from astrbot.api import logger
 
+# orjson 为可选依赖：安装后序列化快数倍，未安装时回退到 Quart 的 jsonify
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# brotli 为可选依赖：未安装时仅使用 gzip 压缩
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
 
 user_api_bp = Blueprint(
     "user_api",
@@ -16,16 +37,252 @@ user_api_bp = Blueprint(
 )
 
 
+# 模板类数据（鱼类图鉴、商店列表）很少变化：缓存序列化后的响应体，过期后重建
+_STATIC_CACHE_TTL = 60
+# key -> (构建时间 time.monotonic(), 响应体, ETag)
+_static_cache: Dict[str, Tuple[float, bytes, str]] = {}
+
+# /info 响应缓存（LRU）：user_id -> (资料行, 响应体)；资料行未变化时直接复用序列化结果
+_INFO_CACHE_MAX_SIZE = 4096
+_info_cache: "OrderedDict[str, Tuple[Dict[str, Any], bytes]]" = OrderedDict()
+
+# 小于该字节数的响应不压缩，压缩收益抵不过开销
+_COMPRESS_MIN_SIZE = 1024
+
+# 背包列表分页：默认每页条数与上限
+_DEFAULT_PER_PAGE = 50
+_MAX_PER_PAGE = 200
+
+# API 访问令牌有效期（秒）；令牌以应用 secret_key 签名，重启后随密钥失效
+_TOKEN_TTL = 24 * 3600
+# user_id -> 令牌代数，参与签名；登出或密钥变更时换代，已签发的令牌随即失效。
+# secret_key 每次启动随机生成，重启后旧令牌本就无法通过校验，代数无需持久化
+_token_generations: Dict[str, int] = {}
+_next_generation = itertools.count(1)
+
+# 应用开始服务时从 app.config 一次性解析的服务/仓储实例，请求中不再查找配置
+_services: Dict[str, Any] = {}
+_SERVICE_KEYS = (
+    "USER_REPO", "INVENTORY_REPO", "USER_SERVICE", "FISHING_SERVICE",
+    "MARKET_SERVICE", "GACHA_SERVICE", "ITEM_TEMPLATE_SERVICE",
+)
+
+
+@user_api_bp.before_app_serving
+async def _bind_services():
+    """绑定当前应用的服务实例"""
+    _services.clear()
+    for key in _SERVICE_KEYS:
+        if key in current_app.config:
+            _services[key] = current_app.config[key]
+
+
+def _json_response(data) -> Response:
+    """将数据序列化为 JSON 响应"""
+    if orjson is None:
+        return jsonify(data)
+    return current_app.response_class(
+        orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS),
+        content_type="application/json",
+    )
+
+
+def _dumps(data) -> bytes:
+    """将数据序列化为 JSON 字节串"""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, ensure_ascii=False).encode("utf-8")
+
+
+# 固定文案的错误响应体，导入时序列化一次，错误路径直接复用
+_ERR_UNAUTHORIZED = _dumps({"success": False, "message": "未登录"})
+_ERR_CONFIG = _dumps({"success": False, "message": "系统配置错误"})
+_ERR_NO_USER = _dumps({"success": False, "message": "用户不存在"})
+_ERR_BAD_REQUEST = _dumps({"success": False, "message": "请求格式错误"})
+
+
+def _error_response(body: bytes, status: int) -> Response:
+    """返回预先序列化的错误响应"""
+    return current_app.response_class(body, status=status, content_type="application/json")
+
+
+async def _read_json_object() -> Dict[str, Any]:
+    """读取请求体并解析为 JSON 对象；空请求体视为 {}，格式不合法时抛出 ValueError"""
+    body = await request.get_data()
+    if not body:
+        return {}
+    data = orjson.loads(body) if orjson is not None else json.loads(body)
+    if not isinstance(data, dict):
+        raise ValueError("请求体必须是 JSON 对象")
+    return data
+
+
+async def _cached_json_response(key: str, build: Callable[[], Any]) -> Response:
+    """返回缓存的 JSON 响应；build 在工作线程中执行，客户端 ETag 未变化时返回 304"""
+    now = time.monotonic()
+    entry = _static_cache.get(key)
+    if entry is None or now - entry[0] >= _STATIC_CACHE_TTL:
+        body = _dumps(await asyncio.to_thread(build))
+        entry = (now, body, hashlib.md5(body).hexdigest())
+        _static_cache[key] = entry
+
+    _, body, etag = entry
+    if request.if_none_match.contains_weak(etag):
+        response = current_app.response_class("", status=304)
+        # 与同一请求的 200 响应一致：会被压缩的表示带弱 ETag
+        response.set_etag(etag, weak=len(body) > _COMPRESS_MIN_SIZE and _negotiate_encoding() is not None)
+        return response
+    response = current_app.response_class(body, content_type="application/json")
+    response.set_etag(etag)
+    return response
+
+
+def _negotiate_encoding() -> Optional[str]:
+    """按 Accept-Encoding 选择压缩方式，客户端不支持时返回 None"""
+    accept = request.headers.get("Accept-Encoding", "")
+    if brotli is not None and "br" in accept:
+        return "br"
+    if "gzip" in accept:
+        return "gzip"
+    return None
+
+
+@user_api_bp.after_request
+async def _compress_response(response: Response) -> Response:
+    """按 Accept-Encoding 对较大的 JSON 响应做 br/gzip 压缩"""
+    if (
+        response.status_code != 200
+        or "Content-Encoding" in response.headers
+        or not response.content_length
+        or response.content_length <= _COMPRESS_MIN_SIZE
+    ):
+        return response
+    encoding = _negotiate_encoding()
+    if encoding is None:
+        return response
+    data = await response.get_data()
+    if encoding == "br":
+        response.set_data(brotli.compress(data, quality=4))
+    else:
+        response.set_data(gzip.compress(data, compresslevel=6))
+    response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    # 强 ETag 只能对应唯一的字节表示，压缩后降为弱 ETag
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def _page_args() -> Tuple[int, int]:
+    """解析 page/per_page 查询参数"""
+    page = max(int(request.args.get("page", 1)), 1)
+    per_page = min(max(int(request.args.get("per_page", _DEFAULT_PER_PAGE)), 1), _MAX_PER_PAGE)
+    return page, per_page
+
+
+async def _inventory_page(inventory_repo, user_id: str, category: str) -> Tuple[List[Tuple], Dict[str, int]]:
+    """按请求的分页参数读取一页背包行；仅第一页返回 total，避免每页都 COUNT。
+    未传 page/per_page 时返回全部行，兼容一次取完整列表的页面与旧客户端"""
+    if "page" not in request.args and "per_page" not in request.args:
+        rows = await asyncio.to_thread(inventory_repo.get_inventory_rows, user_id, category, -1)
+        return rows, {"page": 1, "per_page": len(rows), "total": len(rows)}
+    page, per_page = _page_args()
+    rows = await asyncio.to_thread(
+        inventory_repo.get_inventory_rows, user_id, category, per_page, (page - 1) * per_page
+    )
+    pagination = {"page": page, "per_page": per_page}
+    if page == 1:
+        if len(rows) < per_page:
+            pagination["total"] = len(rows)
+        else:
+            counts = await asyncio.to_thread(inventory_repo.get_inventory_counts, user_id)
+            pagination["total"] = counts[category]
+    return rows, pagination
+
+
+def _profile_data(profile: Dict[str, Any]) -> Dict[str, Any]:
+    """将资料行转换为响应中的用户信息"""
+    created_at = profile["created_at"]
+    return {**profile, "created_at": created_at.isoformat() if created_at else None}
+
+
+def _backpack_data(counts: Dict[str, int]) -> Dict[str, int]:
+    """将背包条目数转换为响应中的背包信息"""
+    return {
+        "fish_count": counts["fish"],
+        "rod_count": counts["rod"],
+        "bait_count": counts["bait"],
+        "accessory_count": counts["accessory"],
+        "item_count": counts["item"],
+    }
+
+
+def _sign_token(payload: str) -> str:
+    """用应用 secret_key 对令牌内容做 HMAC-SHA256 签名"""
+    key = current_app.secret_key
+    if isinstance(key, str):
+        key = key.encode("utf-8")
+    return hmac.new(key, payload.encode("utf-8"), hashlib.sha256).hexdigest()
+
+
+def revoke_user_tokens(user_id: str) -> None:
+    """吊销用户已签发的全部访问令牌（登出、密钥变更时调用）"""
+    _token_generations[user_id] = next(_next_generation)
+
+
+def _issue_token(user_id: str) -> Tuple[str, int]:
+    """签发 "<user_id>.<过期时间戳>.<签名>" 形式的访问令牌，签名同时覆盖用户当前的令牌代数"""
+    expires_at = int(time.time()) + _TOKEN_TTL
+    payload = f"{user_id}.{expires_at}"
+    generation = _token_generations.get(user_id, 0)
+    return f"{payload}.{_sign_token(f'{payload}.{generation}')}", expires_at
+
+
+def _verify_token(token: str) -> Optional[str]:
+    """校验访问令牌，有效时返回 user_id；令牌签发后用户登出或更换密钥则校验失败"""
+    parts = token.rsplit(".", 2)
+    if len(parts) != 3 or not parts[1].isdigit() or int(parts[1]) < time.time():
+        return None
+    user_id, expires_at, signature = parts
+    generation = _token_generations.get(user_id, 0)
+    if not hmac.compare_digest(signature, _sign_token(f"{user_id}.{expires_at}.{generation}")):
+        return None
+    return user_id
+
+
 def api_login_required(f):
-    """API登录验证装饰器"""
+    """API登录验证装饰器：优先校验 Authorization: Bearer 令牌，否则读取会话；通过后 user_id 存于 g.user_id"""
     @functools.wraps(f)
     async def decorated_function(*args, **kwargs):
-        if "user_id" not in session:
-            return jsonify({"success": False, "message": "未登录"}), 401
+        auth = request.headers.get("Authorization", "")
+        if auth.startswith("Bearer "):
+            user_id = _verify_token(auth[7:])
+        else:
+            user_id = session.get("user_id")
+        if not user_id:
+            return _error_response(_ERR_UNAUTHORIZED, 401)
+        g.user_id = user_id
         return await f(*args, **kwargs)
     return decorated_function
 
 
+def requires(*keys: str):
+    """注入所需的服务/仓储实例（参数名为配置键的小写形式），缺失时统一返回配置错误"""
+    def decorator(f):
+        @functools.wraps(f)
+        async def decorated_function(*args, **kwargs):
+            for key in keys:
+                service = _services.get(key)
+                if service is None:
+                    logger.error(f"[WebUI] 配置错误: {key}未找到")
+                    return _error_response(_ERR_CONFIG, 500)
+                kwargs[key.lower()] = service
+            return await f(*args, **kwargs)
+        return decorated_function
+    return decorator
+
+
 @user_api_bp.route("/debug/status", methods=["GET"])
 async def debug_status():
     """调试端点：检查WebUI初始化状态和数据库连接"""
@@ -43,7 +300,7 @@ async def debug_status():
                 status["services"]["user_repo"] = type(user_repo).__name__
                 # 尝试查询数据库
                 try:
-                    test_result = user_repo.get_by_id("test_query")
+                    await asyncio.to_thread(user_repo.get_by_id, "test_query")
                     status["database_status"] = "connected"
                     status["database_query_works"] = True
                 except Exception as e:
@@ -70,415 +327,355 @@ async def debug_status():
         except:
             pass
         
-        return jsonify(status)
+        return _json_response(status)
     except Exception as e:
         logger.error(f"[WebUI] 调试端点错误: {e}")
-        return jsonify({"error": str(e)}), 500
+        return _json_response({"error": str(e)}), 500
+
+
+@user_api_bp.route("/token", methods=["POST"])
+async def issue_token():
+    """为已通过网页登录的用户签发 API 访问令牌（只接受会话登录，不能用令牌续签令牌）"""
+    user_id = session.get("user_id")
+    if not user_id:
+        return _error_response(_ERR_UNAUTHORIZED, 401)
+    token, expires_at = _issue_token(user_id)
+    return _json_response({"success": True, "data": {"token": token, "expires_at": expires_at}})
 
 
 @user_api_bp.route("/info", methods=["GET"])
 @api_login_required
-async def get_user_info():
+@requires("USER_REPO")
+async def get_user_info(user_repo):
     """获取当前登录用户信息"""
-    user_id = session.get("user_id")
-    
-    try:
-        user_repo = current_app.config["USER_REPO"]
-        logger.info(f"[WebUI] /info获取USER_REPO: {type(user_repo).__name__}")
-    except KeyError as e:
-        logger.error(f"[WebUI] 配置错误: USER_REPO未找到 - {e}")
-        return jsonify({"success": False, "message": "系统配置错误"}), 500
+    user_id = g.user_id
     
     try:
-        user = user_repo.get_by_id(user_id)
+        profile = await asyncio.to_thread(user_repo.get_profile_row, user_id)
         
-        if not user:
-            return jsonify({"success": False, "message": "用户不存在"}), 404
+        if not profile:
+            _info_cache.pop(user_id, None)
+            return _error_response(_ERR_NO_USER, 404)
         
-        logger.info(f"[WebUI] 用户信息查询成功: {user_id}")
+        cached = _info_cache.get(user_id)
+        if cached is not None and cached[0] == profile:
+            body = cached[1]
+        else:
+            body = _dumps({"success": True, "data": _profile_data(profile)})
+            _info_cache[user_id] = (profile, body)
+            if len(_info_cache) > _INFO_CACHE_MAX_SIZE:
+                _info_cache.popitem(last=False)
+        _info_cache.move_to_end(user_id)
         
-        return jsonify({
-            "success": True,
-            "data": {
-                "user_id": user.user_id,
-                "nickname": user.nickname,
-                "coins": user.coins,
-                "premium_currency": user.premium_currency,
-                "total_fishing_count": user.total_fishing_count,
-                "total_weight_caught": user.total_weight_caught,
-                "consecutive_login_days": user.consecutive_login_days,
-                "fish_pond_capacity": user.fish_pond_capacity,
-                "max_coins": user.max_coins,
-                "created_at": user.created_at.isoformat() if user.created_at else None,
-            }
-        })
+        logger.debug("[WebUI] 用户信息查询成功: %s", user_id)
+        
+        return current_app.response_class(body, content_type="application/json")
     except Exception as e:
         logger.error(f"获取用户信息失败: {e}", exc_info=True)
-        return jsonify({"success": False, "message": f"获取失败: {str(e)}"}), 500
+        return _json_response({"success": False, "message": f"获取失败: {str(e)}"}), 500
 
 
 @user_api_bp.route("/backpack", methods=["GET"])
 @api_login_required
-async def get_backpack():
+@requires("INVENTORY_REPO")
+async def get_backpack(inventory_repo):
     """获取背包信息（鱼、装备、道具等）"""
-    user_id = session.get("user_id")
+    user_id = g.user_id
     
     try:
-        inventory_repo = current_app.config["INVENTORY_REPO"]
-        logger.info(f"[WebUI] /backpack获取INVENTORY_REPO: {type(inventory_repo).__name__}")
-    except KeyError as e:
-        logger.error(f"[WebUI] 配置错误: INVENTORY_REPO未找到 - {e}")
-        return jsonify({"success": False, "message": "系统配置错误"}), 500
+        # 只需要各类物品的数量，一次查询统计，不取回列表
+        counts = await asyncio.to_thread(inventory_repo.get_inventory_counts, user_id)
+        
+        logger.debug("[WebUI] 背包查询成功 - %s", counts)
+        
+        return _json_response({
+            "success": True,
+            "data": _backpack_data(counts)
+        })
+    except Exception as e:
+        logger.error(f"获取背包信息失败: {e}", exc_info=True)
+        return _json_response({"success": False, "message": f"获取失败: {str(e)}"}), 500
+
+
+@user_api_bp.route("/dashboard", methods=["GET"])
+@api_login_required
+@requires("USER_REPO", "INVENTORY_REPO")
+async def get_dashboard(user_repo, inventory_repo):
+    """一次返回用户信息与背包信息（合并 /info 与 /backpack，减少页面加载时的请求数）"""
+    user_id = g.user_id
     
     try:
-        # 获取各类物品
-        fish = inventory_repo.get_fish_inventory(user_id)
-        rods = inventory_repo.get_user_rod_instances(user_id)
-        baits = inventory_repo.get_user_bait_inventory(user_id)
-        accessories = inventory_repo.get_user_accessory_instances(user_id)
-        items = inventory_repo.get_user_item_inventory(user_id)
+        # 两条查询互不依赖，在工作线程中并发执行
+        profile, counts = await asyncio.gather(
+            asyncio.to_thread(user_repo.get_profile_row, user_id),
+            asyncio.to_thread(inventory_repo.get_inventory_counts, user_id),
+        )
+        
+        if not profile:
+            return _error_response(_ERR_NO_USER, 404)
         
-        logger.info(f"[WebUI] 背包查询成功 - 鱼:{len(fish)}, 竿:{len(rods)}, 诱饵:{len(baits)}, 饰品:{len(accessories)}, 道具:{len(items)}")
+        logger.debug("[WebUI] 仪表盘查询成功: %s", user_id)
         
-        return jsonify({
+        return _json_response({
             "success": True,
             "data": {
-                "fish_count": len(fish) if fish else 0,
-                "rod_count": len(rods) if rods else 0,
-                "bait_count": len(baits) if baits else 0,
-                "accessory_count": len(accessories) if accessories else 0,
-                "item_count": len(items) if items else 0,
+                "user": _profile_data(profile),
+                "backpack": _backpack_data(counts),
             }
         })
     except Exception as e:
-        logger.error(f"获取背包信息失败: {e}", exc_info=True)
-        return jsonify({"success": False, "message": f"获取失败: {str(e)}"}), 500
+        logger.error(f"获取仪表盘信息失败: {e}", exc_info=True)
+        return _json_response({"success": False, "message": f"获取失败: {str(e)}"}), 500
 
 
 @user_api_bp.route("/fish", methods=["GET"])
 @api_login_required
-async def get_fish():
+@requires("INVENTORY_REPO")
+async def get_fish(inventory_repo):
     """获取用户的鱼塘中的鱼"""
-    user_id = session.get("user_id")
+    user_id = g.user_id
     
     try:
-        inventory_repo = current_app.config["INVENTORY_REPO"]
-        logger.info(f"[WebUI] /fish获取INVENTORY_REPO: {type(inventory_repo).__name__}")
-    except KeyError as e:
-        logger.error(f"[WebUI] 配置错误: INVENTORY_REPO未找到 - {e}")
-        return jsonify({"success": False, "message": "系统配置错误"}), 500
-    
-    try:
-        fish = inventory_repo.get_fish_inventory(user_id)
+        rows, pagination = await _inventory_page(inventory_repo, user_id, "fish")
         
-        fish_list = []
-        if fish:
-            for f in fish:
-                fish_list.append({
-                    "fish_id": f.fish_id,
-                    "quality_level": f.quality_level,
-                    "quantity": f.quantity,
-                })
+        fish_list = [
+            {"fish_id": fish_id, "quality_level": quality_level, "quantity": quantity}
+            for fish_id, quality_level, quantity in rows
+        ]
         
-        logger.info(f"[WebUI] 鱼列表查询成功: {len(fish_list)}条鱼")
+        logger.debug("[WebUI] 鱼列表查询成功: %d条鱼", len(fish_list))
         
-        return jsonify({
+        return _json_response({
             "success": True,
-            "data": fish_list
+            "data": fish_list,
+            "pagination": pagination
         })
     except Exception as e:
         logger.error(f"获取鱼列表失败: {e}", exc_info=True)
-        return jsonify({"success": False, "message": f"获取失败: {str(e)}"}), 500
+        return _json_response({"success": False, "message": f"获取失败: {str(e)}"}), 500
 
 
 @user_api_bp.route("/rods", methods=["GET"])
 @api_login_required
-async def get_rods():
+@requires("INVENTORY_REPO")
+async def get_rods(inventory_repo):
     """获取用户的鱼竿"""
-    user_id = session.get("user_id")
+    user_id = g.user_id
     
     try:
-        inventory_repo = current_app.config["INVENTORY_REPO"]
-        logger.info(f"[WebUI] /rods获取INVENTORY_REPO: {type(inventory_repo).__name__}")
-    except KeyError as e:
-        logger.error(f"[WebUI] 配置错误: INVENTORY_REPO未找到 - {e}")
-        return jsonify({"success": False, "message": "系统配置错误"}), 500
-    
-    try:
-        rods = inventory_repo.get_user_rod_instances(user_id)
-        
-        rod_list = []
-        if rods:
-            for r in rods:
-                rod_list.append({
-                    "rod_id": r.rod_id,
-                    "durability": r.durability if hasattr(r, 'durability') else 0,
-                })
+        rows, pagination = await _inventory_page(inventory_repo, user_id, "rod")
+        
+        rod_list = [{"rod_id": rod_id, "durability": durability} for rod_id, durability in rows]
         
-        logger.info(f"[WebUI] 鱼竿列表查询成功: {len(rod_list)}根鱼竿")
+        logger.debug("[WebUI] 鱼竿列表查询成功: %d根鱼竿", len(rod_list))
         
-        return jsonify({
+        return _json_response({
             "success": True,
-            "data": rod_list
+            "data": rod_list,
+            "pagination": pagination
         })
     except Exception as e:
         logger.error(f"获取鱼竿列表失败: {e}", exc_info=True)
-        return jsonify({"success": False, "message": f"获取失败: {str(e)}"}), 500
+        return _json_response({"success": False, "message": f"获取失败: {str(e)}"}), 500
 
 
 @user_api_bp.route("/baits", methods=["GET"])
 @api_login_required
-async def get_baits():
+@requires("INVENTORY_REPO")
+async def get_baits(inventory_repo):
     """获取用户的鱼饵"""
-    user_id = session.get("user_id")
-    
-    try:
-        inventory_repo = current_app.config["INVENTORY_REPO"]
-        logger.info(f"[WebUI] /baits获取INVENTORY_REPO: {type(inventory_repo).__name__}")
-    except KeyError as e:
-        logger.error(f"[WebUI] 配置错误: INVENTORY_REPO未找到 - {e}")
-        return jsonify({"success": False, "message": "系统配置错误"}), 500
+    user_id = g.user_id
     
     try:
-        baits = inventory_repo.get_user_bait_inventory(user_id)
-        
-        bait_list = []
-        if baits:
-            for b in baits:
-                bait_list.append({
-                    "bait_id": b.bait_id,
-                    "quantity": b.quantity,
-                })
+        rows, pagination = await _inventory_page(inventory_repo, user_id, "bait")
         
-        logger.info(f"[WebUI] 鱼饵列表查询成功: {len(bait_list)}种鱼饵")
+        bait_list = [{"bait_id": bait_id, "quantity": quantity} for bait_id, quantity in rows]
         
-        return jsonify({
+        logger.debug("[WebUI] 鱼饵列表查询成功: %d种鱼饵", len(bait_list))
+        
+        return _json_response({
             "success": True,
-            "data": bait_list
+            "data": bait_list,
+            "pagination": pagination
         })
     except Exception as e:
         logger.error(f"获取鱼饵列表失败: {e}", exc_info=True)
-        return jsonify({"success": False, "message": f"获取失败: {str(e)}"}), 500
+        return _json_response({"success": False, "message": f"获取失败: {str(e)}"}), 500
 
 
 @user_api_bp.route("/accessories", methods=["GET"])
 @api_login_required
-async def get_accessories():
+@requires("INVENTORY_REPO")
+async def get_accessories(inventory_repo):
     """获取用户的饰品"""
-    user_id = session.get("user_id")
-    
-    try:
-        inventory_repo = current_app.config["INVENTORY_REPO"]
-        logger.info(f"[WebUI] /accessories获取INVENTORY_REPO: {type(inventory_repo).__name__}")
-    except KeyError as e:
-        logger.error(f"[WebUI] 配置错误: INVENTORY_REPO未找到 - {e}")
-        return jsonify({"success": False, "message": "系统配置错误"}), 500
+    user_id = g.user_id
     
     try:
-        accessories = inventory_repo.get_user_accessory_instances(user_id)
-        
-        acc_list = []
-        if accessories:
-            for a in accessories:
-                acc_list.append({
-                    "accessory_id": a.accessory_id,
-                    "durability": a.durability if hasattr(a, 'durability') else 0,
-                })
+        rows, pagination = await _inventory_page(inventory_repo, user_id, "accessory")
+        
+        # 饰品没有耐久度，保留字段以兼容前端
+        acc_list = [{"accessory_id": accessory_id, "durability": 0} for (accessory_id,) in rows]
         
-        logger.info(f"[WebUI] 饰品列表查询成功: {len(acc_list)}个饰品")
+        logger.debug("[WebUI] 饰品列表查询成功: %d个饰品", len(acc_list))
         
-        return jsonify({
+        return _json_response({
             "success": True,
-            "data": acc_list
+            "data": acc_list,
+            "pagination": pagination
         })
     except Exception as e:
         logger.error(f"获取饰品列表失败: {e}", exc_info=True)
-        return jsonify({"success": False, "message": f"获取失败: {str(e)}"}), 500
+        return _json_response({"success": False, "message": f"获取失败: {str(e)}"}), 500
 
 
 @user_api_bp.route("/items", methods=["GET"])
 @api_login_required
-async def get_items():
+@requires("INVENTORY_REPO")
+async def get_items(inventory_repo):
     """获取用户的道具"""
-    user_id = session.get("user_id")
+    user_id = g.user_id
     
     try:
-        inventory_repo = current_app.config["INVENTORY_REPO"]
-        logger.info(f"[WebUI] /items获取INVENTORY_REPO: {type(inventory_repo).__name__}")
-    except KeyError as e:
-        logger.error(f"[WebUI] 配置错误: INVENTORY_REPO未找到 - {e}")
-        return jsonify({"success": False, "message": "系统配置错误"}), 500
-    
-    try:
-        items = inventory_repo.get_user_item_inventory(user_id)
-        
-        item_list = []
-        if items:
-            for i in items:
-                item_list.append({
-                    "item_id": i.item_id,
-                    "quantity": i.quantity,
-                })
+        rows, pagination = await _inventory_page(inventory_repo, user_id, "item")
         
-        logger.info(f"[WebUI] 道具列表查询成功: {len(item_list)}种道具")
+        item_list = [{"item_id": item_id, "quantity": quantity} for item_id, quantity in rows]
         
-        return jsonify({
+        logger.debug("[WebUI] 道具列表查询成功: %d种道具", len(item_list))
+        
+        return _json_response({
             "success": True,
-            "data": item_list
+            "data": item_list,
+            "pagination": pagination
         })
     except Exception as e:
         logger.error(f"获取道具列表失败: {e}", exc_info=True)
-        return jsonify({"success": False, "message": f"获取失败: {str(e)}"}), 500
+        return _json_response({"success": False, "message": f"获取失败: {str(e)}"}), 500
 
 
 
 @user_api_bp.route("/fishing/do", methods=["POST"])
 @api_login_required
-async def do_fishing():
+@requires("USER_REPO", "FISHING_SERVICE")
+async def do_fishing(user_repo, fishing_service):
     """执行钓鱼操作"""
-    user_id = session.get("user_id")
-    
-    try:
-        user_repo = current_app.config["USER_REPO"]
-        logger.info(f"[WebUI] /fishing/do获取USER_REPO: {type(user_repo).__name__}")
-    except KeyError as e:
-        logger.error(f"[WebUI] 配置错误: USER_REPO未找到 - {e}")
-        return jsonify({"success": False, "message": "系统配置错误"}), 500
-    
-    try:
-        fishing_service = current_app.config["FISHING_SERVICE"]
-        logger.info(f"[WebUI] /fishing/do获取FISHING_SERVICE: {type(fishing_service).__name__}")
-    except KeyError as e:
-        logger.error(f"[WebUI] 配置错误: FISHING_SERVICE未找到 - {e}")
-        return jsonify({"success": False, "message": "系统配置错误"}), 500
+    user_id = g.user_id
     
     try:
-        user = user_repo.get_by_id(user_id)
+        user = await asyncio.to_thread(user_repo.get_by_id, user_id)
         if not user:
-            return jsonify({"success": False, "message": "用户不存在"}), 404
+            return _error_response(_ERR_NO_USER, 404)
         
         # 执行钓鱼
-        result = fishing_service.fish(user_id, None)  # None表示使用当前区域
+        result = await asyncio.to_thread(fishing_service.fish, user_id, None)  # None表示使用当前区域
         
         logger.info(f"[WebUI] 钓鱼执行成功: {user_id}")
         
-        return jsonify({
+        return _json_response({
             "success": result.get("success", False),
             "message": result.get("message", "钓鱼失败"),
             "data": result.get("data")
         })
     except Exception as e:
         logger.error(f"钓鱼失败: {e}", exc_info=True)
-        return jsonify({"success": False, "message": f"钓鱼失败: {str(e)}"}), 500
+        return _json_response({"success": False, "message": f"钓鱼失败: {str(e)}"}), 500
 
 
 @user_api_bp.route("/sign-in", methods=["POST"])
 @api_login_required
-async def sign_in():
+@requires("USER_SERVICE")
+async def sign_in(user_service):
     """用户签到"""
-    user_id = session.get("user_id")
-    
-    try:
-        user_service = current_app.config["USER_SERVICE"]
-        logger.info(f"[WebUI] /sign-in获取USER_SERVICE: {type(user_service).__name__}")
-    except KeyError as e:
-        logger.error(f"[WebUI] 配置错误: USER_SERVICE未找到 - {e}")
-        return jsonify({"success": False, "message": "系统配置错误"}), 500
+    user_id = g.user_id
     
     try:
-        result = user_service.sign_in(user_id)
+        result = await asyncio.to_thread(user_service.sign_in, user_id)
         
         logger.info(f"[WebUI] 签到成功: {user_id}")
         
-        return jsonify({
+        return _json_response({
             "success": result.get("success", False),
             "message": result.get("message", "签到失败")
         })
     except Exception as e:
         logger.error(f"签到失败: {e}", exc_info=True)
-        return jsonify({"success": False, "message": f"签到失败: {str(e)}"}), 500
+        return _json_response({"success": False, "message": f"签到失败: {str(e)}"}), 500
 
 
 @user_api_bp.route("/market/list", methods=["GET"])
 @api_login_required
-async def get_market_listings():
+@requires("MARKET_SERVICE")
+async def get_market_listings(market_service):
     """获取市场列表"""
-    try:
-        market_service = current_app.config["MARKET_SERVICE"]
-        logger.info(f"[WebUI] /market/list获取MARKET_SERVICE: {type(market_service).__name__}")
-    except KeyError as e:
-        logger.error(f"[WebUI] 配置错误: MARKET_SERVICE未找到 - {e}")
-        return jsonify({"success": False, "message": "系统配置错误"}), 500
-    
     try:
         page = int(request.args.get("page", 1))
-        per_page = int(request.args.get("per_page", 20))
+        per_page = min(int(request.args.get("per_page", 20)), _MAX_PER_PAGE)
         item_type = request.args.get("item_type")
         min_price = request.args.get("min_price")
         max_price = request.args.get("max_price")
+        cursor = request.args.get("cursor")
         
         min_price = int(min_price) if min_price else None
         max_price = int(max_price) if max_price else None
         
-        result = market_service.get_all_market_listings_for_admin(
-            page=page,
-            per_page=per_page,
-            item_type=item_type,
-            min_price=min_price,
-            max_price=max_price
-        )
-        
-        logger.info(f"[WebUI] 市场列表查询成功")
-        
-        return jsonify({
+        if cursor is not None:
+            # 游标分页：cursor 为空表示第一页，之后传回上一页的 next_cursor
+            result = await asyncio.to_thread(
+                market_service.get_market_listings_page,
+                cursor=int(cursor) if cursor else None,
+                per_page=per_page,
+                item_type=item_type,
+                min_price=min_price,
+                max_price=max_price
+            )
+        else:
+            result = await asyncio.to_thread(
+                market_service.get_market_listings_by_page,
+                page=page,
+                per_page=per_page,
+                item_type=item_type,
+                min_price=min_price,
+                max_price=max_price
+            )
+        
+        logger.debug("[WebUI] 市场列表查询成功")
+        
+        return _json_response({
             "success": result.get("success", False),
             "data": result.get("listings", []),
             "pagination": result.get("pagination", {})
         })
     except Exception as e:
         logger.error(f"获取市场列表失败: {e}", exc_info=True)
-        return jsonify({"success": False, "message": f"获取失败: {str(e)}"}), 500
+        return _json_response({"success": False, "message": f"获取失败: {str(e)}"}), 500
 
 
 @user_api_bp.route("/market/list/<int:listing_id>", methods=["POST"])
 @api_login_required
-async def purchase_listing(listing_id):
+@requires("MARKET_SERVICE")
+async def purchase_listing(listing_id, market_service):
     """购买市场商品"""
-    user_id = session.get("user_id")
-    
-    try:
-        market_service = current_app.config["MARKET_SERVICE"]
-        logger.info(f"[WebUI] /market/list/<id>获取MARKET_SERVICE: {type(market_service).__name__}")
-    except KeyError as e:
-        logger.error(f"[WebUI] 配置错误: MARKET_SERVICE未找到 - {e}")
-        return jsonify({"success": False, "message": "系统配置错误"}), 500
+    user_id = g.user_id
     
     try:
-        result = market_service.purchase_item(user_id, listing_id)
+        result = await asyncio.to_thread(market_service.purchase_item, user_id, listing_id)
         
         logger.info(f"[WebUI] 购买成功: {user_id} -> {listing_id}")
         
-        return jsonify({
+        return _json_response({
             "success": result.get("success", False),
             "message": result.get("message", "购买失败")
         })
     except Exception as e:
         logger.error(f"购买失败: {e}", exc_info=True)
-        return jsonify({"success": False, "message": f"购买失败: {str(e)}"}), 500
+        return _json_response({"success": False, "message": f"购买失败: {str(e)}"}), 500
 
 
 @user_api_bp.route("/shop/list", methods=["GET"])
 @api_login_required
-async def get_shops():
+@requires("ITEM_TEMPLATE_SERVICE")
+async def get_shops(item_template_service):
     """获取商店列表"""
-    try:
-        item_template_service = current_app.config["ITEM_TEMPLATE_SERVICE"]
-        logger.info(f"[WebUI] /shop/list获取ITEM_TEMPLATE_SERVICE: {type(item_template_service).__name__}")
-    except KeyError as e:
-        logger.error(f"[WebUI] 配置错误: ITEM_TEMPLATE_SERVICE未找到 - {e}")
-        return jsonify({"success": False, "message": "系统配置错误"}), 500
-    
-    try:
+    def build():
         shops = item_template_service.get_all_shops()
         
         shop_list = []
@@ -491,126 +688,114 @@ async def get_shops():
                     "shop_type": shop.shop_type,
                 })
         
-        logger.info(f"[WebUI] 商店列表查询成功: {len(shop_list)}个商店")
+        logger.debug("[WebUI] 商店列表查询成功: %d个商店", len(shop_list))
         
-        return jsonify({
+        return {
             "success": True,
             "data": shop_list
-        })
+        }
+
+    try:
+        return await _cached_json_response("shop_list", build)
     except Exception as e:
         logger.error(f"获取商店列表失败: {e}", exc_info=True)
-        return jsonify({"success": False, "message": f"获取失败: {str(e)}"}), 500
+        return _json_response({"success": False, "message": f"获取失败: {str(e)}"}), 500
 
 
 @user_api_bp.route("/gacha/do", methods=["POST"])
 @api_login_required
-async def do_gacha():
+@requires("GACHA_SERVICE")
+async def do_gacha(gacha_service):
     """执行抽卡"""
-    user_id = session.get("user_id")
-    
-    try:
-        gacha_service = current_app.config["GACHA_SERVICE"]
-        logger.info(f"[WebUI] /gacha/do获取GACHA_SERVICE: {type(gacha_service).__name__}")
-    except KeyError as e:
-        logger.error(f"[WebUI] 配置错误: GACHA_SERVICE未找到 - {e}")
-        return jsonify({"success": False, "message": "系统配置错误"}), 500
+    user_id = g.user_id
     
     try:
-        form = await request.json
+        try:
+            form = await _read_json_object()
+        except ValueError:
+            return _error_response(_ERR_BAD_REQUEST, 400)
         gacha_type = form.get("type", "single")  # single or ten
         
         if gacha_type == "ten":
-            result = gacha_service.ten_gacha(user_id)
+            result = await asyncio.to_thread(gacha_service.ten_gacha, user_id)
         else:
-            result = gacha_service.single_gacha(user_id)
+            result = await asyncio.to_thread(gacha_service.single_gacha, user_id)
         
         logger.info(f"[WebUI] 抽卡成功: {user_id} ({gacha_type})")
         
-        return jsonify({
+        return _json_response({
             "success": result.get("success", False),
             "message": result.get("message", "抽卡失败"),
             "data": result.get("data")
         })
     except Exception as e:
         logger.error(f"抽卡失败: {e}", exc_info=True)
-        return jsonify({"success": False, "message": f"抽卡失败: {str(e)}"}), 500
+        return _json_response({"success": False, "message": f"抽卡失败: {str(e)}"}), 500
 
 
 @user_api_bp.route("/leaderboard", methods=["GET"])
 @api_login_required
-async def get_leaderboard():
+@requires("USER_SERVICE")
+async def get_leaderboard(user_service):
     """获取排行榜"""
-    try:
-        user_service = current_app.config["USER_SERVICE"]
-        logger.info(f"[WebUI] /leaderboard获取USER_SERVICE: {type(user_service).__name__}")
-    except KeyError as e:
-        logger.error(f"[WebUI] 配置错误: USER_SERVICE未找到 - {e}")
-        return jsonify({"success": False, "message": "系统配置错误"}), 500
-    
     try:
         sort_by = request.args.get("sort_by", "coins")
         limit = int(request.args.get("limit", 10))
         
-        result = user_service.get_leaderboard_data(sort_by=sort_by, limit=limit)
+        result = await asyncio.to_thread(user_service.get_leaderboard_data, sort_by=sort_by, limit=limit)
         
-        logger.info(f"[WebUI] 排行榜查询成功: {sort_by}")
+        logger.debug("[WebUI] 排行榜查询成功: %s", sort_by)
         
-        return jsonify({
+        return _json_response({
             "success": result.get("success", False),
             "data": result.get("leaderboard", [])
         })
     except Exception as e:
         logger.error(f"获取排行榜失败: {e}", exc_info=True)
-        return jsonify({"success": False, "message": f"获取失败: {str(e)}"}), 500
+        return _json_response({"success": False, "message": f"获取失败: {str(e)}"}), 500
 
 
 @user_api_bp.route("/profile/update", methods=["POST"])
 @api_login_required
-async def update_profile():
+@requires("USER_REPO")
+async def update_profile(user_repo):
     """更新用户信息"""
-    user_id = session.get("user_id")
-    
-    try:
-        user_repo = current_app.config["USER_REPO"]
-        logger.info(f"[WebUI] /profile/update获取USER_REPO: {type(user_repo).__name__}")
-    except KeyError as e:
-        logger.error(f"[WebUI] 配置错误: USER_REPO未找到 - {e}")
-        return jsonify({"success": False, "message": "系统配置错误"}), 500
+    user_id = g.user_id
     
     try:
-        form = await request.json
-        nickname = form.get("nickname", "").strip()
-        
-        if not nickname or len(nickname) < 2 or len(nickname) > 20:
-            return jsonify({"success": False, "message": "昵称长度必须为2-20个字符"})
-        
-        user = user_repo.get_by_id(user_id)
+        try:
+            form = await _read_json_object()
+        except ValueError:
+            return _error_response(_ERR_BAD_REQUEST, 400)
+        nickname = form.get("nickname", "")
+        if not isinstance(nickname, str):
+            return _json_response({"success": False, "message": "昵称必须是字符串"}), 400
+        nickname = nickname.strip()
+        
+        if not 2 <= len(nickname) <= 20:
+            return _json_response({"success": False, "message": "昵称长度必须为2-20个字符"})
+        
+        user = await asyncio.to_thread(user_repo.get_by_id, user_id)
         if user:
             user.nickname = nickname
-            user_repo.update(user)
+            await asyncio.to_thread(user_repo.update, user)
             
             logger.info(f"[WebUI] 用户信息更新成功: {user_id}")
             
-            return jsonify({"success": True, "message": "昵称更新成功"})
+            return _json_response({"success": True, "message": "昵称更新成功"})
         
-        return jsonify({"success": False, "message": "用户不存在"})
+        return _error_response(_ERR_NO_USER, 200)
     except Exception as e:
         logger.error(f"更新用户信息失败: {e}", exc_info=True)
-        return jsonify({"success": False, "message": f"更新失败: {str(e)}"}), 500
+        return _json_response({"success": False, "message": f"更新失败: {str(e)}"}), 500
 
 
 @user_api_bp.route("/fish-templates", methods=["GET"])
 @api_login_required
-async def get_fish_templates():
+@requires("ITEM_TEMPLATE_SERVICE")
+async def get_fish_templates(item_template_service):
     """获取所有鱼类模板（用于图鉴）"""
-    try:
-        item_template_service = current_app.config["ITEM_TEMPLATE_SERVICE"]
-        logger.info(f"[WebUI] /fish-templates获取ITEM_TEMPLATE_SERVICE: {type(item_template_service).__name__}")
-    except KeyError as e:
-        logger.error(f"[WebUI] 配置错误: ITEM_TEMPLATE_SERVICE未找到 - {e}")
-        return jsonify({"success": False, "message": "系统配置错误"}), 500
-    
-    try:
+    def build():
         fish_templates = item_template_service.get_all_fish_templates()
         
         fish_list = []
@@ -626,12 +811,15 @@ async def get_fish_templates():
                     "zones": fish.zones or "",
                 })
         
-        logger.info(f"[WebUI] 鱼类模板查询成功: {len(fish_list)}条")
+        logger.debug("[WebUI] 鱼类模板查询成功: %d条", len(fish_list))
         
-        return jsonify({
+        return {
             "success": True,
             "data": fish_list
-        })
+        }
+
+    try:
+        return await _cached_json_response("fish_templates", build)
     except Exception as e:
         logger.error(f"获取鱼类模板失败: {e}", exc_info=True)
-        return jsonify({"success": False, "message": f"获取失败: {str(e)}"}), 500
+        return _json_response({"success": False, "message": f"获取失败: {str(e)}"}), 500
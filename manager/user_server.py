@@ -2,8 +2,12 @@ import functools
 import os
 import traceback
 import hashlib
+import hmac
 import json
-from typing import Dict, Any
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
 from datetime import datetime, timedelta
 import asyncio
 
@@ -13,8 +17,16 @@ from quart import (
 )
 from astrbot.api import logger
 
+# argon2-cffi 为可选依赖：安装后使用 Argon2id，未安装时使用标准库的 scrypt
+try:
+    from argon2 import PasswordHasher
+    from argon2.exceptions import InvalidHashError, VerificationError
+    _password_hasher = PasswordHasher(time_cost=2, memory_cost=65536, parallelism=1)
+except ImportError:
+    _password_hasher = None
+
 # 导入用户API蓝图
-from .user_api import user_api_bp
+from .user_api import revoke_user_tokens, user_api_bp
 
 
 user_bp = Blueprint(
@@ -89,7 +101,7 @@ def user_context(f):
             return redirect(url_for("user_bp.login"))
         
         try:
-            user = user_repo.get_by_id(user_id)
+            user = await asyncio.to_thread(user_repo.get_by_id, user_id)
             logger.info(f"[WebUI] 查询用户成功: {user is not None}")
         except Exception as e:
             logger.error(f"[WebUI] 查询用户失败: {e}")
@@ -106,9 +118,70 @@ def user_context(f):
     return decorated_function
 
 
+# scrypt 参数（约 16MB 内存）
+_SCRYPT_N, _SCRYPT_R, _SCRYPT_P = 2 ** 14, 8, 1
+
+# 近期校验成功的结果：(qq, 存储的哈希, 输入密钥的SHA256) -> 写入时间；存储的哈希变化后自然失效
+_verify_cache: "OrderedDict[Tuple[str, str, str], float]" = OrderedDict()
+_verify_cache_lock = threading.Lock()
+_VERIFY_CACHE_TTL = 600
+_VERIFY_CACHE_MAX_SIZE = 1024
+
+
 def hash_password(password: str) -> str:
-    """哈希密码"""
-    return hashlib.sha256(password.encode()).hexdigest()
+    """用加盐的内存困难 KDF 哈希密钥，返回包含算法、参数和盐的编码字符串"""
+    if _password_hasher is not None:
+        return _password_hasher.hash(password)
+    salt = os.urandom(16)
+    digest = hashlib.scrypt(password.encode(), salt=salt, n=_SCRYPT_N, r=_SCRYPT_R, p=_SCRYPT_P)
+    return f"$scrypt${_SCRYPT_N}${_SCRYPT_R}${_SCRYPT_P}${salt.hex()}${digest.hex()}"
+
+
+def _check_password(stored_hash: str, password: str) -> bool:
+    """按存储格式校验密钥（常数时间比较）"""
+    if stored_hash.startswith("$argon2"):
+        if _password_hasher is None:
+            logger.error("密钥以 Argon2 格式存储，但未安装 argon2-cffi，无法校验")
+            return False
+        try:
+            return _password_hasher.verify(stored_hash, password)
+        except (VerificationError, InvalidHashError):
+            return False
+    if stored_hash.startswith("$scrypt$"):
+        try:
+            _, _, n, r, p, salt, digest = stored_hash.split("$")
+            candidate = hashlib.scrypt(password.encode(), salt=bytes.fromhex(salt), n=int(n), r=int(r), p=int(p))
+        except ValueError:
+            return False
+        return hmac.compare_digest(candidate.hex(), digest)
+    # 旧格式：无盐的 SHA256 十六进制摘要
+    return hmac.compare_digest(hashlib.sha256(password.encode()).hexdigest(), stored_hash)
+
+
+def password_needs_rehash(stored_hash: str) -> bool:
+    """存储的哈希是否应升级为当前算法/参数"""
+    if _password_hasher is not None:
+        return not stored_hash.startswith("$argon2") or _password_hasher.check_needs_rehash(stored_hash)
+    return not stored_hash.startswith(("$scrypt$", "$argon2"))
+
+
+def verify_password(qq: str, stored_hash: str, password: str) -> bool:
+    """校验密钥；短时间内重复登录命中缓存时跳过 KDF 计算"""
+    key = (qq, stored_hash, hashlib.sha256(password.encode()).hexdigest())
+    with _verify_cache_lock:
+        ts = _verify_cache.get(key)
+        if ts is not None and time.monotonic() - ts < _VERIFY_CACHE_TTL:
+            return True
+
+    if not _check_password(stored_hash, password):
+        return False
+
+    with _verify_cache_lock:
+        _verify_cache[key] = time.monotonic()
+        _verify_cache.move_to_end(key)
+        if len(_verify_cache) > _VERIFY_CACHE_MAX_SIZE:
+            _verify_cache.popitem(last=False)
+    return True
 
 
 @user_bp.route("/login", methods=["GET", "POST"])
@@ -129,7 +202,7 @@ async def login():
         try:
             user_repo = current_app.config["USER_REPO"]
             logger.info(f"[WebUI] 已获取USER_REPO: {type(user_repo).__name__}")
-            user = user_repo.get_by_id(qq)
+            user = await asyncio.to_thread(user_repo.get_by_id, qq)
             logger.info(f"[WebUI] 数据库查询结果: user={user is not None}")
         except KeyError as e:
             logger.error(f"[WebUI] 配置错误: {e}")
@@ -166,11 +239,12 @@ async def login():
                     return await render_template("user_login.html")
                 
                 try:
-                    hashed_key = hash_password(secret_key)
-                    save_user_secret_hash(qq, hashed_key)
+                    hashed_key = await asyncio.to_thread(hash_password, secret_key)
+                    if not await asyncio.to_thread(save_user_secret_hash, qq, hashed_key, True):
+                        await flash("❌ 该账户已设置过密钥，请输入密钥登录", "danger")
+                        return await render_template("user_login.html")
                     
                     session["user_id"] = qq
-                    session["secret_hash"] = hashed_key
                     session["logged_in"] = True
                     
                     await flash("✅ 欢迎！密钥已设置，你已成功登录", "success")
@@ -186,11 +260,13 @@ async def login():
                 return await render_template("user_login.html")
             
             try:
-                input_hash = hash_password(secret_key)
-                
-                if stored_hash == input_hash:
+                if await asyncio.to_thread(verify_password, qq, stored_hash, secret_key):
+                    if password_needs_rehash(stored_hash):
+                        # 旧的无盐 SHA256 或过时参数：登录成功时用当前算法重新哈希
+                        new_hash = await asyncio.to_thread(hash_password, secret_key)
+                        # 仅当存储的仍是本次校验的哈希时替换，避免覆盖并发重置的新密钥
+                        await asyncio.to_thread(save_user_secret_hash, qq, new_hash, expected=stored_hash)
                     session["user_id"] = qq
-                    session["secret_hash"] = input_hash
                     session["logged_in"] = True
                     await flash("✅ 登录成功！", "success")
                     return redirect(url_for("user_bp.dashboard"))
@@ -214,7 +290,7 @@ async def setup_key():
         return redirect(url_for("user_bp.login"))
     
     user_repo = current_app.config["USER_REPO"]
-    user = user_repo.get_by_id(qq)
+    user = await asyncio.to_thread(user_repo.get_by_id, qq)
     
     # 验证qq是否真的存在于数据库
     if not user:
@@ -247,11 +323,13 @@ async def setup_key():
                 return redirect(url_for("user_bp.login"))
             
             # 保存密钥哈希
-            hashed_key = hash_password(secret_key)
-            save_user_secret_hash(qq, hashed_key)
+            hashed_key = await asyncio.to_thread(hash_password, secret_key)
+            if not await asyncio.to_thread(save_user_secret_hash, qq, hashed_key, True):
+                await flash("❌ 该账户已设置过密钥，请直接登录", "danger")
+                session.pop("temp_qq", None)
+                return redirect(url_for("user_bp.login"))
             
             session["user_id"] = qq
-            session["secret_hash"] = hashed_key
             session["logged_in"] = True
             session.pop("temp_qq", None)
             
@@ -268,6 +346,9 @@ async def setup_key():
 @user_bp.route("/logout")
 async def logout():
     """登出"""
+    user_id = session.get("user_id")
+    if user_id:
+        revoke_user_tokens(user_id)
     session.clear()
     await flash("你已成功登出", "info")
     return redirect(url_for("user_bp.login"))
@@ -387,12 +468,20 @@ async def sign_in(user):
     return jsonify({"success": False, "message": "功能开发中"})
 
 
-# 密钥存储方案（使用JSON文件持久化 + 内存缓存）
+# 密钥存储方案（JSON快照 + 追加写日志持久化 + 内存缓存）
+# 每次修改只向 user_secrets.log 追加一行记录；日志远大于快照时重写快照并清空日志
 _user_secrets = {}
 _secrets_file_path = None
+# 写入在工作线程中执行（请求处理中经 asyncio.to_thread 调用），用锁串行化内存修改与日志追加
+_secrets_lock = threading.Lock()
+_secrets_log = None  # 追加写日志的文件句柄，首次写入时打开
+_secrets_unsynced = 0  # 上次 fsync 之后追加的记录数
+_SECRETS_FSYNC_EVERY = 16
+_SECRETS_COMPACT_RATIO = 4
+_SECRETS_COMPACT_MIN_SIZE = 64 * 1024
 
 def _get_secrets_file_path() -> str:
-    """获取密钥文件路径"""
+    """获取密钥快照文件路径"""
     global _secrets_file_path
     if _secrets_file_path is None:
         # 在数据目录下创建user_secrets.json
@@ -403,45 +492,125 @@ def _get_secrets_file_path() -> str:
     return _secrets_file_path
 
 
+def _get_secrets_log_path() -> str:
+    """获取密钥追加写日志路径"""
+    return os.path.splitext(_get_secrets_file_path())[0] + ".log"
+
+
 def _load_secrets_from_file():
-    """从文件加载密钥"""
+    """从快照加载密钥，再按顺序重放追加写日志"""
     global _user_secrets
     file_path = _get_secrets_file_path()
+    _user_secrets = {}
     if os.path.exists(file_path):
         try:
             with open(file_path, 'r', encoding='utf-8') as f:
                 _user_secrets = json.load(f)
-                logger.info(f"已加载 {len(_user_secrets)} 个用户密钥")
         except Exception as e:
             logger.error(f"加载密钥文件失败: {e}")
             _user_secrets = {}
-    else:
-        _user_secrets = {}
+
+    log_path = _get_secrets_log_path()
+    if os.path.exists(log_path):
+        try:
+            with open(log_path, 'rb+') as f:
+                data = f.read()
+                # 崩溃时可能留下写了一半的最后一行：截掉，避免后续追加的记录与其粘连
+                complete = data.rfind(b"\n") + 1
+                if complete < len(data):
+                    f.truncate(complete)
+            for line in data[:complete].splitlines():
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if record.get("op") == "del":
+                    _user_secrets.pop(record["qq"], None)
+                else:
+                    _user_secrets[record["qq"]] = record["h"]
+        except Exception as e:
+            logger.error(f"重放密钥日志失败: {e}")
+    logger.info(f"已加载 {len(_user_secrets)} 个用户密钥")
 
 
 def _save_secrets_to_file():
-    """将密钥保存到文件"""
+    """将全部密钥写成快照（先写临时文件再原子替换）"""
     file_path = _get_secrets_file_path()
     try:
         os.makedirs(os.path.dirname(file_path), exist_ok=True)
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(_user_secrets, f, ensure_ascii=False, indent=2)
+        tmp_path = file_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(_user_secrets, f, ensure_ascii=False, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, file_path)
     except Exception as e:
         logger.error(f"保存密钥文件失败: {e}")
+        return False
+    return True
+
+
+def _compact_secrets_if_needed():
+    """日志大小超过快照的若干倍时重写快照并清空日志"""
+    global _secrets_log, _secrets_unsynced
+    log_size = _secrets_log.tell()
+    if log_size < _SECRETS_COMPACT_MIN_SIZE:
+        return
+    file_path = _get_secrets_file_path()
+    snapshot_size = os.path.getsize(file_path) if os.path.exists(file_path) else 0
+    if log_size <= _SECRETS_COMPACT_RATIO * snapshot_size:
+        return
+    # 快照落盘成功后才清空日志；两步之间崩溃时重放旧日志结果不变
+    if _save_secrets_to_file():
+        _secrets_log.close()
+        _secrets_log = open(_get_secrets_log_path(), 'wb')
+        _secrets_unsynced = 0
+
+
+def _append_secret_record(qq: str, op: str, hash_value: str = None):
+    """向追加写日志写入一条记录，每 _SECRETS_FSYNC_EVERY 条 fsync 一次"""
+    global _secrets_log, _secrets_unsynced
+    record = {"qq": qq, "op": op, "ts": int(datetime.now().timestamp())}
+    if hash_value is not None:
+        record["h"] = hash_value
+    try:
+        if _secrets_log is None:
+            os.makedirs(os.path.dirname(_get_secrets_file_path()), exist_ok=True)
+            _secrets_log = open(_get_secrets_log_path(), 'ab')
+        _secrets_log.write(json.dumps(record, separators=(",", ":")).encode("utf-8") + b"\n")
+        _secrets_log.flush()
+        _secrets_unsynced += 1
+        if _secrets_unsynced >= _SECRETS_FSYNC_EVERY:
+            os.fsync(_secrets_log.fileno())
+            _secrets_unsynced = 0
+        _compact_secrets_if_needed()
+    except Exception as e:
+        logger.error(f"写入密钥日志失败: {e}")
 
 
-def save_user_secret_hash(qq: str, hash_value: str):
+def save_user_secret_hash(qq: str, hash_value: str, only_if_absent: bool = False,
+                          expected: Optional[str] = None) -> bool:
     """
     保存用户密钥哈希（持久化到文件）
     
     Args:
         qq: 用户QQ号
-        hash_value: 密钥的SHA256哈希值
+        hash_value: hash_password 生成的密钥哈希
+        only_if_absent: 为True时仅在该用户尚未设置密钥时保存（检查与写入在同一把锁内完成）
+        expected: 不为None时仅在当前存储的哈希等于该值时保存（同样在锁内比较）
+        
+    Returns:
+        是否已保存
     """
-    global _user_secrets
-    _user_secrets[qq] = hash_value
-    _save_secrets_to_file()
+    with _secrets_lock:
+        if only_if_absent and qq in _user_secrets:
+            return False
+        if expected is not None and _user_secrets.get(qq) != expected:
+            return False
+        _user_secrets[qq] = hash_value
+        _append_secret_record(qq, "set", hash_value)
     logger.info(f"已保存用户 {qq} 的密钥哈希")
+    return True
 
 
 def get_user_secret_hash(qq: str) -> str:
@@ -465,11 +634,13 @@ def delete_user_secret_hash(qq: str):
     Args:
         qq: 用户QQ号
     """
-    global _user_secrets
-    if qq in _user_secrets:
+    with _secrets_lock:
+        if qq not in _user_secrets:
+            return
         del _user_secrets[qq]
-        _save_secrets_to_file()
-        logger.info(f"已删除用户 {qq} 的密钥哈希")
+        _append_secret_record(qq, "del")
+    revoke_user_tokens(qq)
+    logger.info(f"已删除用户 {qq} 的密钥哈希")
 
 
 # 初始化时加载密钥
@@ -1759,13 +1759,13 @@ async def exchange():
     exchange_service = current_app.config.get("EXCHANGE_SERVICE")
     user_repo = current_app.config.get("USER_REPO")
     
-    # 检查是否开通账户
-    account_check = exchange_service.check_exchange_account(user_id)
-    has_account = account_check.get("success", False)
-    
     # 获取用户信息用于显示金币
     user = user_repo.get_by_id(user_id)
     
+    # 检查是否开通账户（复用已加载的用户，避免重复查询）
+    account_check = exchange_service.check_exchange_account(user_id, user)
+    has_account = account_check.get("success", False)
+    
     # 获取开户费用
     account_fee = exchange_service.config.get("account_fee", 100000)
     
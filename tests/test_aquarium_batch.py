@@ -0,0 +1,181 @@
+from __future__ import annotations
+
+import sqlite3
+import sys
+import types
+from datetime import datetime
+
+# Provide a lightweight astrbot.api.logger stub for unit tests.
+class _DummyLogger:
+    def info(self, *args, **kwargs):
+        pass
+
+    def error(self, *args, **kwargs):
+        pass
+
+    def warning(self, *args, **kwargs):
+        pass
+
+    def debug(self, *args, **kwargs):
+        pass
+
+
+if "astrbot.api" not in sys.modules:
+    astrbot_module = types.ModuleType("astrbot")
+    api_module = types.ModuleType("astrbot.api")
+    api_module.logger = _DummyLogger()
+    astrbot_module.api = api_module
+    sys.modules["astrbot"] = astrbot_module
+    sys.modules["astrbot.api"] = api_module
+
+from core.domain.models import Fish, User
+from core.repositories.sqlite_inventory_repo import SqliteInventoryRepository
+from core.services.aquarium_service import AquariumService
+
+
+class FakeUserRepo:
+    def __init__(self, user: User):
+        self._user = user
+
+    def get_by_id(self, user_id: str) -> User | None:
+        return self._user if self._user.user_id == user_id else None
+
+
+class FakeItemTemplateRepo:
+    def __init__(self, *fishes: Fish):
+        self._fishes = {fish.fish_id: fish for fish in fishes}
+
+    def get_fishes_by_ids(self, fish_ids: list[int]) -> dict[int, Fish]:
+        return {fid: self._fishes[fid] for fid in fish_ids if fid in self._fishes}
+
+
+def _fish(fish_id: int) -> Fish:
+    return Fish(fish_id=fish_id, name=f"鱼{fish_id}", rarity=3, base_value=10, min_weight=1, max_weight=2)
+
+
+def _build_service(tmp_path, capacity: int = 50):
+    db_path = str(tmp_path / "fish.db")
+    conn = sqlite3.connect(db_path)
+    conn.executescript("""
+        CREATE TABLE user_fish_inventory (
+            user_id TEXT NOT NULL, fish_id INTEGER NOT NULL,
+            quality_level INTEGER DEFAULT 0, quantity INTEGER DEFAULT 0 CHECK (quantity >= 0),
+            no_sell_until DATETIME,
+            PRIMARY KEY (user_id, fish_id, quality_level)
+        );
+        CREATE TABLE user_aquarium (
+            user_id TEXT NOT NULL, fish_id INTEGER NOT NULL,
+            quality_level INTEGER DEFAULT 0, quantity INTEGER DEFAULT 0 CHECK (quantity >= 0),
+            added_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_id, fish_id, quality_level)
+        );
+        CREATE TABLE fish (fish_id INTEGER PRIMARY KEY, rarity INTEGER, base_value INTEGER);
+        INSERT INTO fish VALUES (1, 3, 10), (2, 3, 10), (3, 1, 5);
+    """)
+    conn.close()
+    inventory_repo = SqliteInventoryRepository(db_path)
+    user = User(user_id="u1", created_at=datetime.now(), nickname="tester", aquarium_capacity=capacity)
+    service = AquariumService(inventory_repo, FakeUserRepo(user), FakeItemTemplateRepo(_fish(1), _fish(2), _fish(3)))
+    return service, inventory_repo
+
+
+def _counts(items) -> dict[tuple[int, int], int]:
+    return {(item.fish_id, item.quality_level): item.quantity for item in items}
+
+
+def test_batch_add_moves_all_fish_in_one_call(tmp_path):
+    service, repo = _build_service(tmp_path)
+    repo.add_fishes_to_inventory("u1", {1: 3, 2: 2})
+    repo.add_fish_to_inventory("u1", 1, 1, quality_level=1)
+
+    result = service.add_fishes_to_aquarium_batch("u1", [(1, 0, 3), (2, 0, 2), (1, 1, 1)])
+
+    assert result["moved"] == 6
+    assert result["hq_count"] == 1
+    assert result["success_count"] == 3
+    assert result["failed"] == []
+    assert repo.get_fish_inventory("u1") == []
+    assert _counts(repo.get_aquarium_inventory("u1")) == {(1, 0): 3, (2, 0): 2, (1, 1): 1}
+
+
+def test_batch_add_reports_capacity_and_missing_fish(tmp_path):
+    service, repo = _build_service(tmp_path, capacity=3)
+    repo.add_fishes_to_inventory("u1", {1: 3, 2: 2})
+
+    result = service.add_fishes_to_aquarium_batch("u1", [(1, 0, 3), (2, 0, 2), (9, 0, 1)])
+
+    assert result["moved"] == 3
+    assert [(fid, reason.startswith("水族箱容量不足")) for fid, _, reason in result["failed"]] == [(2, True), (9, False)]
+    assert _counts(repo.get_fish_inventory("u1")) == {(2, 0): 2}
+
+
+def test_batch_remove_returns_fish_to_pond(tmp_path):
+    service, repo = _build_service(tmp_path)
+    repo.add_fish_to_aquarium("u1", 1, 4)
+
+    result = service.remove_fishes_from_aquarium_batch("u1", [(1, 0, 4), (2, 0, 1)])
+
+    assert result["moved"] == 4
+    assert [fid for fid, _, _ in result["failed"]] == [2]
+    assert repo.get_aquarium_inventory("u1") == []
+    assert _counts(repo.get_fish_inventory("u1")) == {(1, 0): 4}
+
+
+def test_get_user_aquarium_cache_invalidated_by_moves(tmp_path):
+    service, repo = _build_service(tmp_path)
+    repo.add_fishes_to_inventory("u1", {1: 2})
+
+    assert service.get_user_aquarium("u1")["fishes"] == []
+    repo.add_fish_to_aquarium("u1", 2, 1)  # 绕过服务的写入在 TTL 内不可见
+    assert service.get_user_aquarium("u1")["fishes"] == []
+
+    service.add_fishes_to_aquarium_batch("u1", [(1, 0, 2)])
+    result = service.get_user_aquarium("u1")
+
+    assert _counts(repo.get_aquarium_inventory("u1")) == {(1, 0): 2, (2, 0): 1}
+    assert sorted((fish["fish_id"], fish["quantity"]) for fish in result["fishes"]) == [(1, 2), (2, 1)]
+    assert result["stats"]["total_count"] == 3
+
+
+def test_get_user_fishes_by_rarity_filters_in_sql(tmp_path):
+    service, repo = _build_service(tmp_path)
+    repo.add_fishes_to_inventory("u1", {1: 2, 3: 5})
+    repo.add_fish_to_aquarium("u1", 2, 1)
+
+    pond = service.get_user_fishes_by_rarity("u1", 3)
+    aquarium = service.get_user_fishes_by_rarity("u1", 3, in_aquarium=True)
+
+    assert [(fish["fish_id"], fish["quantity"]) for fish in pond] == [(1, 2)]
+    assert [(fish["fish_id"], fish["name"]) for fish in aquarium] == [(2, "鱼2")]
+    assert service.get_user_fishes_by_rarity("u1", 5) == []
+
+
+def test_get_inventory_rows_pages_fish_in_sql(tmp_path):
+    _, repo = _build_service(tmp_path)
+    repo.add_fishes_to_inventory("u1", {1: 2, 3: 5})
+    repo.add_fish_to_inventory("u1", 1, 1, quality_level=1)
+
+    assert repo.get_inventory_rows("u1", "fish", 2) == [(1, 0, 2), (1, 1, 1)]
+    assert repo.get_inventory_rows("u1", "fish", 2, offset=2) == [(3, 0, 5)]
+    assert repo.get_inventory_rows("u1", "fish", -1) == [(1, 0, 2), (1, 1, 1), (3, 0, 5)]
+
+
+def test_batch_moves_fail_cleanly_when_fish_change_after_validation(tmp_path):
+    service, repo = _build_service(tmp_path)
+    repo.add_fishes_to_inventory("u1", {1: 3, 2: 2})
+    repo.add_fish_to_aquarium("u1", 3, 2)
+    stale_pond, stale_aquarium = repo.get_fish_inventory("u1"), repo.get_aquarium_inventory("u1")
+    # 模拟校验读取之后、写入之前库存被其他请求消耗
+    repo.update_fish_quantity("u1", 2, -1)
+    repo.update_aquarium_fish_quantity("u1", 3, -1)
+    repo.get_fish_inventory = lambda user_id: stale_pond
+    repo.get_aquarium_inventory = lambda user_id: stale_aquarium
+
+    added = service.add_fishes_to_aquarium_batch("u1", [(1, 0, 3), (2, 0, 2)])
+    removed = service.remove_fishes_from_aquarium_batch("u1", [(3, 0, 2)])
+
+    assert added["success"] is False and "鱼塘" in added["message"]
+    assert removed["success"] is False and "水族箱" in removed["message"]
+    del repo.get_fish_inventory, repo.get_aquarium_inventory
+    assert _counts(repo.get_fish_inventory("u1")) == {(1, 0): 3, (2, 0): 1}
+    assert _counts(repo.get_aquarium_inventory("u1")) == {(3, 0): 1}
@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+import sys
+import types
+from datetime import datetime
+
+# Provide a lightweight astrbot.api.logger stub for unit tests.
+class _DummyLogger:
+    def info(self, *args, **kwargs):
+        pass
+
+    def error(self, *args, **kwargs):
+        pass
+
+    def warning(self, *args, **kwargs):
+        pass
+
+    def debug(self, *args, **kwargs):
+        pass
+
+
+if "astrbot.api" not in sys.modules:
+    astrbot_module = types.ModuleType("astrbot")
+    api_module = types.ModuleType("astrbot.api")
+    api_module.logger = _DummyLogger()
+    astrbot_module.api = api_module
+    sys.modules["astrbot"] = astrbot_module
+    sys.modules["astrbot.api"] = api_module
+
+from core.domain.models import User
+from core.repositories.abstract_repository import RepoNotFound
+from core.services.exchange_account_service import ExchangeAccountService
+
+
+class FakeUserRepo:
+    def __init__(self, *users: User):
+        self._users = {user.user_id: user for user in users}
+        self.get_calls = 0
+
+    def get_by_id(self, user_id: str) -> User | None:
+        self.get_calls += 1
+        return self._users.get(user_id)
+
+    def try_open_exchange_account(self, user_id: str, fee: int) -> tuple[str, int]:
+        user = self._users.get(user_id)
+        if user is None:
+            raise RepoNotFound(user_id)
+        if user.exchange_account_status:
+            return "already", user.coins
+        if user.coins < fee:
+            return "poor", user.coins
+        user.coins -= fee
+        user.exchange_account_status = True
+        return "ok", user.coins
+
+
+def _build_user(user_id: str = "user-1", coins: int = 0, opened: bool = False) -> User:
+    return User(
+        user_id=user_id,
+        created_at=datetime.now(),
+        nickname="tester",
+        coins=coins,
+        exchange_account_status=opened,
+    )
+
+
+def test_open_exchange_account_deducts_fee_once():
+    repo = FakeUserRepo(_build_user(coins=150_000))
+    service = ExchangeAccountService(repo, {"account_fee": 100_000})
+
+    first = service.open_exchange_account("user-1")
+    second = service.open_exchange_account("user-1")
+
+    assert first["success"]
+    assert "100,000" in first["message"]
+    assert not second["success"]
+    assert repo.get_by_id("user-1").coins == 50_000
+
+
+def test_open_exchange_account_reports_balance_when_poor():
+    service = ExchangeAccountService(FakeUserRepo(_build_user(coins=1_234)), {"account_fee": 100_000})
+
+    result = service.open_exchange_account("user-1")
+
+    assert not result["success"]
+    assert "1,234" in result["message"]
+
+
+def test_open_exchange_account_missing_user():
+    service = ExchangeAccountService(FakeUserRepo())
+
+    assert service.open_exchange_account("ghost") == {"success": False, "message": "用户不存在"}
+
+
+def test_check_exchange_account_skips_repo_for_known_unopened_user():
+    repo = FakeUserRepo(_build_user(coins=0))
+    service = ExchangeAccountService(repo)
+
+    assert not service.check_exchange_account("user-1")["success"]
+    calls = repo.get_calls
+    assert not service.check_exchange_account("user-1")["success"]
+    assert repo.get_calls == calls
+
+
+def test_check_exchange_account_sees_newly_opened_account():
+    repo = FakeUserRepo(_build_user(coins=200_000))
+    service = ExchangeAccountService(repo, {"account_fee": 100_000})
+
+    assert not service.check_exchange_account("user-1")["success"]
+    assert service.open_exchange_account("user-1")["success"]
+    assert service.check_exchange_account("user-1")["success"]
+
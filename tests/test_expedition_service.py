@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+import json
+import sqlite3
+import sys
+import types
+from datetime import datetime
+
+# Provide a lightweight astrbot.api.logger stub for unit tests.
+class _DummyLogger:
+    def info(self, *args, **kwargs):
+        pass
+
+    def error(self, *args, **kwargs):
+        pass
+
+    def warning(self, *args, **kwargs):
+        pass
+
+    def debug(self, *args, **kwargs):
+        pass
+
+
+if "astrbot.api" not in sys.modules:
+    astrbot_module = types.ModuleType("astrbot")
+    api_module = types.ModuleType("astrbot.api")
+    api_module.logger = _DummyLogger()
+    astrbot_module.api = api_module
+    sys.modules["astrbot"] = astrbot_module
+    sys.modules["astrbot.api"] = api_module
+
+from core.domain.models import User
+from core.repositories.sqlite_expedition_repo import SqliteExpeditionRepository
+from core.services.expedition_service import ExpeditionService
+
+
+class FakeUserRepo:
+    def __init__(self, *users: User):
+        self._users = {user.user_id: user for user in users}
+
+    def get_by_ids(self, user_ids: list[str]) -> dict[str, User]:
+        return {uid: self._users[uid] for uid in user_ids if uid in self._users}
+
+
+def _expedition(expedition_id: str = "EXP1") -> dict:
+    targets = {
+        f"{rarity}_star": {"fish_id": rarity, "fish_name": f"鱼{rarity}", "rarity": rarity, "required": 10, "caught": 0}
+        for rarity in range(1, 6)
+    }
+    return {
+        "expedition_id": expedition_id,
+        "type": "short",
+        "creator_id": "u1",
+        "end_ts": 0,
+        "join_cost": 1000,
+        "targets": targets,
+        "participants": {
+            "u1": {"user_id": "u1", "nickname": "队长", "contribution": {"1_star": 3}},
+            "u2": {"user_id": "u2", "nickname": "队员", "contribution": {"2_star": 1}},
+        },
+        "total_progress": 0.0,
+        "status": "active",
+    }
+
+
+def _build_service(tmp_path, expedition: dict):
+    db_path = str(tmp_path / "fish.db")
+    conn = sqlite3.connect(db_path)
+    conn.executescript("""
+        CREATE TABLE users (
+            user_id TEXT PRIMARY KEY, coins INTEGER DEFAULT 0,
+            premium_currency INTEGER DEFAULT 0, max_coins INTEGER DEFAULT 0
+        );
+        CREATE TABLE expeditions (
+            expedition_id TEXT PRIMARY KEY, status TEXT NOT NULL DEFAULT 'active',
+            end_ts INTEGER, data TEXT NOT NULL, updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        INSERT INTO users VALUES ('u1', 100, 0, 100), ('u2', 0, 0, 0);
+    """)
+    conn.execute(
+        "INSERT INTO expeditions (expedition_id, status, end_ts, data) VALUES (?, 'active', 0, ?)",
+        (expedition["expedition_id"], json.dumps(expedition)),
+    )
+    conn.commit()
+    conn.close()
+    return db_path, _open_service(tmp_path, db_path)
+
+
+def _open_service(tmp_path, db_path: str) -> ExpeditionService:
+    users = [User(user_id=uid, created_at=datetime.now(), nickname=uid) for uid in ("u1", "u2")]
+    service = ExpeditionService(
+        FakeUserRepo(*users), None, None, None, SqliteExpeditionRepository(db_path), {}
+    )
+    service.data_dir = str(tmp_path)
+    service.expeditions_file = str(tmp_path / "active_expeditions.json")
+    service.expeditions_dir = str(tmp_path / "active_expeditions")
+    service.history_file = str(tmp_path / "expedition_history.json")
+    service.history_log_file = str(tmp_path / "expedition_history.jsonl")
+    return service
+
+
+def _balances(db_path: str) -> dict[str, tuple[int, int, int]]:
+    conn = sqlite3.connect(db_path)
+    try:
+        rows = conn.execute("SELECT user_id, coins, premium_currency, max_coins FROM users").fetchall()
+        return {row[0]: row[1:] for row in rows}
+    finally:
+        conn.close()
+
+
+def test_settlement_writes_rewards_and_ended_row_together(tmp_path):
+    db_path, service = _build_service(tmp_path, _expedition())
+
+    result = service._settle_expedition("EXP1")
+
+    # 不等待写库线程：奖励与已结束状态在返回前已一起落库
+    conn = sqlite3.connect(db_path)
+    status = conn.execute("SELECT status FROM expeditions WHERE expedition_id = 'EXP1'").fetchone()[0]
+    conn.close()
+    balances = _balances(db_path)
+    assert result["success"] and status == "ended"
+    assert balances["u1"][0] + balances["u2"][0] == 100 + 2000
+    assert balances["u1"][0] == balances["u1"][2]
+    assert {uid: reward["premium"] for uid, reward in result["rewards"].items()} == {
+        uid: balances[uid][1] for uid in ("u1", "u2")
+    }
+
+    # 模拟重启：从数据库重新加载后不会再次发放奖励
+    restarted = _open_service(tmp_path, db_path)
+    assert restarted.expedition_repo.get_active_end_times() == []
+    assert restarted._settle_expedition("EXP1")["success"]
+    assert _balances(db_path) == balances